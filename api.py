@@ -1,27 +1,259 @@
-from fastapi import FastAPI, HTTPException
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 from library import Library, Book
-import json
+from openlibrary import OpenLibraryClient
+from cache import MetadataCache
+import codec
+import hashlib
+import metrics
 import os
+import secrets
+import threading
+import time
+
+# Where the catalog and the Open Library response cache live; a filename ending
+# in .db uses SQLite and one ending in .snap a memory-mapped binary snapshot
+DEFAULT_DATA_PATH = "library_data.json"
+DEFAULT_CACHE_PATH = "openlibrary_cache.db"
+
+# Set up by the lifespan handler, once per worker process
+library = None
+metadata_cache = None
+openlibrary = None
+# Set once the catalog is loaded and its indexes are warm (see /ready)
+warmed_up = threading.Event()
+# A shared library's ETags are a hash of its position on disk (see
+# Library.version_and_position), which every worker that caught up with the
+# same changes agrees on. Otherwise they are "<etag_prefix>-<library.version>",
+# with a prefix new for every library so tags from an earlier run never match.
+etag_prefix = None
+# Serialized read responses for the current library and version: key -> (body, headers),
+# at most RESPONSE_CACHE_SIZE of them and RESPONSE_CACHE_BYTES in all. A larger
+# body (e.g. GET /books for a big catalog) is never cached.
+response_cache = OrderedDict()
+response_cache_version = None
+response_cache_bytes = 0
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+# Optional views and the endpoints they serve. Each costs memory in every
+# worker (at 200k books about 50 MB for columns, 75 MB for search and 100 MB
+# for fuzzy), so only those listed in LIBRARY_VIEWS, e.g. "search,fuzzy", are built
+VIEWS = {"columns": "/stats/advanced", "search": "/search", "fuzzy": "/search/fuzzy"}
+enabled_views = frozenset()
+
+def views_from_env() -> frozenset:
+    views = frozenset(view.strip() for view in os.environ.get("LIBRARY_VIEWS", "").split(",") if view.strip())
+    unknown = views - VIEWS.keys()
+    if unknown:
+        raise ValueError(f"Unknown LIBRARY_VIEWS entries: {', '.join(sorted(unknown))} (known: {', '.join(VIEWS)})")
+    return views
+
+def enable_views(library: Library, views):
+    """Turn on the columnar, search and fuzzy views named in views"""
+    if "columns" in views:
+        library.enable_columns()
+    if "search" in views:
+        library.enable_search()
+    if "fuzzy" in views:
+        library.enable_fuzzy_search()
+
+def view_enabled(view: str):
+    """Dependency for endpoints served by an optional view: 404 unless LIBRARY_VIEWS names it"""
+    def check():
+        if view not in enabled_views:
+            raise HTTPException(status_code=404, detail=f"{VIEWS[view]} is not enabled on this server (LIBRARY_VIEWS={view})")
+    return check
+
+def prewarm(library: Library, done: threading.Event, views=frozenset()):
+    """Build everything the first requests would otherwise pay for, once loading has finished"""
+    try:
+        library.wait_until_loaded()
+        # Already filled while a JSON catalog loaded; built here for a mapped .snap catalog
+        enable_views(library, views)
+        library.books_page(limit=1)
+        library.publisher_counts()
+    except Exception as e:
+        print(f"Error warming up the library: {e}")
+    finally:
+        done.set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global library, metadata_cache, openlibrary, etag_prefix, enabled_views
+    enabled_views = views_from_env()
+    # Shared Open Library client with a keep-alive connection pool and on-disk response cache
+    metadata_cache = MetadataCache(os.environ.get("OPENLIBRARY_CACHE", DEFAULT_CACHE_PATH))
+    openlibrary = OpenLibraryClient(cache=metadata_cache)
+
+    # Shared so several API worker processes (uvicorn --workers N) can serve and change the same catalog safely.
+    # Setting LIBRARY_FLUSH_INTERVAL_MS switches to write-behind instead, which needs a single worker
+    flush_interval_ms = os.environ.get("LIBRARY_FLUSH_INTERVAL_MS")
+    write_behind = flush_interval_ms is not None
+    library = Library("Central Library", os.environ.get("LIBRARY_DATA", DEFAULT_DATA_PATH), journal=True,
+                      shared=not write_behind, write_behind=write_behind,
+                      flush_interval=int(flush_interval_ms or 100) / 1000,
+                      flush_every=int(os.environ.get("LIBRARY_FLUSH_EVERY", 1000)))
+    etag_prefix = secrets.token_hex(4)
+    clear_response_cache()
+    # Views enabled before loading are filled batch by batch as books arrive. A
+    # mapped .snap catalog would have to build every Book up front to fill them,
+    # undoing its near-instant startup, so there prewarm builds them instead
+    if not library.binary_snapshot:
+        enable_views(library, enabled_views)
+    # Reads are served from the books loaded so far; /ready reports when everything is warm
+    library.load_books(background=True)
+    warmed_up.clear()
+    threading.Thread(target=prewarm, args=(library, warmed_up, enabled_views), daemon=True).start()
+
+    yield
+
+    # Writes out anything still queued in write-behind mode
+    library.close()
+    await openlibrary.aclose()
+    metadata_cache.close()
+    if library.storage is not None:
+        library.storage.close()
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with codec, which uses orjson when it is installed"""
+
+    def render(self, content) -> bytes:
+        with metrics.SERIALIZATION_SECONDS.time():
+            return codec.dumps(content)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Library Management API",
     description="A simple library management system with FastAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
-# Initialize library instance
-library = Library("Central Library", "library_data.json")
+def library_loaded():
+    """Dependency for endpoints that change the catalog, which have to wait until loading is done"""
+    if library.loading:
+        raise HTTPException(status_code=503, detail="The library is still loading, please retry shortly",
+                            headers={"Retry-After": "5"})
+
+@app.middleware("http")
+async def sync_library(request: Request, call_next):
+    """Catch up with changes other worker processes made before serving a request.
+
+    The check is a few stats. Only when another worker wrote something does the
+    catch-up run, in a thread, so waiting for the lock file does not block the
+    event loop. Endpoints that change the catalog take the lock file too, so
+    they are plain def functions that FastAPI runs in its threadpool.
+    """
+    if library.has_external_changes():
+        await run_in_threadpool(library.sync)
+    return await call_next(request)
+
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    """Record request latency per route template, so /books/{isbn} is one series for every ISBN"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                                        route.path if route is not None else "unmatched", str(status))
+
+def catalog_gauge(read):
+    """Wrap a gauge reader so it reports nothing until the lifespan handler has created the library"""
+    return lambda: read(library) if library is not None else None
 
-# Load existing books on startup
-try:
-    library.load_books()
-except FileNotFoundError:
-    print("No existing library data found. Starting with empty library.")
-except Exception as e:
-    print(f"Error loading library data: {e}")
+def metadata_cache_stat(name: str):
+    return lambda: metadata_cache.stats()[name] if metadata_cache is not None else None
+
+def response_cache_hit_ratio():
+    lookups = metrics.RESPONSE_CACHE_LOOKUPS.values()
+    hits = lookups.get(("hit",), 0) + lookups.get(("not_modified",), 0)
+    total = hits + lookups.get(("miss",), 0)
+    return hits / total if total else 0.0
+
+metrics.Gauge("library_books", "Books in the catalog, by status",
+              catalog_gauge(lambda library: {("available",): library.stats()["available_books"],
+                                             ("borrowed",): library.stats()["borrowed_books"]}),
+              ("status",))
+metrics.Gauge("library_catalog_version", "Changes applied to the in-memory catalog", catalog_gauge(lambda library: library.version))
+metrics.Gauge("library_loading", "1 while the catalog is still loading", catalog_gauge(lambda library: int(library.loading)))
+metrics.Gauge("library_pending_changes", "Changes queued by write-behind and not flushed yet",
+              catalog_gauge(lambda library: library.persistence_stats()["pending_changes"]))
+metrics.Gauge("library_response_cache_hit_ratio", "Share of cached read requests answered without building the response",
+              response_cache_hit_ratio)
+metrics.Gauge("library_metadata_cache_lookups_total", "Open Library metadata cache lookups",
+              lambda: {("hit",): metadata_cache_stat("hits")(), ("miss",): metadata_cache_stat("misses")()}
+              if metadata_cache is not None else None,
+              ("result",), kind="counter")
+metrics.Gauge("library_metadata_cache_hit_ratio", "Share of Open Library lookups served from the metadata cache",
+              metadata_cache_stat("hit_rate"))
+metrics.Gauge("library_metadata_cache_entries", "Responses stored in the metadata cache", metadata_cache_stat("entries"))
+metrics.Gauge("library_openlibrary_coalesced_lookups_total", "ISBN lookups that joined a fetch already in flight",
+              lambda: openlibrary.coalesced if openlibrary is not None else None, kind="counter")
+metrics.Gauge("library_openlibrary_not_found_hits_total", "ISBN lookups answered from the not-found cache",
+              lambda: openlibrary.not_found.hits if openlibrary is not None else None, kind="counter")
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def clear_response_cache():
+    global response_cache_bytes
+    response_cache.clear()
+    response_cache_bytes = 0
+
+def cached_json(request: Request, key: tuple, build) -> Response:
+    """Serve a read endpoint with an ETag for the current catalog version.
+
+    build() returns (content, headers) and only runs when the response for key
+    is not cached yet for this version. A client that sends the current ETag
+    in If-None-Match gets 304 Not Modified with no body.
+    """
+    global response_cache_version, response_cache_bytes
+    # Read before building, so a change made meanwhile can only make the tag too old, never too new
+    version, position = library.version_and_position()
+    if position is None:
+        etag = f'"{etag_prefix}-{version}"'
+    else:
+        etag = f'"{hashlib.blake2b(repr(position).encode(), digest_size=8).hexdigest()}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.RESPONSE_CACHE_LOOKUPS.inc("not_modified")
+        return Response(status_code=304, headers=cache_headers)
+
+    if response_cache_version != (library, version):
+        clear_response_cache()
+        response_cache_version = (library, version)
+    entry = response_cache.get(key)
+    if entry is not None:
+        metrics.RESPONSE_CACHE_LOOKUPS.inc("hit")
+        response_cache.move_to_end(key)
+        body, headers = entry
+    else:
+        metrics.RESPONSE_CACHE_LOOKUPS.inc("miss")
+        content, headers = build()
+        with metrics.SERIALIZATION_SECONDS.time():
+            body = codec.dumps(content)
+        # Not cached if the catalog changed while it was built, as it may mix two versions
+        if library.version == version and len(body) <= RESPONSE_CACHE_BYTES:
+            response_cache[key] = (body, headers)
+            response_cache_bytes += len(body)
+            while len(response_cache) > RESPONSE_CACHE_SIZE or response_cache_bytes > RESPONSE_CACHE_BYTES:
+                evicted, _ = response_cache.popitem(last=False)[1]
+                response_cache_bytes -= len(evicted)
+    return Response(body, media_type="application/json", headers=dict(headers, **cache_headers))
 
 # Pydantic models for request/response
 class BookResponse(BaseModel):
@@ -36,6 +268,13 @@ class BookResponse(BaseModel):
 class ISBNRequest(BaseModel):
     isbn: str
 
+class BulkISBNRequest(BaseModel):
+    isbns: List[str]
+    batch_size: int = 500
+
+class ISBNListRequest(BaseModel):
+    isbns: List[str]
+
 class MessageResponse(BaseModel):
     message: str
     success: bool
@@ -62,48 +301,86 @@ async def root():
         "version": "1.0.0",
         "documentation": "/docs",
         "endpoints": {
-            "GET /books": "Get all books",
+            "GET /books": "Get all books (supports limit and after_isbn)",
+            "GET /books/stream": "Stream all books as NDJSON",
             "POST /books": "Add book by ISBN",
-            "DELETE /books/{isbn}": "Delete book by ISBN"
+            "POST /books/bulk": "Add many books by ISBN",
+            "DELETE /books/{isbn}": "Delete book by ISBN",
+            "POST /books/{isbn}/borrow": "Borrow a book",
+            "POST /books/{isbn}/return": "Return a borrowed book",
+            "POST /books/borrow": "Borrow many books by ISBN",
+            "POST /books/return": "Return many books by ISBN",
+            "GET /search?q=": "Search books by title, author or publisher",
+            "GET /search/fuzzy?q=": "Typo-tolerant search by title or author",
+            "GET /ready": "Readiness: catalog loaded and indexes warm",
+            "GET /metrics": "Prometheus metrics"
         }
     }
 
 @app.get("/books", response_model=List[BookResponse])
-async def get_all_books():
-    """Get all books in the library"""
+async def get_all_books(request: Request, limit: Optional[int] = Query(None, ge=1, le=10000),
+                        after_isbn: Optional[str] = None):
+    """Get all books in the library, or one page of books in ISBN order when limit/after_isbn are given"""
+    def build():
+        # Books come from the library itself, so they are serialized directly
+        # instead of being validated through BookResponse one by one
+        if limit is None and after_isbn is None:
+            return [book.to_dict() for book in list(library._booklist)], {}
+
+        page = library.books_page(after_isbn, limit or 100)
+        headers = {}
+        if len(page) == (limit or 100):
+            headers["X-Next-After-ISBN"] = page[-1].isbn
+        return [book.to_dict() for book in page], headers
+
     try:
-        books = [book_to_response(book) for book in library._booklist]
-        return books
+        return cached_json(request, ("books", limit, after_isbn), build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving books: {str(e)}")
 
-@app.post("/books", response_model=BookResponse)
+@app.get("/books/stream")
+async def stream_books(after_isbn: Optional[str] = None, limit: Optional[int] = Query(None, ge=1)):
+    """Stream books in ISBN order as NDJSON, one line per book"""
+    async def book_lines():
+        # Lines are sent in chunks so the event loop can serve other requests in between
+        lines = []
+        for book in library.iter_books(after_isbn, limit):
+            lines.append(codec.dumps(book.to_dict()) + b"\n")
+            if len(lines) == 1000:
+                yield b"".join(lines)
+                lines = []
+        if lines:
+            yield b"".join(lines)
+
+    return StreamingResponse(book_lines(), media_type="application/x-ndjson")
+
+@app.post("/books", response_model=BookResponse, dependencies=[Depends(library_loaded)])
 async def add_book_by_isbn(isbn_request: ISBNRequest):
     """Add a book to the library using ISBN"""
     try:
         # Check if book already exists
-        for book in library._booklist:
-            if book.isbn == isbn_request.isbn:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Book with ISBN {isbn_request.isbn} already exists in the library"
-                )
-        
-        # Store original length to check if book was added
-        original_length = len(library._booklist)
+        if library.get_book(isbn_request.isbn) is not None:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Book with ISBN {isbn_request.isbn} already exists in the library"
+            )
         
-        # Add book using the library method
-        library.add_book_isbn(isbn_request.isbn)
+        # Add book without blocking the event loop on Open Library
+        new_book = await library.add_book_isbn_async(isbn_request.isbn, openlibrary)
         
-        # Check if book was actually added
-        if len(library._booklist) <= original_length:
+        # Check if book was actually added; it may have been added concurrently
+        if new_book is None and library.get_book(isbn_request.isbn) is not None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Book with ISBN {isbn_request.isbn} already exists in the library"
+            )
+        if new_book is None:
             raise HTTPException(
                 status_code=404, 
                 detail=f"Book with ISBN {isbn_request.isbn} not found in Open Library database"
             )
         
         # Return the newly added book
-        new_book = library._booklist[-1]
         return book_to_response(new_book)
         
     except HTTPException:
@@ -111,24 +388,73 @@ async def add_book_by_isbn(isbn_request: ISBNRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding book: {str(e)}")
 
-@app.delete("/books/{isbn}", response_model=MessageResponse)
-async def delete_book(isbn: str):
+@app.post("/books/bulk", dependencies=[Depends(library_loaded)])
+async def add_books_bulk(bulk_request: BulkISBNRequest):
+    """Import many ISBNs at once, streaming one NDJSON report line per ISBN"""
+    if bulk_request.batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1")
+
+    async def report_lines():
+        async for report in library.import_isbns(bulk_request.isbns, openlibrary, batch_size=bulk_request.batch_size):
+            yield codec.dumps(report) + b"\n"
+
+    return StreamingResponse(report_lines(), media_type="application/x-ndjson")
+
+@app.post("/books/borrow", dependencies=[Depends(library_loaded)])
+def borrow_books(request: ISBNListRequest):
+    """Borrow many books at once; returns one {isbn, success, message} report per ISBN"""
+    try:
+        return FastJSONResponse(library.borrow_books(request.isbns))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error borrowing books: {str(e)}")
+
+@app.post("/books/return", dependencies=[Depends(library_loaded)])
+def return_books(request: ISBNListRequest):
+    """Return many books at once; returns one {isbn, success, message} report per ISBN"""
+    try:
+        return FastJSONResponse(library.return_books(request.isbns))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error returning books: {str(e)}")
+
+def status_change_failed(isbn: str, action: str):
+    """404 if the book is missing, 409 if it is already in the requested state"""
+    if library.get_book(isbn) is None:
+        return HTTPException(status_code=404, detail=f"Book with ISBN {isbn} not found in the library")
+    return HTTPException(status_code=409, detail=f"Book with ISBN {isbn} cannot be {action} in its current state")
+
+def changed_book_response(isbn: str) -> BookResponse:
+    """The book whose status was just changed; 404 if a concurrent DELETE removed it in the meantime"""
+    book = library.get_book(isbn)
+    if book is None:
+        raise HTTPException(status_code=404, detail=f"Book with ISBN {isbn} not found in the library")
+    return book_to_response(book)
+
+@app.post("/books/{isbn}/borrow", response_model=BookResponse, dependencies=[Depends(library_loaded)])
+def borrow_book(isbn: str):
+    """Borrow an available book"""
+    if not library.borrow_book(isbn):
+        raise status_change_failed(isbn, "borrowed")
+    return changed_book_response(isbn)
+
+@app.post("/books/{isbn}/return", response_model=BookResponse, dependencies=[Depends(library_loaded)])
+def return_book(isbn: str):
+    """Return a borrowed book"""
+    if not library.return_book(isbn):
+        raise status_change_failed(isbn, "returned")
+    return changed_book_response(isbn)
+
+@app.delete("/books/{isbn}", response_model=MessageResponse, dependencies=[Depends(library_loaded)])
+def delete_book(isbn: str):
     """Delete a book from the library by ISBN"""
     try:
         # Check if book exists before deletion
-        book_found = False
-        for book in library._booklist:
-            if book.isbn == isbn:
-                book_found = True
-                break
-        
-        if not book_found:
+        if library.get_book(isbn) is None:
             raise HTTPException(
                 status_code=404, 
                 detail=f"Book with ISBN {isbn} not found in the library"
             )
         
-        # Remove the book
+        # Remove the book; a concurrent request may have removed it first
         success = library.remove_book(isbn)
         
         if success:
@@ -138,8 +464,8 @@ async def delete_book(isbn: str):
             )
         else:
             raise HTTPException(
-                status_code=500, 
-                detail=f"Failed to delete book with ISBN {isbn}"
+                status_code=404, 
+                detail=f"Book with ISBN {isbn} not found in the library"
             )
             
     except HTTPException:
@@ -148,44 +474,101 @@ async def delete_book(isbn: str):
         raise HTTPException(status_code=500, detail=f"Error deleting book: {str(e)}")
 
 @app.get("/books/{isbn}", response_model=BookResponse)
-async def get_book_by_isbn(isbn: str):
+async def get_book_by_isbn(request: Request, isbn: str):
     """Get a specific book by ISBN"""
-    try:
-        for book in library._booklist:
-            if book.isbn == isbn:
-                return book_to_response(book)
+    def build():
+        book = library.get_book(isbn)
+        if book is not None:
+            return book.to_dict(), {}
         
         raise HTTPException(
             status_code=404, 
             detail=f"Book with ISBN {isbn} not found in the library"
         )
+
+    try:
+        return cached_json(request, ("book", isbn), build)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving book: {str(e)}")
 
-@app.get("/stats", response_model=dict)
-async def get_library_stats():
-    """Get library statistics"""
+@app.get("/search", dependencies=[Depends(view_enabled("search"))])
+async def search_books(q: str, limit: int = Query(20, ge=1, le=1000)):
+    """Search titles, authors and publishers; every word must match, the last may be a prefix"""
+    try:
+        return FastJSONResponse([dict(book.to_dict(), score=score) for score, book in library.search(q, limit)])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching books: {str(e)}")
+
+@app.get("/search/fuzzy", dependencies=[Depends(view_enabled("fuzzy"))])
+async def fuzzy_search_books(q: str, field: Optional[Literal["title", "author"]] = None,
+                             limit: int = Query(10, ge=1, le=1000)):
+    """Typo-tolerant search over title and author words"""
     try:
-        total_books = len(library._booklist)
-        borrowed_books = sum(1 for book in library._booklist if book.status == "Borrowed")
-        available_books = total_books - borrowed_books
+        return FastJSONResponse([dict(book.to_dict(), score=score, matched_field=matched_field)
+                             for score, matched_field, book in library.fuzzy_search(q, field, limit)])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching books: {str(e)}")
+
+@app.get("/stats", response_model=dict)
+async def get_library_stats(request: Request, breakdown: bool = False):
+    """Get library statistics, optionally with per-publisher and per-author book counts"""
+    def build():
+        stats = library.stats()
         
-        return {
+        response = {
             "library_name": library.name,
-            "total_books": total_books,
-            "available_books": available_books,
-            "borrowed_books": borrowed_books
+            "total_books": stats["total_books"],
+            "available_books": stats["available_books"],
+            "borrowed_books": stats["borrowed_books"]
         }
+        if breakdown:
+            response["books_by_publisher"] = library.publisher_counts()
+            response["books_by_author"] = library.author_counts()
+        return response, {}
+
+    try:
+        return cached_json(request, ("stats", breakdown), build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving statistics: {str(e)}")
+
+@app.get("/stats/advanced", response_model=dict, dependencies=[Depends(view_enabled("columns"))])
+async def get_advanced_stats(bin_width: int = Query(100, ge=1), top: int = Query(20, ge=1)):
+    """Catalog-wide analytics computed over the columnar view"""
+    try:
+        return dict(library_name=library.name, **library.advanced_stats(bin_width, top))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving statistics: {str(e)}")
 
+@app.get("/stats/persistence", response_model=dict)
+async def get_persistence_stats():
+    """Write-behind queue length and flush counters"""
+    return library.persistence_stats()
+
+@app.get("/ready", response_model=dict)
+async def readiness_check():
+    """Readiness probe: 200 once the catalog is loaded and its indexes are warm, 503 until then"""
+    ready = not library.loading and warmed_up.is_set()
+    body = {
+        "ready": ready,
+        "loading": library.loading,
+        "load_progress": library.load_progress,
+        "indexes_warm": warmed_up.is_set(),
+        "total_books": library.stats()["total_books"]
+    }
+    return FastJSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: request latency per route, upstream, persistence and serialization timers, catalog and cache gauges"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Health check endpoint
 @app.get("/health", response_model=dict)
 async def health_check():
-    """Health check endpoint"""
+    """Liveness probe: the process is up and answering, whether or not the catalog is ready"""
     return {
         "status": "healthy",
         "service": "Library Management API",
@@ -0,0 +1,534 @@
+"""Benchmarks for the library hot paths.
+
+Usage:
+    python benchmark.py                  # run every benchmark
+    python benchmark.py isbn_lookup      # run only the named benchmarks
+
+The suite benchmark times the library and API hot paths on synthetic
+catalogs and can save the results as a baseline or compare against one:
+
+    python benchmark.py suite --sizes 1000,10000 --output baseline.json
+    python benchmark.py suite --sizes 1000,10000 --baseline baseline.json --threshold 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from library import Book, Library
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    """Register a benchmark under its name without the bench_ prefix"""
+    BENCHMARKS[func.__name__.removeprefix("bench_")] = func
+    return func
+
+
+def make_isbn(i: int) -> str:
+    return f"978{i:010d}"
+
+
+def make_books(count: int, start: int = 0):
+    """Generate synthetic books with a handful of repeating authors and publishers"""
+    for i in range(start, start + count):
+        yield Book(
+            f"Synthetic Title {i}",
+            f"Author {i % 5000}",
+            make_isbn(i),
+            str(1900 + i % 125),
+            f"Publisher {i % 300}",
+            50 + i % 950,
+            "Borrowed" if i % 7 == 0 else "Available",
+        )
+
+
+SYLLABLES = ["ka", "ri", "mo", "tel", "san", "dor", "bi", "lu", "nes", "ar", "ve", "po", "lin", "ga", "sto", "men"]
+
+
+def make_words(count: int, rng: random.Random):
+    """Pseudo words built from syllables, standing in for a natural vocabulary"""
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_text_books(count: int, seed: int = 0):
+    """Books with word-based titles and authors, for search benchmarks"""
+    rng = random.Random(seed)
+    vocabulary = make_words(20_000, rng)
+    first_names = [word.capitalize() for word in make_words(2_000, rng)]
+    last_names = [word.capitalize() for word in make_words(20_000, rng)]
+    for i in range(count):
+        title = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 4))).title()
+        author = f"{rng.choice(first_names)} {rng.choice(last_names)}"
+        yield Book(title, author, make_isbn(i), str(1900 + i % 125), f"Publisher {i % 300}", 50 + i % 950)
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """Drop one letter, the most common kind of typo at the front desk"""
+    i = rng.randrange(len(word))
+    return word[:i] + word[i + 1:]
+
+
+def make_library(count: int, filename: str = "benchmark_data.json", **options) -> Library:
+    """Build an in-memory library without touching the disk; options go to Library"""
+    library = Library("Benchmark Library", filename, **options)
+    for book in make_books(count):
+        library._register(book)
+    return library
+
+
+@benchmark
+def bench_isbn_lookup(sizes=(1_000, 10_000, 100_000, 1_000_000), lookups=100_000, removals=1_000):
+    """ISBN lookup and removal cost should stay flat as the catalog grows"""
+    import tempfile
+    print(f"{'books':>10} | {'hit ns/op':>10} | {'miss ns/op':>10} | {'remove us/op':>12}")
+    for size in sizes:
+        directory = tempfile.TemporaryDirectory()
+        # In journal mode, so each removal appends one line rather than rewriting the file
+        library = make_library(size, os.path.join(directory.name, "library.json"), journal=True)
+        rng = random.Random(size)
+        hits = [make_isbn(rng.randrange(size)) for _ in range(lookups)]
+        misses = [make_isbn(size + i) for i in range(lookups)]
+
+        start = time.perf_counter()
+        for isbn in hits:
+            library.get_book(isbn)
+        hit_ns = (time.perf_counter() - start) / lookups * 1e9
+
+        start = time.perf_counter()
+        for isbn in misses:
+            library.get_book(isbn)
+        miss_ns = (time.perf_counter() - start) / lookups * 1e9
+
+        victims = [make_isbn(i) for i in rng.sample(range(size), min(removals, size))]
+        with directory:
+            start = time.perf_counter()
+            for isbn in victims:
+                library.remove_book(isbn)
+            remove_us = (time.perf_counter() - start) / len(victims) * 1e6
+
+        print(f"{size:>10} | {hit_ns:>10.1f} | {miss_ns:>10.1f} | {remove_us:>12.1f}")
+
+
+class LegacyBook:
+    """The original Book layout: a per-instance __dict__ and unshared strings"""
+
+    def __init__(self, title, author, isbn, publish_date, publisher, page_count, status="Available"):
+        self.title = title
+        self.author = author
+        self.isbn = isbn
+        self.publish_date = publish_date
+        self.publisher = publisher
+        self.page_count = page_count
+        self.status = status
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def measure_book_rss(kind: str, count: int) -> int:
+    """Build count books of the given layout and return the RSS they added"""
+    cls = LegacyBook if kind == "legacy" else Book
+    before = rss_bytes()
+    books = [
+        cls(f"Synthetic Title {i}", f"Author {i % 5000}", make_isbn(i), str(1900 + i % 125),
+            f"Publisher {i % 300}", 50 + i % 950, "Borrowed" if i % 7 == 0 else "Available")
+        for i in range(count)
+    ]
+    used = rss_bytes() - before
+    del books
+    return used
+
+
+@benchmark
+def bench_book_memory(count=1_000_000):
+    """RSS per 1M books for the original dict-based Book versus the slotted, interned one"""
+    results = {}
+    for kind in ("legacy", "compact"):
+        # Each layout is measured in a fresh interpreter so the numbers don't share an arena
+        output = subprocess.run(
+            [sys.executable, "-c", f"import benchmark; print(benchmark.measure_book_rss({kind!r}, {count}))"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        results[kind] = int(output.split()[-1])
+    print(f"{'layout':>10} | {'MiB per 1M books':>16} | {'bytes/book':>10}")
+    for kind, used in results.items():
+        print(f"{kind:>10} | {used / 2**20 * 1_000_000 / count:>16.1f} | {used / count:>10.1f}")
+    print(f"saving: {1 - results['compact'] / results['legacy']:.0%}")
+
+
+def make_columns(count: int):
+    """Fill a CatalogColumns view directly, without materializing Book objects"""
+    from array import array
+    from columnar import CatalogColumns
+    columns = CatalogColumns()
+    for i in range(300):
+        columns.publishers.encode(f"Publisher {i}")
+    for i in range(5000):
+        columns.authors.encode(f"Author {i}")
+    columns.page_count = array("q", (50 + i % 950 for i in range(count)))
+    columns.publish_year = array("h", (1900 + i % 125 for i in range(count)))
+    columns.borrowed = array("b", (i % 7 == 0 for i in range(count)))
+    columns.publisher = array("l", (i % 300 for i in range(count)))
+    columns.author = array("l", (i % 5000 for i in range(count)))
+    columns._isbns = [None] * count
+    return columns
+
+
+@benchmark
+def bench_columnar_stats(sizes=(100_000, 1_000_000, 10_000_000), repeat=5):
+    """/stats/advanced aggregations over the columnar view"""
+    import columnar
+    print(f"NumPy: {'yes' if columnar.np is not None else 'no (pure Python fallback)'}")
+    print(f"{'rows':>10} | {'summary ms':>10} | {'pages ms':>10} | {'years ms':>10} | {'publishers ms':>13}")
+    for size in sizes:
+        columns = make_columns(size)
+        timings = []
+        for func in (columns.summary, columns.page_count_histogram, columns.publish_year_histogram,
+                     lambda: columns.publisher_totals(20)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func()
+            timings.append((time.perf_counter() - start) / repeat * 1000)
+        print(f"{size:>10} | {timings[0]:>10.2f} | {timings[1]:>10.2f} | {timings[2]:>10.2f} | {timings[3]:>13.2f}")
+
+
+@benchmark
+def bench_fuzzy_search(sizes=(100_000, 1_000_000), queries=200):
+    """Typo-tolerant author and title lookups through the trigram index"""
+    from search import FuzzyIndex
+    print(f"{'titles':>10} | {'build s':>8} | {'author ms/q':>11} | {'title ms/q':>10}")
+    for size in sizes:
+        books = list(make_text_books(size))
+        start = time.perf_counter()
+        index = FuzzyIndex(books)
+        build = time.perf_counter() - start
+
+        rng = random.Random(size)
+        timings = []
+        for field in ("author", "title"):
+            words = [misspell(getattr(rng.choice(books), field).split()[-1].lower(), rng) for _ in range(queries)]
+            start = time.perf_counter()
+            for word in words:
+                index.search(word, field=field)
+            timings.append((time.perf_counter() - start) / queries * 1000)
+        print(f"{size:>10} | {build:>8.1f} | {timings[0]:>11.2f} | {timings[1]:>10.2f}")
+        del books, index
+
+
+@benchmark
+def bench_view_memory(count=200_000):
+    """Memory the columnar, search and fuzzy views of a library add on top of its catalog"""
+    import tracemalloc
+    library = Library("Benchmark Library", "unused.json")
+    books = list(make_text_books(count))
+    tracemalloc.start()
+    library._register_many(books)
+    sizes = {"catalog": tracemalloc.get_traced_memory()[0]}
+    for name, enable in (("columns", library.enable_columns), ("search", library.enable_search),
+                         ("fuzzy", library.enable_fuzzy_search)):
+        before = tracemalloc.get_traced_memory()[0]
+        enable()
+        sizes[name] = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{count} books, index structures only (the Books themselves were built before tracing)")
+    for name, size in sizes.items():
+        print(f"{name:>10} | {size / 1e6:>7.1f} MB")
+
+
+@benchmark
+def bench_json_codec(count=1_000_000):
+    """Snapshot save and load and the GET /books response body, stdlib json versus orjson"""
+    import codec
+    import tempfile
+    fast = codec.orjson
+    backends = [("json", None)] + ([("orjson", fast)] if fast is not None else [])
+    if fast is None:
+        print("orjson is not installed; only the stdlib backend is measured")
+    print(f"{'backend':>8} | {'save s':>7} | {'load s':>7} | {'/books s':>8} | {'/books MB/s':>11}")
+    books = list(make_books(count))
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "library.json")
+        try:
+            for name, module in backends:
+                codec.orjson = module
+                library = Library("Benchmark Library", filename)
+                library._booklist = books
+
+                start = time.perf_counter()
+                library.save_books()
+                save = time.perf_counter() - start
+
+                start = time.perf_counter()
+                Library("Benchmark Library", filename).load_books()
+                load = time.perf_counter() - start
+
+                # What GET /books renders: every book as a dict, encoded in one go
+                start = time.perf_counter()
+                body = codec.dumps([book.to_dict() for book in books])
+                render = time.perf_counter() - start
+                print(f"{name:>8} | {save:>7.2f} | {load:>7.2f} | {render:>8.2f} | {len(body) / 2**20 / render:>11.0f}")
+        finally:
+            codec.orjson = fast
+
+
+@benchmark
+def bench_snapshot_startup(sizes=(100_000, 1_000_000), lookups=10_000):
+    """Startup time of a JSON snapshot versus a memory-mapped binary one"""
+    import gc
+    import tempfile
+    from snapshot import write_snapshot
+    print(f"{'books':>10} | {'JSON load s':>11} | {'.snap write s':>13} | {'.snap load ms':>13} | {'lookup us':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            books = list(make_books(size))
+            json_library = Library("Benchmark Library", os.path.join(directory, "library.json"))
+            json_library._booklist = books
+            json_library.save_books()
+            start = time.perf_counter()
+            Library("Benchmark Library", json_library.filename).load_books()
+            json_load = time.perf_counter() - start
+
+            filename = os.path.join(directory, "library.snap")
+            start = time.perf_counter()
+            write_snapshot(filename, books)
+            write = time.perf_counter() - start
+            del books, json_library
+            gc.collect()
+
+            start = time.perf_counter()
+            library = Library("Benchmark Library", filename)
+            library.load_books()
+            load_ms = (time.perf_counter() - start) * 1000
+
+            rng = random.Random(size)
+            isbns = [make_isbn(rng.randrange(size)) for _ in range(lookups)]
+            start = time.perf_counter()
+            for isbn in isbns:
+                library.get_book(isbn)
+            lookup_us = (time.perf_counter() - start) / lookups * 1e6
+            print(f"{size:>10} | {json_load:>11.2f} | {write:>13.2f} | {load_ms:>13.2f} | {lookup_us:>9.1f}")
+
+
+def best_of(repeat: int, run, setup=None, min_time: float = 0.5) -> float:
+    """Fastest timed call of run(), after one warm-up call.
+
+    run() is called at least repeat times and until the calls add up to
+    min_time seconds, so quick operations are sampled often enough for their
+    minimum to be stable. setup() runs untimed before each call.
+    """
+    timings = []
+    total = 0.0
+    for attempt in range(repeat + 1 + 10_000):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if attempt == 0:
+            continue
+        timings.append(elapsed)
+        total += elapsed
+        if len(timings) >= repeat and total >= min_time:
+            break
+    return min(timings)
+
+
+def open_library_transport():
+    """Mocked Open Library answering every ISBN with the same edition and author"""
+    import httpx
+
+    def handler(request):
+        if request.url.path.startswith("/isbn/"):
+            return httpx.Response(200, json={"title": "Fetched Title", "authors": [{"key": "/authors/OL1A"}],
+                                             "publish_date": "2020", "publishers": ["Benchmark Press"],
+                                             "number_of_pages": 300})
+        if request.url.path.startswith("/authors/"):
+            return httpx.Response(200, json={"name": "Fetched Author"})
+        return httpx.Response(404)
+
+    return httpx.MockTransport(handler)
+
+
+def suite_library_results(size: int, directory: str, repeat: int) -> dict:
+    """Seconds per operation for the Library hot paths on a catalog of size books"""
+    results = {}
+    books = list(make_books(size))
+    filename = os.path.join(directory, f"library_{size}.json")
+    library = Library("Benchmark Library", filename)
+    library._register_many(books)
+
+    results["save_books"] = best_of(repeat, library.save_books)
+    results["load_books"] = best_of(repeat, lambda: Library("Benchmark Library", filename).load_books())
+
+    lookups = 10_000
+    rng = random.Random(size)
+    isbns = [make_isbn(rng.randrange(size)) for _ in range(lookups)]
+
+    def lookup():
+        for isbn in isbns:
+            library.get_book(isbn)
+    results["isbn_lookup"] = best_of(repeat, lookup) / lookups
+
+    # Removals are measured in journal mode, as the console app and the API run them
+    removals = min(100, size)
+    journal_library = Library("Benchmark Library", filename, journal=True)
+    journal_library._register_many(books)
+    victims = [make_isbn(i) for i in random.Random(size + 1).sample(range(size), removals)]
+
+    def restore():
+        journal_library.add_books([book for book in books if book.isbn in set(victims)])
+
+    def remove():
+        for isbn in victims:
+            journal_library.remove_book(isbn)
+    results["remove_book"] = best_of(repeat, remove, restore) / removals
+    return results
+
+
+def suite_api_results(size: int, directory: str, repeat: int) -> dict:
+    """Seconds per request for the API hot paths, through the ASGI app without a network"""
+    import asyncio
+    from fastapi.testclient import TestClient
+    import api
+    from openlibrary import OpenLibraryClient
+
+    results = {}
+    library = Library("Benchmark Library", os.path.join(directory, f"api_{size}.json"), journal=True)
+    library._register_many(list(make_books(size)))
+    client = TestClient(api.app)
+    saved = api.library, api.openlibrary, api.etag_prefix
+    api.library, api.etag_prefix = library, "benchmark"
+    api.openlibrary = OpenLibraryClient(transport=open_library_transport())
+    try:
+        # The response cache is emptied before every request so the full cost is measured
+        requests = 20
+        for name, path in (("GET /books", "/books"), ("GET /books?limit=100", "/books?limit=100"), ("GET /stats", "/stats")):
+            count = 1 if path == "/books" else requests
+
+            def get():
+                for _ in range(count):
+                    api.clear_response_cache()
+                    client.get(path)
+            results[name] = best_of(repeat, get) / count
+
+        posts = iter(range(size, size + 10_000_000))
+
+        def post():
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(requests):
+                    client.post("/books", json={"isbn": make_isbn(next(posts))})
+        results["POST /books"] = best_of(repeat, post) / requests
+    finally:
+        asyncio.run(api.openlibrary.aclose())
+        api.library, api.openlibrary, api.etag_prefix = saved
+    return results
+
+
+def compare_results(results: dict, baseline: dict, threshold: float) -> list:
+    """Print each timing against the baseline; returns the names that are more than threshold slower"""
+    regressions = []
+    print(f"\n{'benchmark':<36} | {'baseline':>11} | {'current':>11} | {'change':>7}")
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<36} | {'-':>11} | {seconds:>11.3e} |     new")
+            continue
+        change = seconds / before - 1 if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<36} | {before:>11.3e} | {seconds:>11.3e} | {change:>+7.1%}{flag}")
+    return regressions
+
+
+@benchmark
+def bench_suite(sizes=(1_000, 10_000, 100_000, 1_000_000), repeat=3, output=None, baseline=None, threshold=0.2):
+    """Library and API hot paths on synthetic catalogs, saved to or compared against a JSON baseline.
+
+    Every result is the best of repeat runs, in seconds per operation, keyed
+    as "<operation> [<books>]". Returns False if a result is more than
+    threshold (0.2 = 20%) slower than the baseline.
+    """
+    import tempfile
+    import codec
+    results = {}
+    print(f"{'benchmark':<36} | {'s/op':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            timings = suite_library_results(size, directory, repeat)
+            timings.update(suite_api_results(size, directory, repeat))
+            for name, seconds in timings.items():
+                key = f"{name} [{size}]"
+                results[key] = seconds
+                print(f"{key:<36} | {seconds:>11.3e}")
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "json_backend": codec.backend(),
+                "repeat": repeat,
+                "results": results
+            }, f, indent=2)
+        print(f"\nResults written to {output}")
+    if baseline is not None:
+        with open(baseline, "r") as f:
+            regressions = compare_results(results, json.load(f)["results"], threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) more than {threshold:.0%} slower than {baseline}")
+            return False
+        print(f"\nNo benchmark is more than {threshold:.0%} slower than {baseline}")
+    return True
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks for the library hot paths")
+    parser.add_argument("names", nargs="*", metavar="benchmark", help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="catalog sizes for the suite benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="suite runs per measurement; the fastest counts")
+    parser.add_argument("--output", help="write the suite results to this JSON file")
+    parser.add_argument("--baseline", help="compare the suite results with this JSON file written by --output")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown against the baseline that fails the run (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Available: {', '.join(BENCHMARKS)}")
+            return 1
+    status = 0
+    for name in names:
+        print(f"\n== {name} ==")
+        if name == "suite":
+            sizes = [int(size) for size in args.sizes.split(",")]
+            if not bench_suite(sizes, args.repeat, args.output, args.baseline, args.threshold):
+                status = 1
+        else:
+            BENCHMARKS[name]()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
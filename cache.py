@@ -0,0 +1,236 @@
+"""Persistent on-disk cache for Open Library responses.
+
+Edition, author and bibkeys responses are stored in a small SQLite database
+keyed by their Open Library path. Entries expire after a TTL and the least
+recently used entries are evicted once the cache holds max_entries. New
+entries are written in batches by a background thread.
+
+NegativeCache remembers, in memory and for a few minutes, the ISBNs Open
+Library could not find, so retries do not go upstream again.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MetadataCache:
+    """Open Library responses in SQLite, written in batches by a background thread.
+
+    set() only queues the entry in memory, where get() already finds it, and
+    wakes the writer, so a lookup on the event loop never waits for a commit
+    or for another process's write lock. The database is in WAL mode, so
+    readers and the writer do not block each other.
+    """
+
+    def __init__(self, filename: str, ttl: float = 7 * 24 * 3600, max_entries: int = 100000,
+                 touch_interval: float = 60, write_delay: float = 0.05):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # A hit only notes its access time in memory, so it never writes to
+        # disk. The times are written in one transaction every touch_interval
+        # seconds, before an eviction and on close.
+        self.touch_interval = touch_interval
+        # How long the writer waits after a set() for more entries to batch
+        self.write_delay = write_delay
+        self._touched = {}  # key -> last access time not yet written
+        self._touched_written = time.monotonic()
+        self._pending = {}  # key -> (encoded value, expires_at, set time) not yet written
+        self._expired = set()  # keys found expired, deleted with the next write
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+        self._closing = threading.Event()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        # Writes go through a connection of their own, so reads never queue behind a commit
+        self._write_conn = sqlite3.connect(filename, check_same_thread=False)
+        self._write_conn.execute("PRAGMA synchronous=NORMAL")
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str):
+        """Return the cached JSON value for key, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row[:2]
+            if expires_at <= now:
+                self._pending.pop(key, None)
+                self._touched.pop(key, None)
+                self._expired.add(key)
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            self.hits += 1
+            if time.monotonic() - self._touched_written >= self.touch_interval:
+                self._start_writer()
+        return json.loads(value)
+
+    def set(self, key: str, value, ttl: float = None):
+        """Store a JSON-serializable value; the writer thread saves it and evicts least recently used entries"""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        encoded = json.dumps(value)
+        with self._lock:
+            self._pending[key] = (encoded, expires_at, now)
+            self._touched.pop(key, None)
+            self._expired.discard(key)
+            self._start_writer()
+
+    def _start_writer(self):
+        # Caller holds the lock
+        if self._writer is None and not self._closing.is_set():
+            self._writer = threading.Thread(target=self._write_behind, name="metadata-cache-writer", daemon=True)
+            self._writer.start()
+        self._wake.set()
+
+    def _write_behind(self):
+        while True:
+            self._wake.wait()
+            # close() cuts the wait short
+            self._closing.wait(self.write_delay)
+            self._wake.clear()
+            # close() sets _closing before waking the writer, so this sees it after the last wake
+            if self._closing.is_set():
+                return
+            try:
+                self._write(touches=time.monotonic() - self._touched_written >= self.touch_interval)
+            except sqlite3.Error as e:
+                # The entries stay queued and go with the next write
+                print(f"Error writing the metadata cache: {e}")
+
+    def flush(self):
+        """Write queued entries and access times now, evicting least recently used entries if the cache is full"""
+        self._write(touches=True)
+
+    def _take_touched(self):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._touched_written = time.monotonic()
+        return touched
+
+    def _write(self, touches: bool):
+        with self._write_lock:
+            with self._lock:
+                pending = dict(self._pending)
+                expired, self._expired = self._expired, set()
+            touched = self._take_touched() if touches else {}
+            try:
+                with self._write_conn:
+                    self._write_conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                                 [(key, *row) for key, row in pending.items()])
+                    self._write_conn.executemany("DELETE FROM responses WHERE key = ? AND expires_at <= ?",
+                                                 [(key, time.time()) for key in expired])
+                    # Counted inside the write transaction, so entries other processes added count too
+                    entries = self._write_conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                    excess = entries - self.max_entries
+                    if excess > 0 and not touches:
+                        # Eviction goes by last_access, so it has to be up to date
+                        touched = self._take_touched()
+                    self._write_conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                                 [(accessed, key) for key, accessed in touched.items()])
+                    if excess > 0:
+                        self._write_conn.execute("DELETE FROM responses WHERE key IN "
+                                                 "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                                                 (excess,))
+                        entries -= excess
+            except sqlite3.Error:
+                with self._lock:
+                    # Newer access times noted meanwhile win over the ones that failed to write
+                    self._touched = {**touched, **self._touched}
+                    self._expired |= expired
+                raise
+            with self._lock:
+                for key, row in pending.items():
+                    # A set() of the same key meanwhile is still waiting to be written
+                    if self._pending.get(key) is row:
+                        del self._pending[key]
+                self._entries = entries
+                self.evictions += max(excess, 0)
+
+    def clear(self):
+        with self._write_lock, self._lock:
+            with self._write_conn:
+                self._write_conn.execute("DELETE FROM responses")
+            self._pending.clear()
+            self._touched.clear()
+            self._expired.clear()
+            self._entries = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            # As of the last write, which counts other processes' entries too
+            "entries": self._entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._closing.set()
+            self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+        self._conn.close()
+        self._write_conn.close()
+
+
+class NegativeCache:
+    """ISBNs known to be missing from Open Library, each forgotten after ttl seconds"""
+
+    def __init__(self, ttl: float = 300, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._expiry = OrderedDict()  # key -> expiry time, oldest first
+
+    def __contains__(self, key: str):
+        with self._lock:
+            expires_at = self._expiry.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._expiry[key]
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, key: str):
+        with self._lock:
+            self._expiry.pop(key, None)
+            self._expiry[key] = time.monotonic() + self.ttl
+            while len(self._expiry) > self.max_entries:
+                self._expiry.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._expiry.pop(key, None)
+
+    def __len__(self):
+        return len(self._expiry)
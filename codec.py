@@ -0,0 +1,133 @@
+"""JSON encoding for the snapshot, the journal and API responses.
+
+orjson is used when it is installed and the standard library json module
+otherwise. Both read and write plain JSON, so files written with one backend
+load with the other.
+"""
+import codecs
+import gc
+import json
+import json.scanner
+import re
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def backend() -> str:
+    return "orjson" if orjson is not None else "json"
+
+
+def dumps(value) -> bytes:
+    """Encode value as compact UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # orjson refuses a few things json accepts, like integers over 64 bits
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """Decode JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_lines(records) -> bytes:
+    """Encode records as newline-delimited JSON"""
+    return b"".join(dumps(record) + b"\n" for record in records)
+
+
+def iter_array(f, chunk_size : int = 1 << 20):
+    """Yield the elements of the top-level JSON array in binary file f one at a time.
+
+    Only about one chunk of text is held at once, so memory use does not grow
+    with the file. A syntax error raises json.JSONDecodeError after the
+    elements before it have been yielded.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    # The C scanner behind json.loads, called directly to skip raw_decode's per-call overhead
+    scan_once = json.scanner.make_scanner(json.JSONDecoder())
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + decoder.decode(chunk, final=eof)
+        pos = 0
+
+    def next_char():
+        # Skip whitespace and return the next character, or None at the end of the file
+        nonlocal pos
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                return None
+            read_more()
+
+    if next_char() != "[":
+        raise json.JSONDecodeError("Expecting '['", buffer, pos)
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        if pos >= len(buffer) or buffer[pos] in " \t\n\r":
+            next_char()
+        while True:
+            try:
+                value, end = scan_once(buffer, pos)
+            except StopIteration:
+                if eof:
+                    raise json.JSONDecodeError("Expecting value", buffer, pos) from None
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # An element running to the end of the buffer may be cut short
+                # ("12" of "123"), so it only counts once something follows it.
+                # A number cut inside its fraction or exponent ("1" of "1.5" or
+                # "1e3") stops right before the "." or "e", so that is not enough
+                if eof or (end < len(buffer) and buffer[end] not in ".eE"):
+                    break
+            read_more()
+        pos = end
+        yield value
+        # Compact JSON puts the comma right after the element
+        if pos < len(buffer) and buffer[pos] == ",":
+            pos += 1
+            continue
+        char = next_char()
+        if char == "]":
+            return
+        if char != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+        pos += 1
+
+
+@contextmanager
+def paused_gc():
+    """Pause the cyclic garbage collector while building many objects at once.
+
+    Loading a large catalog allocates millions of Books and dicts, none of them
+    cyclic, and each allocation burst would otherwise trigger a full scan.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
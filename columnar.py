@@ -0,0 +1,156 @@
+"""Column-oriented view of a Library for whole-catalog analytics.
+
+Numeric and status fields live in compact array.array columns and author and
+publisher strings are dictionary-encoded as integer codes. Library keeps the
+view in sync once enabled (see Library.enable_columns). Aggregations use
+NumPy over zero-copy views of the columns when it is installed and fall back
+to plain Python loops over the arrays otherwise.
+"""
+import re
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+YEAR_PATTERN = re.compile(r"\b(\d{4})\b")
+
+
+def parse_year(publish_date) -> int:
+    """Pull a four digit year out of dates like "1999" or "Oct 19, 2013"; 0 if there is none"""
+    match = YEAR_PATTERN.search(str(publish_date))
+    return int(match.group(1)) if match else 0
+
+
+class StringDictionary:
+    """Maps repeated strings to small integer codes"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class CatalogColumns:
+
+    def __init__(self, books=()):
+        self.clear()
+        for book in books:
+            self.add(book)
+
+    def clear(self):
+        self.page_count = array("q")
+        self.publish_year = array("h")
+        self.borrowed = array("b")
+        self.publisher = array("l")
+        self.author = array("l")
+        self.publishers = StringDictionary()
+        self.authors = StringDictionary()
+        self._rows = {}
+        self._isbns = []
+
+    def __len__(self):
+        return len(self._isbns)
+
+    def add(self, book):
+        self._rows[book.isbn] = len(self._isbns)
+        self._isbns.append(book.isbn)
+        self.page_count.append(book.page_count if isinstance(book.page_count, int) else 0)
+        self.publish_year.append(parse_year(book.publish_date))
+        self.borrowed.append(book.status == "Borrowed")
+        self.publisher.append(self.publishers.encode(book.publisher))
+        self.author.append(self.authors.encode(book.author))
+
+    def remove(self, book):
+        # Move the last row into the removed slot so removal is O(1)
+        row = self._rows.pop(book.isbn)
+        last = len(self._isbns) - 1
+        for column in (self.page_count, self.publish_year, self.borrowed, self.publisher, self.author):
+            column[row] = column[last]
+            column.pop()
+        last_isbn = self._isbns.pop()
+        if row != last:
+            self._isbns[row] = last_isbn
+            self._rows[last_isbn] = row
+
+    def set_status(self, book):
+        self.borrowed[self._rows[book.isbn]] = book.status == "Borrowed"
+
+    def summary(self):
+        books = len(self)
+        if np is not None:
+            total_pages = int(np.frombuffer(self.page_count, dtype=np.int64).sum()) if books else 0
+            borrowed = int(np.frombuffer(self.borrowed, dtype=np.int8).sum()) if books else 0
+        else:
+            total_pages = sum(self.page_count)
+            borrowed = sum(self.borrowed)
+        return {
+            "books": books,
+            "borrowed": borrowed,
+            "total_pages": total_pages,
+            "mean_pages": total_pages / books if books else 0.0
+        }
+
+    def page_count_histogram(self, bin_width: int = 100):
+        """Count books per page-count bin of bin_width pages"""
+        if not len(self):
+            return []
+        if np is not None:
+            # np.unique rather than np.bincount, whose array would be as long as the largest
+            # page count: one bogus Open Library value with bin_width=1 could take gigabytes
+            bins, counts = np.unique(np.frombuffer(self.page_count, dtype=np.int64).clip(0) // bin_width,
+                                     return_counts=True)
+            bins = {int(i): int(count) for i, count in zip(bins, counts)}
+        else:
+            bins = Counter(max(pages, 0) // bin_width for pages in self.page_count)
+        return [{"min_pages": i * bin_width, "max_pages": (i + 1) * bin_width - 1, "books": bins[i]}
+                for i in sorted(bins)]
+
+    def publish_year_histogram(self):
+        """Count books per publish year; books without a parseable year are under 0"""
+        if not len(self):
+            return {}
+        if np is not None:
+            years, counts = np.unique(np.frombuffer(self.publish_year, dtype=np.int16), return_counts=True)
+            return {int(year): int(count) for year, count in zip(years, counts)}
+        return dict(sorted(Counter(self.publish_year).items()))
+
+    def _group_totals(self, codes: array, dictionary: StringDictionary, top: int = None):
+        size = len(dictionary.values)
+        if not len(self):
+            return []
+        if np is not None:
+            keys = np.frombuffer(codes, dtype=np.dtype(f"i{codes.itemsize}"))
+            books = np.bincount(keys, minlength=size)
+            pages = np.bincount(keys, weights=np.frombuffer(self.page_count, dtype=np.int64), minlength=size)
+            borrowed = np.bincount(keys[np.frombuffer(self.borrowed, dtype=np.bool_)], minlength=size)
+            order = np.argsort(-books, kind="stable")
+            order = order[books[order] > 0][:top]
+            rows = [(int(code), int(books[code]), int(pages[code]), int(borrowed[code])) for code in order]
+        else:
+            books, pages, borrowed = [0] * size, [0] * size, [0] * size
+            for code, page_count, is_borrowed in zip(codes, self.page_count, self.borrowed):
+                books[code] += 1
+                pages[code] += page_count
+                borrowed[code] += is_borrowed
+            order = sorted((code for code in range(size) if books[code]), key=lambda code: -books[code])[:top]
+            rows = [(code, books[code], pages[code], borrowed[code]) for code in order]
+        return [{"name": dictionary.values[code], "books": count, "pages": page_total, "borrowed": borrowed_count}
+                for code, count, page_total, borrowed_count in rows]
+
+    def publisher_totals(self, top: int = None):
+        """Books, pages and borrowed books per publisher, largest first"""
+        return self._group_totals(self.publisher, self.publishers, top)
+
+    def author_totals(self, top: int = None):
+        """Books, pages and borrowed books per author, largest first"""
+        return self._group_totals(self.author, self.authors, top)
@@ -0,0 +1,202 @@
+"""Seed the catalog from Open Library dump files, without any network access.
+
+Open Library publishes its editions and authors as gzip'd dumps with one
+record per line, either tab-separated (type, key, revision, last_modified,
+JSON) or as bare JSON lines. The authors dump is read once into an on-disk
+SQLite index of key -> name. The editions dump is then streamed in batches.
+Each batch has its authors resolved with one indexed query and is added
+through Library.add_books, so memory stays bounded by the batch size however
+large the dumps are.
+
+    python ingest.py ol_dump_editions.txt.gz ol_dump_authors.txt.gz library_data.json
+"""
+import argparse
+import gzip
+import os
+import sqlite3
+import sys
+import tempfile
+
+import codec
+from library import Library, book_from_edition
+
+
+def iter_dump(path: str, record_type: str = None):
+    """Yield the JSON records of a dump file, gzip'd or not, skipping lines that are not record_type"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if b"\t" in line:
+                # type, key, revision, last_modified, JSON
+                fields = line.split(b"\t", 4)
+                if record_type is not None and fields[0].decode("utf-8") != record_type:
+                    continue
+                line = fields[-1]
+            try:
+                record = codec.loads(line)
+            except ValueError as e:
+                print(f"Skipping invalid dump line in {path}: {e}")
+                continue
+            if record_type is not None and record.get("type", {}).get("key", record_type) != record_type:
+                continue
+            yield record
+
+
+class AuthorIndex:
+    """Author key -> name, kept in SQLite so millions of authors do not have to fit in memory"""
+
+    # SQLite limits the number of parameters in one statement
+    QUERY_CHUNK = 900
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._conn = sqlite3.connect(filename)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS authors (key TEXT PRIMARY KEY, name TEXT NOT NULL)")
+
+    def load_dump(self, path: str, batch_size: int = 10000):
+        """Index every author in an authors dump. Returns the number of authors read"""
+        count = 0
+        batch = []
+        for record in iter_dump(path, "/type/author"):
+            if "key" in record and record.get("name"):
+                batch.append((record["key"], record["name"]))
+                count += 1
+            if len(batch) >= batch_size:
+                self._insert(batch)
+                batch = []
+        self._insert(batch)
+        return count
+
+    def _insert(self, rows: list):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO authors VALUES (?, ?)", rows)
+
+    def names(self, keys) -> dict:
+        """Names for the given author keys; unknown keys are left out"""
+        keys = list(set(keys))
+        names = {}
+        for i in range(0, len(keys), self.QUERY_CHUNK):
+            chunk = keys[i:i + self.QUERY_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            names.update(self._conn.execute(f"SELECT key, name FROM authors WHERE key IN ({placeholders})", chunk))
+        return names
+
+    def close(self):
+        self._conn.close()
+
+
+def edition_isbn(edition: dict):
+    """The edition's ISBN-13, or its ISBN-10 if it has none, or None"""
+    for field in ("isbn_13", "isbn_10"):
+        for isbn in edition.get(field) or ():
+            isbn = str(isbn).replace("-", "").strip()
+            if isbn:
+                return isbn
+    return None
+
+
+def author_key(edition: dict):
+    """Key of the edition's first author. Older records nest it as {"author": {"key": ...}}"""
+    for author in edition.get("authors") or ():
+        if isinstance(author, dict):
+            key = author.get("key") or (author.get("author") or {}).get("key")
+            if key:
+                return key
+    return None
+
+
+def iter_book_batches(editions_path: str, authors: AuthorIndex, batch_size: int = 10000, report=None):
+    """Yield lists of up to batch_size Books built from an editions dump, with author names filled in.
+
+    report, if given, is a dict whose editions, no_isbn and invalid counts are kept up to date.
+    """
+    report = report if report is not None else {}
+    for name in ("editions", "no_isbn", "invalid"):
+        report.setdefault(name, 0)
+    batch = []
+
+    def resolve(batch):
+        names = authors.names(key for _, _, key in batch if key is not None)
+        books = []
+        for isbn, edition, key in batch:
+            try:
+                books.append(book_from_edition(isbn, edition, names.get(key, "Unknown Author")))
+            except Exception as e:
+                report["invalid"] += 1
+                print(f"Skipping invalid edition {edition.get('key')}: {e}")
+        return books
+
+    for edition in iter_dump(editions_path, "/type/edition"):
+        report["editions"] += 1
+        isbn = edition_isbn(edition)
+        if isbn is None:
+            report["no_isbn"] += 1
+            continue
+        batch.append((isbn, edition, author_key(edition)))
+        if len(batch) >= batch_size:
+            yield resolve(batch)
+            batch = []
+    if batch:
+        yield resolve(batch)
+
+
+def ingest(library: Library, editions_path: str, authors_path: str, batch_size: int = 10000,
+           author_index: str = None, progress=None):
+    """Add every edition with an ISBN from the dumps to library, one add_books call per batch.
+
+    author_index is where the author index is built; by default a temporary
+    file that is removed afterwards. An existing index is reused as it is, so
+    it only has to be built once for several editions dumps. progress, if
+    given, is called after each batch as progress(editions_read, books_added).
+    Returns counts of editions read, books added, duplicates and skipped editions.
+    """
+    report = {"authors": 0, "editions": 0, "added": 0, "duplicates": 0, "no_isbn": 0, "invalid": 0}
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = author_index or os.path.join(directory, "authors.db")
+        build = not os.path.exists(index_path)
+        authors = AuthorIndex(index_path)
+        try:
+            if build:
+                report["authors"] = authors.load_dump(authors_path, batch_size)
+            for books in iter_book_batches(editions_path, authors, batch_size, report):
+                added = library.add_books(books)
+                report["added"] += len(added)
+                report["duplicates"] += len(books) - len(added)
+                if progress is not None:
+                    progress(report["editions"], report["added"])
+        finally:
+            authors.close()
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Load books from Open Library dump files into a library")
+    parser.add_argument("editions", help="editions dump (ol_dump_editions_*.txt.gz or JSON lines)")
+    parser.add_argument("authors", help="authors dump (ol_dump_authors_*.txt.gz or JSON lines)")
+    parser.add_argument("library", help="library file to add the books to, e.g. library_data.json")
+    parser.add_argument("--batch-size", type=int, default=10000, help="books added per batch")
+    parser.add_argument("--author-index", help="keep the author index in this SQLite file and reuse it next time")
+    args = parser.parse_args(argv)
+
+    # Journal mode appends each batch instead of rewriting the snapshot. It is
+    # compacted once at the end rather than every compact_threshold records
+    library = Library("Ingest", args.library, journal=True, shared=True, compact_threshold=sys.maxsize)
+    library.load_books()
+
+    def progress(editions, added):
+        print(f"\rEditions read: {editions}  books added: {added}", end="", flush=True)
+
+    report = ingest(library, args.editions, args.authors, args.batch_size, args.author_index, progress)
+    library.compact()
+    print(f"\nIngest finished: {report['added']} added, {report['duplicates']} already in the library, "
+          f"{report['no_isbn']} without an ISBN, {report['invalid']} invalid")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
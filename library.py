@@ -1,16 +1,93 @@
+import asyncio
+import atexit
+import bisect
 import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from enum import Enum
 import httpx
 
+import codec
+import metrics
+from cache import NegativeCache
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(fd : int):
+    """Block until this process holds the exclusive lock on fd"""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(fd : int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _file_signature(path : str):
+    """Identify a file's current version: (inode, mtime, size), or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class BookStatus(Enum):
+    AVAILABLE = "Available"
+    BORROWED = "Borrowed"
+
+
+# Looking a status up here is much cheaper than calling BookStatus(value)
+_STATUSES = {status.value: status for status in BookStatus}
+_STATUSES.update({status: status for status in BookStatus})
+
+
+def _intern(value):
+    """Share one copy of strings that repeat across many books (authors, publishers)"""
+    return sys.intern(value) if type(value) is str else value
+
+
 class Book:
+    # No per-instance __dict__: large catalogs hold millions of these
+    __slots__ = ("title", "author", "isbn", "publish_date", "publisher", "page_count", "_status")
+
     def __init__(self, title: str, author: str, isbn: str, publish_date: str, publisher: str, page_count: int, status: str = "Available"):
         self.title = title
-        self.author = author
+        self.author = _intern(author)
         self.isbn = isbn
         self.publish_date = publish_date
-        self.publisher = publisher
+        self.publisher = _intern(publisher)
         self.page_count = page_count
         self.status = status
 
+    @property
+    def status(self):
+        return self._status.value
+
+    @status.setter
+    def status(self, value):
+        try:
+            self._status = _STATUSES[value]
+        except (KeyError, TypeError):
+            raise ValueError(f"{value!r} is not a valid BookStatus") from None
+
     def __str__(self):
         return f"""\n
                 Title  :  {self.title}
@@ -34,145 +111,1363 @@ class Book:
             "publish_date" : self.publish_date,
             "publisher" : self.publisher,
             "page_count" : self.page_count,
-            "status" : self.status
+            "status" : self._status.value
         }
         return dict
     
     @staticmethod
     def from_dict(dict : dict):
-        title = dict["title"]
-        author = dict["author"]
-        isbn = dict["isbn"]
-        publish_date = dict["publish_date"]
-        publisher = dict["publisher"]
-        page_count = dict["page_count"]
-        status = dict["status"]
-        return Book(title, author, isbn, publish_date, publisher, page_count, status)
+        # Fills the slots directly: this runs once per book when a catalog loads
+        book = Book.__new__(Book)
+        book.title = dict["title"]
+        book.author = _intern(dict["author"])
+        book.isbn = dict["isbn"]
+        book.publish_date = dict["publish_date"]
+        book.publisher = _intern(dict["publisher"])
+        book.page_count = dict["page_count"]
+        book.status = dict["status"]
+        return book
+
+
+class BookList:
+    """Library._booklist: the catalog's books in the order they were added.
+
+    The books live in a dict keyed by ISBN, which keeps insertion order, so
+    removing one is O(1) rather than a scan of a list. Library passes its ISBN
+    index in as that dict, so the catalog is not stored twice.
+    """
+    __slots__ = ("books",)
+
+    def __init__(self, books : dict = None):
+        self.books = {} if books is None else books
+
+    def __len__(self):
+        return len(self.books)
+
+    def __iter__(self):
+        return iter(self.books.values())
+
+    def __contains__(self, book):
+        return self.books.get(getattr(book, "isbn", None)) is book
+
+    def __getitem__(self, position):
+        # By position, which walks the dict; for tests and debugging only
+        return list(self.books.values())[position]
+
+    def __eq__(self, other):
+        if not isinstance(other, (BookList, list)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def append(self, book : Book):
+        self.books[book.isbn] = book
+
+    def extend(self, books):
+        self.books.update({book.isbn: book for book in books})
+
+    def remove(self, book : Book):
+        # With a shared dict the ISBN index has usually dropped the entry already
+        self.books.pop(book.isbn, None)
+
+
+# Error messages kept per shard by load_shards; the rest are only counted
+MAX_SHARD_ERRORS = 100
+
+
+def _shard_error(report : dict, message : str):
+    if len(report["errors"]) < MAX_SHARD_ERRORS:
+        report["errors"].append(message)
+
+
+def _parse_shard(filename : str):
+    """Parse and validate one shard file, in a worker process of Library.load_shards.
+
+    Returns (rows, report). Rows are tuples of Book fields, which cross the
+    process boundary several times faster than pickled Books.
+    """
+    report = {"filename": filename, "books": 0, "invalid": 0, "duplicates": 0, "errors": [], "failed": None}
+    rows = []
+    seen = set()
+    try:
+        with codec.paused_gc(), open(filename, "rb") as f:
+            for i in codec.iter_array(f):
+                try:
+                    book = Book.from_dict(i)
+                    if type(book.isbn) is not str or not book.isbn:
+                        raise ValueError(f"invalid ISBN {book.isbn!r}")
+                except Exception as e:
+                    report["invalid"] += 1
+                    _shard_error(report, f"Skipping invalid book data {i!r}: {e}")
+                    continue
+                if book.isbn in seen:
+                    report["duplicates"] += 1
+                    _shard_error(report, f"Skipping duplicate ISBN: {book.isbn}")
+                    continue
+                seen.add(book.isbn)
+                rows.append((book.title, book.author, book.isbn, book.publish_date, book.publisher,
+                             book.page_count, book._status))
+    except FileNotFoundError:
+        report["failed"] = f"{filename} could not be found."
+    except json.JSONDecodeError as e:
+        # The books before the error are kept
+        report["failed"] = f"Error reading JSON file: {e}"
+    except Exception as e:
+        report["failed"] = f"Unexpected error loading books: {e}"
+    return rows, report
+
+
+def book_from_edition(isbn : str, data : dict, author : str):
+    """Build a Book from an Open Library /isbn/{isbn}.json edition record"""
+    title = data.get("title","Unknown Title")
+    publish_date = data.get("publish_date","Unknown")
+    publishers = data.get("publishers", [])
+    publisher = publishers[0] if publishers else "Unknown Publisher"
+    page_count = data.get("number_of_pages", 0)
+    return Book(title, author, isbn, publish_date, publisher, page_count)
+
+
+def book_from_bibkeys(isbn : str, alt_data : dict):
+    """Build a Book from an Open Library api/books?bibkeys= response, or None if the ISBN is missing"""
+    if f"ISBN:{isbn}" not in alt_data:
+        return None
+    book_data = alt_data[f"ISBN:{isbn}"]
+    title = book_data.get("title", "Unknown Title")
+    authors = book_data.get("authors", [])
+    author = authors[0].get("name", "Unknown Author") if authors else "Unknown Author"
+    publish_date = book_data.get("publish_date", "Unknown")
+    publishers = book_data.get("publishers", [])
+    publisher = publishers[0].get("name", "Unknown Publisher") if publishers else "Unknown Publisher"
+    page_count = book_data.get("number_of_pages", 0)
+    return Book(title, author, isbn, publish_date, publisher, page_count)
+
+
+def lookup_book(isbn : str, cache=None, not_found : NegativeCache = None):
+    """The steps of an Open Library ISBN lookup, shared by Library.add_book_isbn and OpenLibraryClient.
+
+    A generator that does no I/O itself: it yields the path of each request
+    it needs and whether to follow redirects, is sent back the httpx response or has the
+    request's error thrown in, and returns the Book, or None if the ISBN
+    could not be found. Responses are served from and stored in cache (a
+    cache.MetadataCache) when given, and ISBNs Open Library does not know are
+    added to not_found. Run it with run_lookup or run_lookup_async.
+    """
+    def get_json(path : str, check_status : bool = True, follow_redirects : bool = True):
+        if cache is not None:
+            data = cache.get(path)
+            if data is not None:
+                return data
+        response = yield (path, follow_redirects)
+        if check_status:
+            response.raise_for_status()
+        data = response.json()
+        # An empty answer (bibkeys for an unknown ISBN) goes to the short-lived negative cache instead
+        if cache is not None and response.status_code == 200 and data:
+            cache.set(path, data)
+        return data
+
+    try:
+        data = yield from get_json(f"/isbn/{isbn}.json")
+        authors = data.get("authors", [])
+
+        if authors:
+            author_key = authors[0].get("key", "")
+            # The same author is shared by many books, so this is mostly a cache hit
+            author_data = yield from get_json(f"{author_key}.json", check_status=False)
+            author = author_data.get("name", "Unknown Author")
+        else:
+            author = "Unknown Author"
+
+        return book_from_edition(isbn, data, author)
+
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 302:
+            print(f"Redirect error for ISBN {isbn}. Trying alternative method...")
+            # Try alternative URL format
+            try:
+                alt_data = yield from get_json(f"/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data",
+                                               follow_redirects=False)
+                book = book_from_bibkeys(isbn, alt_data)
+                if book is None:
+                    if not_found is not None:
+                        not_found.add(isbn)
+                    print(f"Book with ISBN {isbn} not found via alternative method")
+                return book
+            except Exception as alt_e:
+                print(f"Alternative method also failed: {alt_e}")
+        elif e.response.status_code == 404:
+            if not_found is not None:
+                not_found.add(isbn)
+            print(f"Error: Book with ISBN {isbn} not found!")
+        else:
+            print(f"HTTP Error: {e.response.status_code}")
+    except httpx.RequestError as e:
+        print(f"Connection error: {e}")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+    return None
+
+
+def run_lookup(steps, get):
+    """Run a lookup_book generator, making each request with get(path, follow_redirects=...)"""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                with metrics.UPSTREAM_FETCH_SECONDS.time():
+                    response = get(request[0], follow_redirects=request[1])
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_lookup_async(steps, get):
+    """Like run_lookup, for a get that is a coroutine function"""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                with metrics.UPSTREAM_FETCH_SECONDS.time():
+                    response = await get(request[0], follow_redirects=request[1])
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
 
 
 class Library:
 
-    def __init__(self, name: str, filename: str):
+    def __init__(self, name: str, filename: str, journal: bool = False, compact_threshold: int = 10000, storage=None,
+                 metadata_cache=None, shared: bool = False, write_behind: bool = False,
+                 flush_interval: float = 0.1, flush_every: int = 1000):
+        if write_behind and shared:
+            raise ValueError("write_behind cannot be combined with shared: other processes would miss unflushed changes")
         self.name = name
-        self._booklist = []
+        self._isbn_index = {}
+        self._booklist = BookList(self._isbn_index)
+        # ISBNs in sorted order for cursor pagination; built on first use, None while stale
+        self._sorted_isbns = None
+        # Counters maintained on every add, remove and status change so stats() is O(1)
+        self._borrowed_count = 0
+        self._publisher_counts = Counter()
+        self._author_counts = Counter()
+        # Optional secondary indexes kept in sync with the catalog. Each has
+        # add/remove/set_status/clear; see enable_columns() and enable_search().
+        # Books are added to them in order and removed in reverse order, so the
+        # book ids the search indexes share (always first) outlive their postings.
+        self._views = []
+        self._book_ids = None
+        self._columns = None
+        self._search_index = None
+        self._fuzzy_index = None
         self.filename = filename
+        # A storage backend (see storage.py) replaces the JSON file; .db files get SQLite
+        if storage is None and filename.endswith((".db", ".sqlite", ".sqlite3")):
+            from storage import SQLiteStorage
+            storage = SQLiteStorage(filename)
+        self.storage = storage
+        # .snap files hold a binary snapshot that is memory-mapped instead of parsed (see snapshot.py)
+        self.binary_snapshot = storage is None and filename.endswith(".snap")
+        # Optional cache.MetadataCache for Open Library responses
+        self.metadata_cache = metadata_cache
+        # ISBNs add_book_isbn recently found missing from Open Library
+        self.not_found = NegativeCache()
+        # In journal mode each mutation is appended to <filename>.journal and the
+        # snapshot in <filename> is only rewritten when the journal is compacted
+        self.journal = journal
+        self.journal_filename = filename + ".journal"
+        self.compact_threshold = compact_threshold
+        self._journal_records = 0
+        self._compaction_thread = None
+        # Guards the in-memory catalog and the order of writes within this process
+        self._lock = threading.RLock()
+        # A shared library may be written by several processes (e.g. uvicorn
+        # workers). Every mutation then holds a lock on <filename>.lock and first
+        # catches up with whatever the other processes wrote.
+        self.shared = shared
+        self.lock_filename = filename + ".lock"
+        self._lock_fd = None
+        self._file_locked = False
+        self._snapshot_signature = None
+        self._storage_changed = False
+        # Set except while load_books(background=True) runs
+        self._loaded = threading.Event()
+        self._loaded.set()
+        self._loader = None
+        self.load_progress = None
+        self._compacting_signature = None
+        self._journal_inode = None
+        self._journal_offset = 0
+        # The (inode, size) of the last journal another process compacted away
+        # that this one has already read to the end (see _follow_compaction)
+        self._followed_rotation = None
+        # Bumped after every change to the in-memory catalog, so readers can tell
+        # whether anything changed (the API derives ETags from it). A reader that
+        # reads it before looking at the catalog never pairs a version with older data.
+        self.version = 0
+        # In write-behind mode mutations only queue their records; a flusher
+        # thread persists them together every flush_interval seconds or as soon
+        # as flush_every have queued, trading the newest changes on a crash for
+        # mutations that never wait on the disk. close() flushes what is left.
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self._pending = []
+        self._flush_wakeup = threading.Condition(self._lock)
+        self._closing = False
+        self._flusher = None
+        self.flushes = 0
+        self.flushed_changes = 0
+        self.last_flush_seconds = 0.0
+        self.flush_seconds_total = 0.0
+        if write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    @contextmanager
+    def _exclusive(self, sync : bool = True):
+        """Hold the catalog lock and, for a shared library, the lock file.
+
+        The outermost holder of a shared library first catches up with what
+        other processes wrote, so changes always apply to the latest catalog.
+        """
+        if not self._loaded.is_set() and threading.current_thread() is not self._loader:
+            self._loaded.wait()
+        with self._lock:
+            if not self.shared or self._file_locked:
+                yield
+                return
+            if self._lock_fd is None:
+                self._lock_fd = os.open(self.lock_filename, os.O_RDWR | os.O_CREAT)
+            _lock_file(self._lock_fd)
+            self._file_locked = True
+            try:
+                if sync:
+                    self._catch_up()
+                yield
+            finally:
+                self._snapshot_signature = _file_signature(self.filename)
+                self._compacting_signature = _file_signature(self.journal_filename + ".compacting")
+                self._file_locked = False
+                _unlock_file(self._lock_fd)
+
+    def sync(self):
+        """Pick up books other processes added, removed or lent out since the last call (shared libraries only).
+
+        The lock file is only taken when has_external_changes() finds something new.
+        If the catalog has to be reloaded, the new one is built before taking any
+        lock and swapped in at the end, so readers keep seeing the old one meanwhile.
+        """
+        if not self.has_external_changes():
+            return
+        fresh = None
+        if self.storage is None and self._needs_reload():
+            fresh = self._load_aside()
+        with self._exclusive(sync=False):
+            self._catch_up(fresh)
+
+    def version_and_position(self):
+        """The catalog version, read together with where the catalog stands on disk.
+
+        The version counts this process's changes. The position identifies the
+        persisted changes the catalog reflects, so it is the same in every process
+        that has caught up with them (the API derives shared ETags from it). It
+        is None unless the library is shared and loaded.
+        """
+        with self._lock:
+            if not self.shared or self.loading:
+                return self.version, None
+            if self.storage is not None:
+                return self.version, self.storage.position()
+            return self.version, (self._snapshot_signature, self._compacting_signature,
+                                  self._journal_inode, self._journal_offset)
+
+    def has_external_changes(self):
+        """Whether another process changed a shared library since this one last caught up.
+
+        Only stats the snapshot and journal (or asks the storage backend), without
+        any lock, so it is cheap enough to call before every request. A change
+        that races with the check is picked up by the next call or mutation.
+        """
+        if not self.shared or self.loading:
+            return False
+        if self.storage is not None:
+            # The backend reports a change once, so it is remembered until the catch-up
+            self._storage_changed = self._storage_changed or self.storage.has_external_changes()
+            return self._storage_changed
+        if (_file_signature(self.filename) != self._snapshot_signature
+                or _file_signature(self.journal_filename + ".compacting") != self._compacting_signature):
+            return True
+        journal = _file_signature(self.journal_filename)
+        if (journal[0] if journal else None) != self._journal_inode:
+            return True
+        return journal is not None and journal[2] > self._journal_offset
+
+    def _catch_up(self, fresh=None):
+        # Caller holds the lock file. New journal lines (or the storage
+        # backend's logged changes) are replayed on their own and another
+        # process's compaction is followed without rereading anything. Anything
+        # else means a reload, built aside (or taken from fresh, a _load_aside()
+        # made before the lock was taken) and swapped in.
+        if self.storage is not None:
+            if self._storage_changed or self.storage.has_external_changes():
+                self._storage_changed = False
+                records = self.storage.changes()
+                if records is None:
+                    self._adopt(self._load_aside())
+                    return
+                for record in records:
+                    self._apply_record(record)
+            return
+        snapshot = _file_signature(self.filename)
+        if self._snapshot_changed(snapshot) and not self._follow_compaction(snapshot):
+            if fresh is None or fresh._snapshot_changed(snapshot):
+                # Nothing changes on disk while the lock file is held, so this load is current
+                fresh = self._load_aside()
+            self._adopt(fresh)
+        journal = _file_signature(self.journal_filename)
+        if journal is not None and journal[2] > self._journal_offset:
+            self._journal_inode = journal[0]
+            self._journal_offset = self._replay_journal_file(self.journal_filename, self._journal_offset)
+
+    def _snapshot_changed(self, snapshot):
+        # Whether the snapshot, the .compacting file or the journal file itself is
+        # no longer what this process read. A journal that appeared since it last
+        # looked is not a change: it is read from the start.
+        if snapshot != self._snapshot_signature:
+            return True
+        if _file_signature(self.journal_filename + ".compacting") != self._compacting_signature:
+            return True
+        journal = _file_signature(self.journal_filename)
+        return journal is not None and self._journal_inode not in (None, journal[0])
+
+    def _needs_reload(self):
+        # A guess made without any lock, so sync() can load a new catalog before
+        # taking it; _catch_up decides again under the lock
+        snapshot = _file_signature(self.filename)
+        return self._snapshot_changed(snapshot) and self._rotation_to_follow(snapshot) is None
+
+    def _rotation_to_follow(self, snapshot):
+        # Compaction leaves the catalog as it was. Each one records the journal
+        # it rotated aside in <journal>.rotated: its inode and size, and the
+        # snapshot before and after. If this process had read that journal up to
+        # the end, or can read the rest from .compacting, it can move on to the
+        # new journal. Returns the rotated (inode, size), or None if it cannot.
+        try:
+            with open(self.journal_filename + ".rotated", "rb") as f:
+                rotation = codec.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        rotated = tuple(rotation["journal"])
+        base, compacted = (tuple(signature) if signature else None for signature in (rotation["base"], rotation["snapshot"]))
+        if snapshot not in (base, compacted):
+            return None
+        if rotated == self._followed_rotation:
+            journal = _file_signature(self.journal_filename)
+            return rotated if journal is None or self._journal_inode in (None, journal[0]) else None
+        inode, size = rotated
+        if self._snapshot_signature != base or self._journal_inode != inode or self._journal_offset > size:
+            return None
+        if self._journal_offset < size:
+            compacting = _file_signature(self.journal_filename + ".compacting")
+            if compacting is None or compacting[0] != inode:
+                return None
+        return rotated
+
+    def _follow_compaction(self, snapshot):
+        # Caller holds the lock file. Returns False if the catalog has to be reloaded
+        rotated = self._rotation_to_follow(snapshot)
+        if rotated is None:
+            return False
+        if rotated != self._followed_rotation:
+            if self._journal_offset < rotated[1]:
+                self._replay_journal_file(self.journal_filename + ".compacting", self._journal_offset)
+            self._followed_rotation = rotated
+            self._journal_inode = None
+            self._journal_offset = 0
+            self._journal_records = 0
+        return True
+
+    def _load_aside(self):
+        """Load the snapshot and journal into a new Library with the same views, without touching this one.
+
+        The new library remembers the snapshot and .compacting it read, so
+        _catch_up can tell whether it is still current before adopting it.
+        Returns None if they changed while it loaded.
+        """
+        fresh = Library(self.name, self.filename, journal=self.journal, storage=self.storage)
+        for view in self._views:
+            if view is self._columns:
+                fresh.enable_columns()
+            elif view is self._search_index:
+                fresh.enable_search()
+            elif view is self._fuzzy_index:
+                fresh.enable_fuzzy_search()
+        snapshot = _file_signature(self.filename)
+        compacting = _file_signature(self.journal_filename + ".compacting")
+        with codec.paused_gc():
+            fresh._reload()
+        if self.storage is not None:
+            return fresh
+        if _file_signature(self.filename) != snapshot or _file_signature(self.journal_filename + ".compacting") != compacting:
+            # Another process compacted meanwhile
+            return None
+        fresh._snapshot_signature = snapshot
+        fresh._compacting_signature = compacting
+        return fresh
+
+    def _adopt(self, fresh):
+        # Caller holds the lock. Swaps in the catalog, views and journal position fresh loaded
+        for name in ("_isbn_index", "_booklist", "_sorted_isbns", "_borrowed_count", "_publisher_counts",
+                     "_author_counts", "_views", "_book_ids", "_columns", "_search_index", "_fuzzy_index",
+                     "_journal_inode", "_journal_offset", "_journal_records"):
+            setattr(self, name, getattr(fresh, name))
+        self._followed_rotation = None
+        self.version += 1
+
+    def _register(self, book : Book):
+        """Add a book to the in-memory catalog and its ISBN index"""
+        self._booklist.append(book)
+        self._isbn_index[book.isbn] = book
+        if self._sorted_isbns is not None:
+            bisect.insort(self._sorted_isbns, book.isbn)
+        if book.status == "Borrowed":
+            self._borrowed_count += 1
+        if self._publisher_counts is not None:
+            self._publisher_counts[book.publisher] += 1
+            self._author_counts[book.author] += 1
+        for view in self._views:
+            view.add(book)
+        self.version += 1
+
+    def _register_many(self, books : list):
+        """Like _register for a batch of books whose ISBNs are new to the catalog and to each other"""
+        self._booklist.extend(books)
+        self._isbn_index.update({book.isbn: book for book in books})
+        self._sorted_isbns = None
+        self._borrowed_count += sum(1 for book in books if book._status is BookStatus.BORROWED)
+        if self._publisher_counts is not None:
+            self._publisher_counts.update(book.publisher for book in books)
+            self._author_counts.update(book.author for book in books)
+        for view in self._views:
+            for book in books:
+                view.add(book)
+        self.version += 1
+
+    def _unregister(self, book : Book):
+        """Remove a book from the in-memory catalog and its ISBN index"""
+        del self._isbn_index[book.isbn]
+        self._booklist.remove(book)
+        if self._sorted_isbns is not None:
+            del self._sorted_isbns[bisect.bisect_left(self._sorted_isbns, book.isbn)]
+        if book.status == "Borrowed":
+            self._borrowed_count -= 1
+        if self._publisher_counts is not None:
+            self._discount(self._publisher_counts, book.publisher)
+            self._discount(self._author_counts, book.author)
+        for view in reversed(self._views):
+            view.remove(book)
+        self.version += 1
+
+    @staticmethod
+    def _discount(counter : Counter, key : str):
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+
+    def _set_status(self, book : Book, status : str):
+        """Change a book's status and keep the borrowed counter in sync"""
+        if book.status == "Borrowed":
+            self._borrowed_count -= 1
+        book.status = status
+        if book.status == "Borrowed":
+            self._borrowed_count += 1
+        for view in self._views:
+            view.set_status(book)
+        self.version += 1
+
+    def enable_columns(self):
+        """Build a columnar view of the catalog that is kept in sync from now on, and return it"""
+        with self._lock:
+            if self._columns is None:
+                from columnar import CatalogColumns
+                self._columns = CatalogColumns(self._booklist)
+                self._views.append(self._columns)
+        return self._columns
+
+    @property
+    def columns(self):
+        """The columnar analytics view, built on first access"""
+        return self.enable_columns()
+
+    def advanced_stats(self, bin_width : int = 100, top : int = 20):
+        """Summary, histograms and top publishers/authors from the columnar view, computed under the catalog lock"""
+        with self._lock:
+            # Looked up under the lock, as catching up with another process may swap the view
+            columns = self.enable_columns()
+            return {
+                "summary": columns.summary(),
+                "page_count_histogram": columns.page_count_histogram(bin_width),
+                "publish_year_histogram": columns.publish_year_histogram(),
+                "top_publishers": columns.publisher_totals(top),
+                "top_authors": columns.author_totals(top)
+            }
+
+    def _shared_book_ids(self):
+        # Caller holds the lock. The integer book ids both search indexes post, built once
+        if self._book_ids is None:
+            from search import BookIds
+            self._book_ids = BookIds(self._booklist)
+            self._views.insert(0, self._book_ids)
+        return self._book_ids
+
+    def enable_search(self):
+        """Build a full-text index over title, author and publisher that is kept in sync from now on"""
+        with self._lock:
+            if self._search_index is None:
+                from search import SearchIndex
+                self._search_index = SearchIndex(self._booklist, self._shared_book_ids())
+                self._views.append(self._search_index)
+        return self._search_index
+
+    def search(self, query : str, limit : int = 20):
+        """Return [(score, book)] for books whose title, author or publisher match every word of query"""
+        with self._lock:
+            return self.enable_search().search(query, limit)
+
+    def enable_fuzzy_search(self):
+        """Build a typo-tolerant trigram index over title and author words that is kept in sync from now on"""
+        with self._lock:
+            if self._fuzzy_index is None:
+                from search import FuzzyIndex
+                self._fuzzy_index = FuzzyIndex(self._booklist, book_ids=self._shared_book_ids())
+                self._views.append(self._fuzzy_index)
+        return self._fuzzy_index
+
+    def fuzzy_search(self, query : str, field : str = None, limit : int = 10):
+        """Return [(score, field, book)] for books whose title or author words are close to query"""
+        with self._lock:
+            return self.enable_fuzzy_search().search(query, field, limit)
+
+    def get_book(self, isbn : str):
+        """Return the book with the given ISBN, or None if it is not in the library"""
+        return self._isbn_index.get(isbn)
+
+    def books_page(self, after_isbn : str = None, limit : int = 100):
+        """Return up to limit books in ISBN order, starting after after_isbn"""
+        with self._lock:
+            if self._sorted_isbns is None:
+                self._sorted_isbns = sorted(self._isbn_index)
+            start = 0 if after_isbn is None else bisect.bisect_right(self._sorted_isbns, after_isbn)
+            return [self._isbn_index[isbn] for isbn in self._sorted_isbns[start:start + limit]]
+
+    def iter_books(self, after_isbn : str = None, limit : int = None, chunk_size : int = 1000):
+        """Yield books in ISBN order one page at a time, without copying the whole catalog"""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page = self.books_page(after_isbn, chunk_size if remaining is None else min(chunk_size, remaining))
+            if not page:
+                return
+            yield from page
+            after_isbn = page[-1].isbn
+            if remaining is not None:
+                remaining -= len(page)
+    
+    def _persist(self, record : dict):
+        """Persist a single mutation: a backend write, a journal append in journal mode, a full save otherwise"""
+        self._persist_batch([record])
+
+    def _persist_batch(self, records : list):
+        """Persist several mutations with one backend transaction, journal write or save. Caller holds the lock"""
+        if not records:
+            return
+        if self.write_behind:
+            was_empty = not self._pending
+            self._pending.extend(records)
+            # The first queued change starts the flush_interval countdown; flush_every cuts it short
+            if was_empty or len(self._pending) >= self.flush_every:
+                self._flush_wakeup.notify()
+            return
+        self._write_records(records)
+
+    def _write_records(self, records : list):
+        if self.storage is not None:
+            with metrics.PERSISTENCE_SECONDS.time("storage"):
+                self.storage.write_batch(records)
+            return
+        if not self.journal:
+            self.save_books()
+            return
+        self._append_journal(records)
+        if self._journal_records >= self.compact_threshold:
+            self._start_compaction(background=True)
+
+    def _append_journal(self, records : list):
+        lines = codec.dump_lines(records)
+        with metrics.PERSISTENCE_SECONDS.time("journal"), open(self.journal_filename, "ab") as f:
+            f.write(lines)
+            # Remember how far this process has read so sync() only replays what others append
+            self._journal_offset = f.tell()
+            self._journal_inode = os.fstat(f.fileno()).st_ino
+        self._journal_records += len(records)
+
+    def _flush_loop(self):
+        with self._flush_wakeup:
+            while True:
+                self._flush_wakeup.wait_for(lambda: self._pending or self._closing)
+                if self._closing:
+                    return
+                # Let changes gather for up to flush_interval so they go out together
+                self._flush_wakeup.wait_for(lambda: len(self._pending) >= self.flush_every or self._closing,
+                                            self.flush_interval)
+                if not self._flush_pending():
+                    # Retry after a pause instead of spinning on a failing disk
+                    self._flush_wakeup.wait(self.flush_interval)
+
+    def _flush_pending(self):
+        # Caller holds the lock. Returns False if the write failed; the records stay queued
+        records, self._pending = self._pending, []
+        if not records:
+            return True
+        start = time.perf_counter()
+        try:
+            self._write_records(records)
+        except Exception as e:
+            self._pending[:0] = records
+            print(f"Error flushing {len(records)} changes: {e}")
+            return False
+        self.last_flush_seconds = time.perf_counter() - start
+        self.flush_seconds_total += self.last_flush_seconds
+        self.flushes += 1
+        self.flushed_changes += len(records)
+        return True
+
+    def flush(self):
+        """Write out the changes queued in write-behind mode now"""
+        with self._lock:
+            return self._flush_pending()
+
+    def close(self):
+        """Stop the write-behind flusher and flush what is still queued. Later changes are persisted synchronously"""
+        with self._lock:
+            self._closing = True
+            self._flush_wakeup.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            self.write_behind = False
+            self._flush_pending()
+
+    def persistence_stats(self):
+        """Counters for the write-behind queue and the flushes done so far"""
+        with self._lock:
+            return {
+                "write_behind": self.write_behind,
+                "pending_changes": len(self._pending),
+                "flushes": self.flushes,
+                "flushed_changes": self.flushed_changes,
+                "last_flush_seconds": self.last_flush_seconds,
+                "flush_seconds_total": self.flush_seconds_total
+            }
+
+    def _apply_record(self, record : dict):
+        """Apply a journal record to the in-memory catalog"""
+        op = record["op"]
+        if op == "add":
+            book = Book.from_dict(record["book"])
+            existing = self._isbn_index.get(book.isbn)
+            if existing is not None:
+                self._unregister(existing)
+            self._register(book)
+        elif op == "remove":
+            existing = self._isbn_index.get(record["isbn"])
+            if existing is not None:
+                self._unregister(existing)
+        elif op == "status":
+            existing = self._isbn_index.get(record["isbn"])
+            if existing is not None:
+                self._set_status(existing, record["status"])
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
     
     def add_book(self, book : Book):
-        self._booklist.append(book)
-        self.save_books()
+        with self._exclusive():
+            if book.isbn in self._isbn_index:
+                return False
+            self._register(book)
+            self._persist({"op": "add", "book": book.to_dict()})
+        return True
+
+    def add_books(self, books):
+        """Add many books with a single save. Returns the books that were added; duplicate ISBNs are skipped"""
+        with self._exclusive():
+            new_books = {}
+            for book in books:
+                if book.isbn not in self._isbn_index and book.isbn not in new_books:
+                    new_books[book.isbn] = book
+            added = list(new_books.values())
+            self._register_many(added)
+            self._persist_batch([{"op": "add", "book": book.to_dict()} for book in added])
+        return added
     
     def add_book_isbn(self, isbn : str):
-        
-        OPEN_LIBRARY_URL = f"https://openlibrary.org/isbn/{isbn}.json"
+        """Fetch a book from Open Library and add it. Returns the new Book, or None on failure"""
+        if isbn in self._isbn_index:
+            print(f"Book with ISBN {isbn} is already in the library")
+            return None
+        if isbn in self.not_found:
+            print(f"Error: Book with ISBN {isbn} not found! (checked recently)")
+            return None
+
+        book = run_lookup(lookup_book(isbn, self.metadata_cache, self.not_found), self._get)
+        if book is None:
+            return None
         try:
-            # Add timeout and explicit redirect following
-            response = httpx.get(OPEN_LIBRARY_URL, timeout=10.0, follow_redirects=True)
-            response.raise_for_status()
-            data = response.json()
-            title = data.get("title","Unknown Title")
-            authors = data.get("authors", [])
-
-            if authors:
-                author_key = authors[0].get("key", "")
-                
-                author_response = httpx.get(f"https://openlibrary.org{author_key}.json", timeout=10.0, follow_redirects=True)
-                author_data = author_response.json()
-                author = author_data.get("name", "Unknown Author")
-            else:
-                author = "Unknown Author"
-            
-            publish_date = data.get("publish_date","Unknown")
-            publishers = data.get("publishers", [])
-            publisher = publishers[0] if publishers else "Unknown Publisher"
-            page_count = data.get("number_of_pages", 0)
-            
-            book = Book(title, author, isbn, publish_date, publisher, page_count)    
-            self._booklist.append(book)
-            self.save_books()
-            print(f"Book successfully added: {title}")
-            
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 302:
-                print(f"Redirect error for ISBN {isbn}. Trying alternative method...")
-                # Try alternative URL format
-                try:
-                    alt_url = f"https://openlibrary.org/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data"
-                    alt_response = httpx.get(alt_url, timeout=10.0)
-                    alt_response.raise_for_status()
-                    alt_data = alt_response.json()
-                    
-                    if f"ISBN:{isbn}" in alt_data:
-                        book_data = alt_data[f"ISBN:{isbn}"]
-                        title = book_data.get("title", "Unknown Title")
-                        authors = book_data.get("authors", [])
-                        author = authors[0].get("name", "Unknown Author") if authors else "Unknown Author"
-                        publish_date = book_data.get("publish_date", "Unknown")
-                        publishers = book_data.get("publishers", [])
-                        publisher = publishers[0].get("name", "Unknown Publisher") if publishers else "Unknown Publisher"
-                        page_count = book_data.get("number_of_pages", 0)
-                        
-                        book = Book(title, author, isbn, publish_date, publisher, page_count)
-                        self._booklist.append(book)
-                        self.save_books()
-                        print(f"Book successfully added via alternative method: {title}")
-                    else:
-                        print(f"Book with ISBN {isbn} not found via alternative method")
-                except Exception as alt_e:
-                    print(f"Alternative method also failed: {alt_e}")
-            elif e.response.status_code == 404:
-                print(f"Error: Book with ISBN {isbn} not found!")
-            else:
-                print(f"HTTP Error: {e.response.status_code}")
-        except httpx.RequestError as e:
-            print(f"Connection error: {e}")
-        except httpx.ConnectError as e:
-            print("Network connection error")
+            # Another thread or process may have added it while Open Library was queried
+            if not self.add_book(book):
+                print(f"Book with ISBN {isbn} is already in the library")
+                return None
         except Exception as e:
             print(f"Unexpected error: {e}")
+            return None
+        print(f"Book successfully added: {book.title}")
+        return book
+
+    @staticmethod
+    def _get(path : str, follow_redirects : bool = True):
+        # Add timeout and explicit redirect following
+        return httpx.get(f"https://openlibrary.org{path}", timeout=10.0, follow_redirects=follow_redirects)
+
+    async def add_book_isbn_async(self, isbn : str, client):
+        """Like add_book_isbn, but fetches through an OpenLibraryClient without blocking the event loop"""
+        if isbn in self._isbn_index:
+            print(f"Book with ISBN {isbn} is already in the library")
+            return None
+        book = await client.fetch_book(isbn)
+        # Adding may wait for the lock file, so it runs in a thread rather than on the event loop
+        if book is None or not await asyncio.to_thread(self.add_book, book):
+            return None
+        print(f"Book successfully added: {book.title}")
+        return book
     
+    async def import_isbns(self, isbns, client, workers : int = None, batch_size : int = 500):
+        """Resolve ISBNs concurrently and add them in batches.
+
+        Yields a {"isbn", "success", "message"} report per ISBN as soon as its
+        outcome is known; added books are reported once their batch is saved.
+        If iterating isbns raises, the ISBNs read before are still imported and
+        the error is raised afterwards.
+        """
+        workers = workers or client.max_concurrency
+        todo = asyncio.Queue(maxsize=workers * 2)
+        results = asyncio.Queue()
+
+        async def feed():
+            seen = set()
+            error = None
+            try:
+                for isbn in isbns:
+                    isbn = isbn.strip()
+                    if not isbn:
+                        continue
+                    if isbn in seen or isbn in self._isbn_index:
+                        await results.put((isbn, None, "Book is already in the library"))
+                        continue
+                    seen.add(isbn)
+                    await todo.put(isbn)
+            except Exception as e:
+                # Reading the ISBNs failed (e.g. a badly encoded file): the workers
+                # still finish what they have, then the error reaches the caller
+                error = e
+            for _ in range(workers):
+                await todo.put(None)
+            if error is not None:
+                raise error
+
+        async def work():
+            while (isbn := await todo.get()) is not None:
+                book = await client.fetch_book(isbn)
+                await results.put((isbn, book, None if book else "Book not found in Open Library"))
+            await results.put(None)
+
+        tasks = [asyncio.create_task(feed())] + [asyncio.create_task(work()) for _ in range(workers)]
+        pending = []
+
+        def commit():
+            added = {book.isbn for book in self.add_books(pending)}
+            reports = [{"isbn": book.isbn, "success": book.isbn in added,
+                        "message": book.title if book.isbn in added else "Book is already in the library"}
+                       for book in pending]
+            pending.clear()
+            return reports
+
+        try:
+            running = workers
+            while running:
+                item = await results.get()
+                if item is None:
+                    running -= 1
+                    continue
+                isbn, book, message = item
+                if book is None:
+                    yield {"isbn": isbn, "success": False, "message": message}
+                    continue
+                pending.append(book)
+                if len(pending) >= batch_size:
+                    for report in await asyncio.to_thread(commit):
+                        yield report
+            for report in await asyncio.to_thread(commit):
+                yield report
+            # Raises the error that stopped feed(), if any
+            await tasks[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
     def remove_book(self, isbn : str):
-        for i, book in enumerate(self._booklist):
-            if book.isbn == isbn: 
-                del self._booklist[i]
-                self.save_books()
-                return True
-        return False
+        with self._exclusive():
+            book = self._isbn_index.get(isbn)
+            if book is None:
+                return False
+            self._unregister(book)
+            self._persist({"op": "remove", "isbn": isbn})
+        return True
+
+    def borrow_book(self, isbn : str):
+        """Mark a book as borrowed. Returns False if it is missing or already borrowed"""
+        return self._change_statuses([isbn], "Borrowed")[0]["success"]
+
+    def return_book(self, isbn : str):
+        """Mark a book as available again. Returns False if it is missing or not borrowed"""
+        return self._change_statuses([isbn], "Available")[0]["success"]
+
+    def borrow_books(self, isbns):
+        """Borrow many books with a single save. Returns a {"isbn", "success", "message"} report per ISBN"""
+        return self._change_statuses(isbns, "Borrowed")
+
+    def return_books(self, isbns):
+        """Return many books with a single save. Returns a {"isbn", "success", "message"} report per ISBN"""
+        return self._change_statuses(isbns, "Available")
+
+    def _change_statuses(self, isbns, status : str):
+        reports = []
+        records = []
+        with self._exclusive():
+            for isbn in isbns:
+                book = self._isbn_index.get(isbn)
+                if book is None:
+                    reports.append({"isbn": isbn, "success": False, "message": "Book not found in the library"})
+                elif book.status == status:
+                    reports.append({"isbn": isbn, "success": False, "message": f"Book is already {status.lower()}"})
+                else:
+                    self._set_status(book, status)
+                    records.append({"op": "status", "isbn": isbn, "status": status})
+                    reports.append({"isbn": isbn, "success": True, "message": book.title})
+            self._persist_batch(records)
+        return reports
     
     def list_books(self):
-        for book in self._booklist:
+        with self._lock:
+            books = list(self._booklist)
+        for book in books:
             print(book)
     
     def find_book(self, isbn : str):
-        for i, book in enumerate(self._booklist):
-            if book.isbn == isbn : 
-                print(book)
-                return True
+        book = self._isbn_index.get(isbn)
+        if book is not None:
+            print(book)
+            return True
         print("The book was not found in this library")
         return False
     
-    def load_books(self):
-        self._booklist.clear()
+    def stats(self):
+        """Return total, available and borrowed book counts from the maintained counters.
+
+        Status changes are only counted when they go through borrow_book/return_book.
+        """
+        with self._lock:
+            total_books = len(self._isbn_index)
+            borrowed_books = self._borrowed_count
+        return {
+            "total_books": total_books,
+            "available_books": total_books - borrowed_books,
+            "borrowed_books": borrowed_books
+        }
+
+    def publisher_counts(self):
+        """Return the number of books per publisher"""
+        with self._lock:
+            self._count_fields()
+            return dict(self._publisher_counts)
+
+    def author_counts(self):
+        """Return the number of books per author"""
+        with self._lock:
+            self._count_fields()
+            return dict(self._author_counts)
+
+    def _count_fields(self):
+        # A mapped snapshot counts its publishers and authors on first use rather than at startup
+        if self._publisher_counts is None:
+            self._publisher_counts = self._booklist.counts("publisher")
+            self._author_counts = self._booklist.counts("author")
+
+    def load_books(self, progress=None, background : bool = False, batch_size : int = 10000):
+        """Load the catalog from the storage backend, or from the snapshot and journal.
+
+        The snapshot is parsed one record at a time and registered in batches of
+        batch_size books. progress, if given, is called after every batch as
+        progress(books_loaded, bytes_read, total_bytes). With background=True
+        loading runs in a thread that is returned: reads see the books loaded so
+        far and changes wait until loading is done.
+        """
+        # Queued changes are written first so reloading does not drop them
+        self.flush()
+        if not background:
+            with self._exclusive(sync=False), codec.paused_gc(), metrics.PERSISTENCE_SECONDS.time("load"):
+                self._reload(progress, batch_size)
+            return None
+        self._loaded.clear()
+        self._loader = threading.Thread(target=self._load_in_background, args=(progress, batch_size), daemon=True)
+        self._loader.start()
+        return self._loader
+
+    @property
+    def loading(self):
+        """True while load_books(background=True) is still running"""
+        return not self._loaded.is_set()
+
+    def wait_until_loaded(self, timeout : float = None):
+        """Block until a background load has finished; returns False on timeout"""
+        return self._loaded.wait(timeout)
+
+    def _load_in_background(self, progress, batch_size : int):
         try:
-            with open(self.filename, "r") as f:
-                booklist_json = json.load(f)
-            for i in booklist_json:
+            with codec.paused_gc(), metrics.PERSISTENCE_SECONDS.time("load"):
+                self._reload(progress, batch_size)
+        except Exception as e:
+            print(f"Unexpected error loading books: {e}")
+        finally:
+            self._loaded.set()
+
+    def _reset(self):
+        # Caller holds the lock. Empties the catalog, its counters and its views
+        self._isbn_index = {}
+        self._booklist = BookList(self._isbn_index)
+        self._sorted_isbns = None
+        self._borrowed_count = 0
+        self._publisher_counts = Counter()
+        self._author_counts = Counter()
+        for view in self._views:
+            view.clear()
+        self.version += 1
+
+    def _reload(self, progress=None, batch_size : int = 10000):
+        # The lock is taken batch by batch, so a background load lets readers in between
+        with self._exclusive(sync=False):
+            self._reset()
+            if self.binary_snapshot:
+                self._map_snapshot()
+                self.version += 1
+                if self.journal:
+                    self._replay_journal()
+                return
+            if self.storage is not None:
                 try:
-                    book = Book.from_dict(i)
-                    self._booklist.append(book)
+                    self._register_many(list(self.storage.load_books()))
                 except Exception as e:
-                    print(f"Error loading book from JSON: {e}")
-                    print(f"Skipping invalid book data: {i}")
+                    print(f"Unexpected error loading books: {e}")
+                return
+        self.load_progress = {"books": 0, "bytes_read": 0, "total_bytes": 0}
+        pending = {}
+        snapshot = None
+
+        def flush(bytes_read : int):
+            with self._lock:
+                self._register_many(list(pending.values()))
+            pending.clear()
+            total_bytes = snapshot[2] if snapshot else 0
+            self.load_progress = {"books": len(self._isbn_index), "bytes_read": bytes_read, "total_bytes": total_bytes}
+            if progress is not None:
+                progress(len(self._isbn_index), bytes_read, total_bytes)
+
+        try:
+            with open(self.filename, "rb") as f:
+                st = os.fstat(f.fileno())
+                snapshot = (st.st_ino, st.st_mtime_ns, st.st_size)
+                for i in codec.iter_array(f):
+                    try:
+                        book = Book.from_dict(i)
+                    except Exception as e:
+                        print(f"Error loading book from JSON: {e}")
+                        print(f"Skipping invalid book data: {i}")
+                        continue
+                    if book.isbn in pending or book.isbn in self._isbn_index:
+                        print(f"Skipping duplicate ISBN in JSON: {book.isbn}")
+                        continue
+                    pending[book.isbn] = book
+                    if len(pending) >= batch_size:
+                        flush(f.tell())
+                flush(snapshot[2])
         except FileNotFoundError:
            print("library_data.json could not be found.")
         except json.JSONDecodeError as e:
             print(f"Error reading JSON file: {e}")
         except Exception as e:
             print(f"Unexpected error loading books: {e}")
+        if pending:
+            flush(self.load_progress["bytes_read"])
+        with self._exclusive(sync=False):
+            if snapshot is not None and _file_signature(self.filename) != snapshot:
+                # Another process compacted while the old snapshot was being read
+                self._reload(progress, batch_size)
+                return
+            if self.journal:
+                self._replay_journal()
+
+    def load_shards(self, filenames, workers : int = None, save : bool = True, allow_partial : bool = False):
+        """Replace the catalog with the books of several shard files, parsed in parallel processes.
+
+        Shards are JSON files in the library_data.json format, e.g. one per
+        branch. Each is parsed and validated in a worker process, up to
+        workers at once (one per CPU by default), and merged in the order
+        given: for an ISBN in several shards the first shard wins. Returns a
+        report per shard with the books it contributed, its invalid and
+        duplicate records, its first error messages and, if it could not be
+        read to the end, why it failed. With save the merged catalog is then
+        written to filename, so load_books() and other processes see it too.
+        If any shard could not be read to the end the catalog is left as it
+        was, unless allow_partial is set; if no shard could be read it always is.
+        """
+        filenames = list(filenames)
+        workers = min(workers or os.cpu_count() or 1, len(filenames))
+        pool = None
+        if workers > 1:
+            # spawn, not fork: this process may be running other threads (loader, flusher, compaction)
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            results = pool.map(_parse_shard, filenames)
+        else:
+            results = map(_parse_shard, filenames)
+
+        reports = []
+        books = []
+        seen = set()
+        new_book = Book.__new__
+        try:
+            with codec.paused_gc(), metrics.PERSISTENCE_SECONDS.time("load"):
+                # Shards are merged as they arrive, while later ones are still being parsed
+                for rows, report in results:
+                    for title, author, isbn, publish_date, publisher, page_count, status in rows:
+                        if isbn in seen:
+                            report["duplicates"] += 1
+                            _shard_error(report, f"Skipping ISBN already loaded from an earlier shard: {isbn}")
+                            continue
+                        seen.add(isbn)
+                        book = new_book(Book)
+                        book.title = title
+                        book.author = _intern(author)
+                        book.isbn = isbn
+                        book.publish_date = publish_date
+                        book.publisher = _intern(publisher)
+                        book.page_count = page_count
+                        book._status = status
+                        books.append(book)
+                        report["books"] += 1
+                    if report["failed"] is not None:
+                        print(f"Error loading shard {report['filename']}: {report['failed']}")
+                    reports.append(report)
+                # A mistyped path or a missing mount must not wipe the catalog,
+                # here or at the next save of a catalog that lacks their books
+                if all(report["failed"] is not None for report in reports):
+                    print("No shard could be read; the catalog is unchanged.")
+                    return reports
+                if not allow_partial and any(report["failed"] is not None for report in reports):
+                    print("Some shards could not be read; the catalog is unchanged. Pass allow_partial=True to load the rest.")
+                    return reports
+                with self._exclusive(sync=False):
+                    self._reset()
+                    self._register_many(books)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if save:
+            if self.journal and self.storage is None:
+                # Folds the journal away and writes the merged snapshot, in the background unless shared
+                self.compact(background=True)
+            else:
+                self.save_books()
+        return reports
+
+    def _map_snapshot(self):
+        # Caller holds the lock. Only the header is read here; books are built as they are used
+        from snapshot import MappedBookList, MappedIndex, MappedSnapshot
+        try:
+            snapshot = MappedSnapshot(self.filename)
+        except FileNotFoundError:
+            print(f"{self.filename} could not be found.")
+            return
+        except ValueError as e:
+            print(f"Error reading snapshot: {e}")
+            return
+        self._booklist = MappedBookList(snapshot)
+        self._isbn_index = MappedIndex(snapshot)
+        self._borrowed_count = snapshot.borrowed
+        self._publisher_counts = None
+        self._author_counts = None
+        for view in self._views:
+            for book in self._booklist:
+                view.add(book)
+
+    def _replay_journal(self):
+        """Replay journal records written since the last compaction on top of the snapshot"""
+        self._journal_records = 0
+        # A .compacting file is left behind if the process stopped mid-compaction
+        self._replay_journal_file(self.journal_filename + ".compacting")
+        journal = _file_signature(self.journal_filename)
+        self._journal_inode = journal[0] if journal else None
+        self._journal_offset = self._replay_journal_file(self.journal_filename)
+
+    def _replay_journal_file(self, path : str, offset : int = 0):
+        """Apply the records in path from byte offset on and return the offset after the last complete one"""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return offset
+        with f:
+            f.seek(offset)
+            data = f.read()
+        # A line without its newline is a write still in progress (or cut short by a crash)
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply_record(codec.loads(line))
+                self._journal_records += 1
+            except Exception as e:
+                print(f"Skipping invalid journal record: {e}")
+        return offset + end
+
+    def compact(self, background : bool = False):
+        """Fold the journal into the snapshot file"""
+        if not background and self._compaction_thread is not None:
+            # Let a running compaction finish so this one picks up everything after it
+            self._compaction_thread.join()
+        with self._lock:
+            self._start_compaction(background, force=True)
+            thread = self._compaction_thread
+        if not background and thread is not None:
+            thread.join()
+
+    def _start_compaction(self, background : bool, force : bool = False):
+        # Caller holds the lock. The snapshot is written by a thread of its own
+        # (see _compact), so the change that crossed compact_threshold returns at once
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self._compact, args=(force,), daemon=background)
+        self._compaction_thread.start()
+
+    def _compact(self, force : bool):
+        # Only rotating the journal aside and copying the book list hold the
+        # locks; writers keep appending to a fresh journal while the snapshot is
+        # written, and it replaces the old one atomically. A shared library also
+        # holds <filename>.compact.lock throughout, so two processes never compact
+        # at once and leave the older of their snapshots in place.
+        compact_lock = None
+        try:
+            if self.shared:
+                compact_lock = os.open(self.filename + ".compact.lock", os.O_RDWR | os.O_CREAT)
+                _lock_file(compact_lock)
+            with self._exclusive():
+                if not force and self._journal_records < self.compact_threshold:
+                    # Another process compacted while this one waited for it
+                    return
+                journal = _file_signature(self.journal_filename)
+                rotation = {"journal": [journal[0], journal[2]] if journal else [None, 0],
+                            "base": _file_signature(self.filename), "snapshot": None}
+                compacting = self._rotate_journal()
+                books = list(self._booklist)
+                if self.shared:
+                    # Lets the other processes follow this compaction instead of reloading
+                    self._write_rotation(rotation)
+            with metrics.PERSISTENCE_SECONDS.time("snapshot"):
+                temp_filename = self._write_temp_snapshot(books)
+            with self._exclusive():
+                os.replace(temp_filename, self.filename)
+                if self.shared:
+                    rotation["snapshot"] = _file_signature(self.filename)
+                    self._write_rotation(rotation)
+                if os.path.exists(compacting):
+                    os.remove(compacting)
+        except Exception as e:
+            print(f"Error compacting journal: {e}")
+        finally:
+            if compact_lock is not None:
+                _unlock_file(compact_lock)
+                os.close(compact_lock)
+
+    def _write_rotation(self, rotation : dict):
+        # Caller holds the lock file. See _rotation_to_follow
+        temp_filename = f"{self.journal_filename}.rotated.{os.getpid()}.tmp"
+        with open(temp_filename, "wb") as f:
+            f.write(codec.dumps(rotation))
+        os.replace(temp_filename, self.journal_filename + ".rotated")
+
+    def _rotate_journal(self):
+        # Caller holds the lock. Moves the journal to <journal>.compacting and returns that name
+        compacting = self.journal_filename + ".compacting"
+        if self._pending:
+            # Queued changes go into the rotated journal so they stay on disk if the snapshot write fails
+            self._append_journal(self._pending)
+            self._pending = []
+        if os.path.exists(self.journal_filename):
+            if os.path.exists(compacting):
+                with open(self.journal_filename, "r", encoding="utf-8") as src, open(compacting, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_filename)
+            else:
+                os.replace(self.journal_filename, compacting)
+        self._journal_records = 0
+        self._journal_inode = None
+        self._journal_offset = 0
+        return compacting
+
+    def _write_snapshot(self, books : list):
+        with metrics.PERSISTENCE_SECONDS.time("snapshot"):
+            os.replace(self._write_temp_snapshot(books), self.filename)
+
+    def _write_temp_snapshot(self, books : list):
+        # Writes books to a temporary file next to the snapshot and returns its name
+        if self.binary_snapshot:
+            from snapshot import write_snapshot
+            data = None
+        else:
+            data = codec.dumps([book.to_dict() for book in books])
+
+        # A name of its own per writer, so concurrent saves never share a temp file
+        temp_filename = f"{self.filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if data is None:
+            write_snapshot(temp_filename, books)
+        else:
+            with open(temp_filename, "wb") as f:
+                f.write(data)
+        return temp_filename
 
     def save_books(self):
-        book_list_json = []
-        for book in self._booklist:
-            book_list_json.append(book.to_dict())
-        
-        with open(self.filename, "w") as f:
-            json.dump(book_list_json, f)
\ No newline at end of file
+        if self.journal and self.storage is None:
+            self.compact()
+            return
+        with self._exclusive():
+            if self.storage is not None:
+                with metrics.PERSISTENCE_SECONDS.time("storage"):
+                    self.storage.save_books(self._booklist)
+            else:
+                self._write_snapshot(self._booklist)
+            # The saved catalog already holds every queued change
+            self._pending = []
\ No newline at end of file
@@ -1,4 +1,9 @@
+import argparse
+import asyncio
+from collections import Counter
 from library import Library, Book
+from openlibrary import OpenLibraryClient
+from cache import MetadataCache
 
 
 def print_menu():
@@ -14,6 +19,9 @@ def print_menu():
     print("│  5. List All Books                                     │")
     print("│  6. Load Books (from file)                             │")
     print("│  7. Library Statistics                                 │")
+    print("│  8. Search Books (by title, author or publisher)       │")
+    print("│  9. Borrow Book (by ISBN)                              │")
+    print("│ 10. Return Book (by ISBN)                              │")
     print("│  0. Exit                                               │")
     print("│                                                        │")
     print("└────────────────────────────────────────────────────────┘")
@@ -47,9 +55,10 @@ def get_book_input():
 
 def show_statistics(library):
     """Display library statistics"""
-    total_books = len(library._booklist)
-    borrowed_books = sum(1 for book in library._booklist if book.status == "Borrowed")
-    available_books = total_books - borrowed_books
+    stats = library.stats()
+    total_books = stats["total_books"]
+    available_books = stats["available_books"]
+    borrowed_books = stats["borrowed_books"]
     
     print(f"\n{library.name} Library Statistics:")
     print("─" * 45)
@@ -58,28 +67,76 @@ def show_statistics(library):
     print(f"Borrowed Books     : {borrowed_books}")
     print("─" * 45)
 
+    for title, counts in (("Top Publishers", library.publisher_counts()), ("Top Authors", library.author_counts())):
+        if counts:
+            print(f"{title}:")
+            for name, count in Counter(counts).most_common(5):
+                print(f"  {name:<32} : {count}")
+            print("─" * 45)
+
+def print_load_progress(books : int, bytes_read : int, total_bytes : int):
+    percent = bytes_read / total_bytes if total_bytes else 1
+    print(f"\rLoading books... {books} ({percent:.0%})", end="", flush=True)
+
+async def import_isbn_file(library : Library, path : str, workers : int, batch_size : int):
+    """Import every ISBN in a file (one per line), printing a report line per ISBN"""
+    client = OpenLibraryClient(max_concurrency=workers, cache=library.metadata_cache)
+    added = failed = 0
+    try:
+        with open(path, "r") as f:
+            async for report in library.import_isbns(f, client, batch_size=batch_size):
+                if report["success"]:
+                    added += 1
+                    print(f"[OK]   {report['isbn']}  {report['message']}")
+                else:
+                    failed += 1
+                    print(f"[FAIL] {report['isbn']}  {report['message']}")
+    except (OSError, ValueError) as e:
+        print(f"Error reading {path}: {e}")
+    finally:
+        await client.aclose()
+    print(f"\nImport finished: {added} added, {failed} skipped or failed")
+
 def main():
-    library = Library("Yigit Okur Library", "library_data.json")
+    parser = argparse.ArgumentParser(description="Library Management System")
+    parser.add_argument("--import", dest="import_file", metavar="ISBN_FILE",
+                        help="import the ISBNs listed in ISBN_FILE (one per line) and exit")
+    parser.add_argument("--workers", type=int, default=10, help="concurrent Open Library lookups for --import")
+    parser.add_argument("--batch-size", type=int, default=500, help="books saved per batch for --import")
+    args = parser.parse_args()
+
+    library = Library("Yigit Okur Library", "library_data.json", journal=True,
+                      metadata_cache=MetadataCache("openlibrary_cache.db"), shared=True)
 
     try:
-        library.load_books()
-        print("Books were successfully loaded into the library")
+        library.load_books(progress=print_load_progress)
+        print("\nBooks were successfully loaded into the library")
     except FileNotFoundError:
         print("JSON file was not found. New library created.")
     except Exception as e:
         print(f"A problem occurred during the loading process, error: {e}")
 
+    if args.import_file:
+        asyncio.run(import_isbn_file(library, args.import_file, args.workers, args.batch_size))
+        # Writes the Open Library responses still queued in the cache
+        library.metadata_cache.close()
+        return
+
     while True:
         print_menu()
-        choice = input("Please enter your choice (0-7): ").strip()
+        choice = input("Please enter your choice (0-10): ").strip()
+        # Pick up changes made meanwhile by the API or another console
+        library.sync()
 
         match choice:
             case "1":
                 print("\n>> Add Book Operation")
                 try:
                     new_book = get_book_input()
-                    library.add_book(new_book)
-                    print(f"'{new_book.title}' was successfully added!")
+                    if library.add_book(new_book):
+                        print(f"'{new_book.title}' was successfully added!")
+                    else:
+                        print(f"A book with ISBN {new_book.isbn} already exists!")
                 except Exception as e:
                     print(f"Error: {e}")
             case "2":
@@ -123,6 +180,32 @@ def main():
             case "7":
                 show_statistics(library)
             
+            case "8":
+                print("\n>> Search Books Operation")
+                query = input("Enter words from the title, author or publisher: ")
+                results = library.search(query)
+                if results:
+                    for score, book in results:
+                        print(book)
+                else:
+                    print("No matching books were found.")
+            
+            case "9":
+                print("\n>> Borrow Book Operation")
+                isbn = input("Enter the ISBN of the book to borrow: ")
+                if library.borrow_book(isbn):
+                    print("Book was successfully borrowed!")
+                else:
+                    print("Book was not found or is already borrowed!")
+            
+            case "10":
+                print("\n>> Return Book Operation")
+                isbn = input("Enter the ISBN of the book to return: ")
+                if library.return_book(isbn):
+                    print("Book was successfully returned!")
+                else:
+                    print("Book was not found or is not borrowed!")
+            
             case "0":
                 print("\n" + "="*50)
                 print("Exiting the library system...".center(50))
@@ -131,11 +214,13 @@ def main():
                 break
             
             case _:
-                print("Invalid choice! Please enter a value between 0-6.")
+                print("Invalid choice! Please enter a value between 0-10.")
         
         if choice != "0":
             input("\nPress Enter to continue...")
 
+    library.metadata_cache.close()
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,83 @@
+"""Async Open Library metadata client.
+
+One OpenLibraryClient is shared by the whole API process. It keeps a pool of
+keep-alive connections to openlibrary.org and caps how many lookups run at
+once, so a slow upstream response only holds up the request waiting for it.
+Concurrent lookups of the same ISBN share one upstream fetch, and ISBNs Open
+Library could not find are not asked for again for negative_ttl seconds.
+The lookup steps themselves are library.lookup_book, shared with the console.
+"""
+import asyncio
+
+import httpx
+
+from cache import NegativeCache
+from library import lookup_book, run_lookup_async
+
+OPEN_LIBRARY_URL = "https://openlibrary.org"
+
+
+class OpenLibraryClient:
+
+    def __init__(self, base_url: str = OPEN_LIBRARY_URL, max_connections: int = 20,
+                 max_keepalive_connections: int = 10, max_concurrency: int = 10,
+                 timeout: float = 10.0, transport: httpx.AsyncBaseTransport = None, cache=None,
+                 negative_ttl: float = 300):
+        self.base_url = base_url
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.transport = transport
+        # Optional cache.MetadataCache shared with Library.add_book_isbn
+        self.cache = cache
+        # ISBNs that were not found, by /isbn or by the bibkeys fallback
+        self.not_found = NegativeCache(negative_ttl)
+        # isbn -> task fetching it, shared by every caller that asks meanwhile
+        self._inflight = {}
+        self.coalesced = 0
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    def _get_client(self):
+        # Pooled connections belong to the event loop that opened them, so the
+        # pool is rebuilt if the client is used from a different loop
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(base_url=self.base_url, limits=self.limits,
+                                             timeout=self.timeout, transport=self.transport)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+            self._loop = loop
+        return self._client
+
+    async def fetch_book(self, isbn: str):
+        """Look up an ISBN and return a Book, or None if it could not be found"""
+        if isbn in self.not_found:
+            print(f"Error: Book with ISBN {isbn} not found! (checked recently)")
+            return None
+        self._get_client()
+        task = self._inflight.get(isbn)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_book(isbn))
+            self._inflight[isbn] = task
+
+            def forget(done):
+                if self._inflight.get(isbn) is done:
+                    del self._inflight[isbn]
+            task.add_done_callback(forget)
+        else:
+            self.coalesced += 1
+        # Shielded so a caller that gives up does not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def _fetch_book(self, isbn: str):
+        client = self._get_client()
+        async with self._semaphore:
+            return await run_lookup_async(lookup_book(isbn, self.cache, self.not_found), client.get)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
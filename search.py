@@ -0,0 +1,313 @@
+"""Full-text search over book titles, authors and publishers.
+
+SearchIndex is an inverted index from folded tokens to the books that contain
+them. Folding is Turkish-aware: dotted and dotless i (İ, I, ı, i) all fold to
+"i" and diacritics are stripped, so "buyulu tas" finds "Büyülü Taş" and
+"IKNA" finds "İkna". Library keeps the index up to date once enabled (see
+Library.enable_search).
+
+FuzzyIndex adds typo-tolerant lookup ("Cialdni", "Rowlng") over title and
+author words using a trigram index (see Library.enable_fuzzy_search).
+
+Both store postings as small integer book ids from a BookIds table, which a
+Library shares between its indexes, rather than ISBNs. A book's tokens are
+worked out again from the book when it is removed instead of being kept per
+book.
+"""
+import bisect
+import math
+import re
+import unicodedata
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Title matches count more than author matches, which count more than publisher matches
+FIELD_WEIGHTS = (("title", 3.0), ("author", 2.0), ("publisher", 1.0))
+
+# A term that is only a prefix of an indexed token scores less than an exact match
+PREFIX_FACTOR = 0.5
+
+TURKISH_I = str.maketrans({"İ": "i", "I": "i", "ı": "i"})
+
+
+def fold(text: str) -> str:
+    """Lowercase text the Turkish-aware way and strip diacritics"""
+    text = unicodedata.normalize("NFKD", str(text).translate(TURKISH_I).casefold())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text: str):
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+class BookIds:
+    """Small integer ids for books, so indexes can post ints instead of ISBNs.
+
+    Library keeps one as the first of its views and hands it to its indexes;
+    an index built without one numbers its books itself. Ids of removed books
+    are reused.
+    """
+
+    def __init__(self, books=()):
+        self.clear()
+        for book in books:
+            self.add(book)
+
+    def clear(self):
+        self.books = []   # id -> Book, None while the id is free
+        self._ids = {}    # isbn -> id
+        self._free = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, book):
+        if self._free:
+            book_id = self._free.pop()
+            self.books[book_id] = book
+        else:
+            book_id = len(self.books)
+            self.books.append(book)
+        self._ids[book.isbn] = book_id
+        return book_id
+
+    def remove(self, book):
+        book_id = self._ids.pop(book.isbn, None)
+        if book_id is not None:
+            self.books[book_id] = None
+            self._free.append(book_id)
+
+    def set_status(self, book):
+        pass
+
+    def get(self, isbn: str):
+        """The id of the book with this ISBN, or None"""
+        return self._ids.get(isbn)
+
+
+class SearchIndex:
+
+    def __init__(self, books=(), book_ids: BookIds = None):
+        # Ids handed in are kept up to date by their owner, before add and after remove
+        self._own_ids = book_ids is None
+        self.book_ids = BookIds() if book_ids is None else book_ids
+        self.clear()
+        for book in books:
+            self.add(book)
+
+    def clear(self):
+        self._postings = {}      # token -> {book id: weight}
+        self._vocabulary = []    # sorted tokens, for prefix lookups
+        self._weights = {}       # one float object per distinct weight, shared by every posting
+        self._count = 0
+        if self._own_ids:
+            self.book_ids.clear()
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _token_weights(book):
+        weights = {}
+        for field, field_weight in FIELD_WEIGHTS:
+            for token in tokenize(getattr(book, field)):
+                weights[token] = weights.get(token, 0.0) + field_weight
+        return weights
+
+    def add(self, book):
+        book_id = self.book_ids.add(book) if self._own_ids else self.book_ids.get(book.isbn)
+        for token, weight in self._token_weights(book).items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[book_id] = self._weights.setdefault(weight, weight)
+        self._count += 1
+
+    def remove(self, book):
+        book_id = self.book_ids.get(book.isbn)
+        if book_id is None:
+            return
+        for token in self._token_weights(book):
+            postings = self._postings.get(token)
+            if postings is None or postings.pop(book_id, None) is None:
+                continue
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+        self._count -= 1
+        if self._own_ids:
+            self.book_ids.remove(book)
+
+    def set_status(self, book):
+        pass
+
+    def _term_scores(self, term: str):
+        """Scores for one query term: exact token matches plus prefix matches"""
+        scores = dict(self._postings.get(term, {}))
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            if token == term:
+                continue
+            for book_id, weight in self._postings[token].items():
+                scores[book_id] = max(scores.get(book_id, 0.0), weight * PREFIX_FACTOR)
+        return scores
+
+    def search(self, query: str, limit: int = 20):
+        """Return [(score, book)] for books matching every query term, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Start from the rarest term so the intersection stays small
+        term_scores = sorted((self._term_scores(term) for term in set(terms)), key=len)
+        totals = dict(term_scores[0])
+        for scores in term_scores[1:]:
+            totals = {book_id: total + scores[book_id] for book_id, total in totals.items() if book_id in scores}
+            if not totals:
+                return []
+        books = self.book_ids.books
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], books[item[0]].title))
+        return [(score, books[book_id]) for book_id, score in ranked[:limit]]
+
+
+def trigrams(token: str):
+    """Character trigrams of a token, padded so that word starts and ends count too"""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(grams: set, other: set) -> float:
+    """Dice coefficient between two trigram sets"""
+    return 2 * len(grams & other) / (len(grams) + len(other))
+
+
+class FuzzyIndex:
+    """Typo-tolerant lookup of title and author words through a trigram index.
+
+    Candidates for a query word are gathered only from the posting lists of its
+    rarest trigrams: a word that reaches min_similarity must share at least one
+    of them, so common trigrams like "  t" never have to be scanned.
+    """
+
+    FIELDS = ("title", "author")
+
+    def __init__(self, books=(), min_similarity: float = 0.4, book_ids: BookIds = None):
+        self.min_similarity = min_similarity
+        # Ids handed in are kept up to date by their owner, before add and after remove
+        self._own_ids = book_ids is None
+        self.book_ids = BookIds() if book_ids is None else book_ids
+        self.clear()
+        for book in books:
+            self.add(book)
+
+    def clear(self):
+        self._gram_postings = {}  # trigram -> set of tokens
+        self._refs = {field: {} for field in self.FIELDS}  # field -> token -> set of book ids
+        self._count = 0
+        if self._own_ids:
+            self.book_ids.clear()
+
+    def __len__(self):
+        return self._count
+
+    def _indexed(self, token):
+        return any(token in refs for refs in self._refs.values())
+
+    @staticmethod
+    def _words(text):
+        # Digits and one letter initials ("J. K.") are too short to match fuzzily
+        return {token for token in tokenize(text) if len(token) > 1 and not token.isdigit()}
+
+    def add(self, book):
+        book_id = self.book_ids.add(book) if self._own_ids else self.book_ids.get(book.isbn)
+        for field in self.FIELDS:
+            refs = self._refs[field]
+            for token in self._words(getattr(book, field)):
+                token_refs = refs.get(token)
+                if token_refs is None:
+                    if not self._indexed(token):
+                        for gram in trigrams(token):
+                            self._gram_postings.setdefault(gram, set()).add(token)
+                    token_refs = refs[token] = set()
+                token_refs.add(book_id)
+        self._count += 1
+
+    def remove(self, book):
+        book_id = self.book_ids.get(book.isbn)
+        if book_id is None:
+            return
+        for field in self.FIELDS:
+            refs = self._refs[field]
+            for token in self._words(getattr(book, field)):
+                token_refs = refs.get(token)
+                if token_refs is None:
+                    continue
+                token_refs.discard(book_id)
+                if token_refs:
+                    continue
+                del refs[token]
+                if not self._indexed(token):
+                    for gram in trigrams(token):
+                        postings = self._gram_postings[gram]
+                        postings.discard(token)
+                        if not postings:
+                            del self._gram_postings[gram]
+        self._count -= 1
+        if self._own_ids:
+            self.book_ids.remove(book)
+
+    def set_status(self, book):
+        pass
+
+    def similar_words(self, word: str):
+        """Return {token: similarity} for indexed words close to word"""
+        grams = trigrams(word)
+        # A token sharing s grams scores 2s / (|grams| + |token grams|) <= 2s / (|grams| + s),
+        # so reaching min_similarity t takes s >= t * |grams| / (2 - t) shared grams
+        t = self.min_similarity
+        needed = max(1, math.ceil(t * len(grams) / (2 - t) - 1e-9))
+        rarest = sorted(grams, key=lambda gram: len(self._gram_postings.get(gram, ())))
+        candidates = set()
+        for gram in rarest[:len(grams) - needed + 1]:
+            candidates.update(self._gram_postings.get(gram, ()))
+        matches = {}
+        for token in candidates:
+            score = similarity(grams, trigrams(token))
+            if score >= self.min_similarity:
+                matches[token] = score
+        return matches
+
+    def search(self, query: str, field: str = None, limit: int = 10, words_per_term: int = 10):
+        """Return [(score, field, book)] ranked by how closely the book's words match the query words.
+
+        Only the words_per_term closest indexed words are expanded for each query
+        word, so the cost depends on how many books share those words rather
+        than on the catalog size.
+        """
+        words = self._words(query)
+        if not words:
+            return []
+        fields = self.FIELDS if field is None else (field,)
+        best = {}  # book id -> {query word: (score, field)}
+        for word in words:
+            similar = sorted(self.similar_words(word).items(), key=lambda item: (-item[1], item[0]))
+            for token, score in similar[:words_per_term]:
+                # With a single query word the book score is the word score, so
+                # once limit books are found no later (worse) word can beat them
+                if len(words) == 1 and len(best) >= limit:
+                    break
+                for token_field in fields:
+                    for book_id in self._refs[token_field].get(token, ()):
+                        matches = best.setdefault(book_id, {})
+                        if score > matches.get(word, (0.0, None))[0]:
+                            matches[word] = (score, token_field)
+        books = self.book_ids.books
+        results = []
+        for book_id, matches in best.items():
+            score = sum(match[0] for match in matches.values()) / len(words)
+            top_field = max(matches.values())[1]
+            results.append((score, top_field, books[book_id]))
+        results.sort(key=lambda result: (-result[0], result[2].title))
+        return results[:limit]
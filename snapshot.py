@@ -0,0 +1,320 @@
+"""Binary catalog snapshot that is memory-mapped instead of parsed.
+
+A .snap file holds a fixed-width record per book, an ISBN-sorted index of
+record numbers and a heap of UTF-8 strings. Repeated strings (authors,
+publishers) are stored once. Field values that are not strings, and page counts
+that are not 64-bit integers, go in the heap as JSON and are flagged in their
+record, so they load back as they were. Opening a snapshot only maps the file and reads
+the header, so startup does not grow with the catalog. Books are built from
+their records the first time they are looked up or iterated. Library uses
+this format for filenames ending in .snap (see Library.__init__).
+
+Convert an existing JSON catalog with:
+
+    python snapshot.py library_data.json library.snap
+"""
+import bisect
+import mmap
+import struct
+import sys
+from collections import Counter
+
+import codec
+from library import Book, BookList, BookStatus, Library
+
+MAGIC = b"LIBSNAP\0"
+VERSION = 2
+# magic, version, record count, borrowed count, index offset, heap offset
+HEADER = struct.Struct("<8sIQQQQ")
+# (offset, length) into the heap for title, author, isbn, publish_date and
+# publisher, then page_count, the status, flags for the fields stored as JSON
+# and the heap length of a JSON page count (whose heap offset is in page_count)
+RECORD = struct.Struct("<QIQIQIQIQIqBB2xI")
+# Version 1 records have no flags: every field was stored as a string
+RECORDS = {1: struct.Struct("<QIQIQIQIQIqB3x"), VERSION: RECORD}
+FLAGS_OFFSET = struct.calcsize("<QIQIQIQIQIqB")
+INDEX_ENTRY = struct.Struct("<I")
+LOCATION = struct.Struct("<QI")
+FIELDS = ("title", "author", "isbn", "publish_date", "publisher")
+ISBN_LOCATION = LOCATION.size * FIELDS.index("isbn")
+ISBN_JSON = 1 << FIELDS.index("isbn")
+PAGE_COUNT_JSON = 1 << len(FIELDS)
+INT64 = range(-2 ** 63, 2 ** 63)
+STATUS_CODES = {BookStatus.AVAILABLE: 0, BookStatus.BORROWED: 1}
+CODE_STATUSES = {code: status for status, code in STATUS_CODES.items()}
+
+
+def encode(value):
+    """The heap bytes for a field value, and whether they are JSON rather than the string itself"""
+    if type(value) is str:
+        return value.encode("utf-8"), False
+    return codec.dumps(value), True
+
+
+def write_snapshot(filename: str, books):
+    """Write books to filename in the binary snapshot format"""
+    books = list(books)
+    heap = bytearray()
+    offsets = {}  # encoded value -> (offset, length) in the heap
+
+    def intern(encoded):
+        location = offsets.get(encoded)
+        if location is None:
+            location = offsets[encoded] = (len(heap), len(encoded))
+            heap.extend(encoded)
+        return location
+
+    records_offset = HEADER.size
+    index_offset = records_offset + RECORD.size * len(books)
+    heap_offset = index_offset + INDEX_ENTRY.size * len(books)
+    records = bytearray(RECORD.size * len(books))
+    isbns = []
+    borrowed = 0
+    for row, book in enumerate(books):
+        fields = []
+        flags = 0
+        for bit, field in enumerate(FIELDS):
+            encoded, is_json = encode(getattr(book, field))
+            fields.extend(intern(encoded))
+            flags |= is_json << bit
+        page_count, page_count_length = book.page_count, 0
+        if type(page_count) is not int or page_count not in INT64:
+            page_count, page_count_length = intern(codec.dumps(page_count))
+            flags |= PAGE_COUNT_JSON
+        RECORD.pack_into(records, row * RECORD.size, *fields, page_count, STATUS_CODES[book._status],
+                         flags, page_count_length)
+        isbns.append(encode(book.isbn)[0])
+        borrowed += book._status is BookStatus.BORROWED
+    # Sorted by the UTF-8 bytes, which orders the same way as the strings
+    index = bytearray(INDEX_ENTRY.size * len(books))
+    for position, row in enumerate(sorted(range(len(books)), key=isbns.__getitem__)):
+        INDEX_ENTRY.pack_into(index, position * INDEX_ENTRY.size, row)
+
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(books), borrowed, index_offset, heap_offset))
+        f.write(records)
+        f.write(index)
+        f.write(heap)
+
+
+class MappedSnapshot:
+    """Read-only view of a .snap file. Books are built on first access and then reused"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.borrowed, self._index_offset, self._heap_offset = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version not in RECORDS:
+            raise ValueError(f"{filename} is not a version 1 to {VERSION} library snapshot")
+        self._record = RECORDS[version]
+        self._books = {}  # row -> Book
+
+    def __len__(self):
+        return self.count
+
+    def _value(self, offset: int, length: int, is_json=False):
+        start = self._heap_offset + offset
+        data = self._map[start:start + length]
+        return codec.loads(data) if is_json else data.decode("utf-8")
+
+    def _flags(self, row: int) -> int:
+        if self._record is not RECORD:
+            return 0
+        return self._map[HEADER.size + row * RECORD.size + FLAGS_OFFSET]
+
+    def book(self, row: int) -> Book:
+        book = self._books.get(row)
+        if book is None:
+            fields = self._record.unpack_from(self._map, HEADER.size + row * self._record.size)
+            flags = fields[12] if len(fields) > 12 else 0
+            title, author, isbn, publish_date, publisher = (
+                self._value(fields[2 * bit], fields[2 * bit + 1], flags & 1 << bit) for bit in range(len(FIELDS)))
+            book = Book.__new__(Book)
+            book.title = title
+            book.author = sys.intern(author) if type(author) is str else author
+            book.isbn = isbn
+            book.publish_date = publish_date
+            book.publisher = sys.intern(publisher) if type(publisher) is str else publisher
+            book.page_count = self._value(fields[10], fields[13], True) if flags & PAGE_COUNT_JSON else fields[10]
+            book._status = CODE_STATUSES[fields[11]]
+            # setdefault keeps one Book per record even if two threads build it at once
+            book = self._books.setdefault(row, book)
+        return book
+
+    def _isbn_bytes(self, row: int) -> bytes:
+        offset, length = LOCATION.unpack_from(self._map, HEADER.size + row * self._record.size + ISBN_LOCATION)
+        start = self._heap_offset + offset
+        return self._map[start:start + length]
+
+    def isbn(self, row: int):
+        isbn = self._isbn_bytes(row)
+        return codec.loads(isbn) if self._flags(row) & ISBN_JSON else isbn.decode("utf-8")
+
+    def _sorted_row(self, position: int) -> int:
+        return INDEX_ENTRY.unpack_from(self._map, self._index_offset + position * INDEX_ENTRY.size)[0]
+
+    def row_of(self, isbn):
+        """Binary search the ISBN index; returns the record number or None"""
+        try:
+            key, is_json = encode(isbn)
+        except TypeError:
+            return None
+        sorted_isbns = _SortedIsbns(self)
+        position = bisect.bisect_left(sorted_isbns, key)
+        # The ISBN "1" and the ISBN 1 are stored as the same bytes and told apart by the flag
+        while position < self.count and sorted_isbns[position] == key:
+            row = self._sorted_row(position)
+            if bool(self._flags(row) & ISBN_JSON) == is_json:
+                return row
+            position += 1
+        return None
+
+    def sorted_rows(self):
+        """Record numbers in ISBN order"""
+        for position in range(self.count):
+            yield self._sorted_row(position)
+
+    def counts(self, field: str, rows) -> Counter:
+        """Count the values of author or publisher over rows without building Books"""
+        # Equal values share one heap entry, so counting offsets counts values
+        offset = HEADER.size + LOCATION.size * FIELDS.index(field)
+        json_flag = 1 << FIELDS.index(field)
+        size = self._record.size
+        by_offset = Counter((LOCATION.unpack_from(self._map, offset + row * size), self._flags(row) & json_flag)
+                            for row in rows)
+        counts = Counter()
+        for (location, is_json), count in by_offset.items():
+            counts[self._value(*location, is_json)] += count
+        return counts
+
+    def close(self):
+        self._map.close()
+
+
+class _SortedIsbns:
+    """Sequence of ISBNs (as bytes) in index order, for bisect"""
+
+    def __init__(self, snapshot: MappedSnapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return self._snapshot.count
+
+    def __getitem__(self, position: int) -> bytes:
+        return self._snapshot._isbn_bytes(self._snapshot._sorted_row(position))
+
+
+class MappedBookList:
+    """Library._booklist over a snapshot: snapshot books in file order, minus removed ones, then added ones"""
+
+    def __init__(self, snapshot: MappedSnapshot):
+        self.snapshot = snapshot
+        self._removed = set()  # snapshot rows no longer in the catalog
+        self._added = BookList()  # books added since the snapshot, in order
+
+    def __len__(self):
+        return self.snapshot.count - len(self._removed) + len(self._added)
+
+    def __iter__(self):
+        removed = self._removed
+        for row in range(self.snapshot.count):
+            if row not in removed:
+                yield self.snapshot.book(row)
+        yield from list(self._added)
+
+    def append(self, book: Book):
+        self._added.append(book)
+
+    def extend(self, books):
+        self._added.extend(books)
+
+    def remove(self, book: Book):
+        row = self.snapshot.row_of(book.isbn)
+        if row is not None and row not in self._removed and self.snapshot.book(row) is book:
+            self._removed.add(row)
+        else:
+            self._added.remove(book)
+
+    def live_rows(self):
+        return (row for row in range(self.snapshot.count) if row not in self._removed)
+
+    def counts(self, field: str) -> Counter:
+        """Number of books per author or publisher"""
+        counts = self.snapshot.counts(field, self.live_rows())
+        counts.update(getattr(book, field) for book in self._added)
+        return counts
+
+
+class MappedIndex:
+    """Library._isbn_index over a snapshot: ISBN lookups fall through to the snapshot's sorted index"""
+
+    def __init__(self, snapshot: MappedSnapshot):
+        self.snapshot = snapshot
+        self._books = {}      # isbn -> Book, for added books and snapshot books already looked up
+        self._removed = set()  # snapshot ISBNs that are no longer in the catalog
+        self._len = snapshot.count
+
+    def get(self, isbn, default=None):
+        book = self._books.get(isbn)
+        if book is not None:
+            return book
+        if isbn in self._removed:
+            return default
+        row = self.snapshot.row_of(isbn)
+        if row is None:
+            return default
+        return self._books.setdefault(isbn, self.snapshot.book(row))
+
+    def __getitem__(self, isbn):
+        book = self.get(isbn)
+        if book is None:
+            raise KeyError(isbn)
+        return book
+
+    def __contains__(self, isbn):
+        return self.get(isbn) is not None
+
+    def __setitem__(self, isbn, book):
+        if isbn not in self:
+            self._len += 1
+        self._books[isbn] = book
+
+    def __delitem__(self, isbn):
+        if isbn not in self:
+            raise KeyError(isbn)
+        del self._books[isbn]
+        self._removed.add(isbn)
+        self._len -= 1
+
+    def update(self, books: dict):
+        for isbn, book in books.items():
+            self[isbn] = book
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # Snapshot ISBNs come out in order, so sorting the result is cheap
+        for row in self.snapshot.sorted_rows():
+            isbn = self.snapshot.isbn(row)
+            if isbn not in self._removed:
+                yield isbn
+        yield from [isbn for isbn in self._books if isbn in self._removed or self.snapshot.row_of(isbn) is None]
+
+
+def convert_json_to_snapshot(json_filename: str, snapshot_filename: str):
+    """Write the catalog in a library_data.json style file as a binary snapshot"""
+    library_json = Library("Conversion", json_filename)
+    library_json.load_books()
+    write_snapshot(snapshot_filename, library_json._booklist)
+    return len(library_json._booklist)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python snapshot.py <library_data.json> <library.snap>")
+        sys.exit(1)
+    count = convert_json_to_snapshot(sys.argv[1], sys.argv[2])
+    print(f"Wrote {count} books to {sys.argv[2]}")
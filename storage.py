@@ -0,0 +1,228 @@
+"""Pluggable storage backends for Library.
+
+A storage backend replaces the built-in JSON file (and its journal). Library
+hands every mutation to the backend as a small record, using the same format
+as the JSON journal:
+
+    {"op": "add", "book": {...}}
+    {"op": "remove", "isbn": "..."}
+    {"op": "status", "isbn": "...", "status": "..."}
+
+Migrate an existing JSON catalog into SQLite with:
+
+    python storage.py library_data.json library.db
+"""
+import json
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+
+from library import Book
+
+
+class Storage(ABC):
+    """Interface every Library storage backend implements"""
+
+    @abstractmethod
+    def load_books(self):
+        """Return an iterable of every stored Book, in insertion order"""
+
+    @abstractmethod
+    def save_books(self, books):
+        """Replace the stored catalog with the given books"""
+
+    @abstractmethod
+    def write(self, record: dict):
+        """Persist a single add, remove or status record"""
+
+    def write_batch(self, records: list):
+        """Persist several records; backends should override this to use one transaction"""
+        for record in records:
+            self.write(record)
+
+    def has_external_changes(self):
+        """Return True if another process changed the stored catalog since the last call"""
+        return False
+
+    def changes(self):
+        """Return the records other processes wrote since load_books() or the last call.
+
+        None means they cannot be replayed one by one and the catalog has to be
+        loaded again, which is all a backend without a change log can offer.
+        """
+        return None
+
+    def position(self):
+        """Identify the stored changes the last load_books() or changes() covered, or None if the backend cannot tell"""
+        return None
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """Stores one row per book in an SQLite database, keyed by ISBN.
+
+    Lookups and stats are answered by Library's in-memory ISBN index and
+    counters, so the table needs no other indexes; each would only slow down
+    every write. Every write is also logged as a record in a changes table,
+    which other processes replay instead of reloading the whole table. Only
+    the last CHANGE_LOG_SIZE are kept.
+    """
+
+    COLUMNS = ("title", "author", "isbn", "publish_date", "publisher", "page_count", "status")
+    CHANGE_LOG_SIZE = 10000
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS books (
+                    title TEXT NOT NULL,
+                    author TEXT NOT NULL,
+                    isbn TEXT PRIMARY KEY,
+                    publish_date TEXT NOT NULL,
+                    publisher TEXT NOT NULL,
+                    page_count INTEGER NOT NULL,
+                    status TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    record TEXT NOT NULL
+                )
+            """)
+            # Databases created by earlier versions had these for queries that are no longer made
+            for index in ("idx_books_author", "idx_books_publisher", "idx_books_status"):
+                self._conn.execute(f"DROP INDEX IF EXISTS {index}")
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        # Id of the last change this connection has seen, set by load_books()
+        self._cursor = self._last_change()
+
+    def _rows(self, books):
+        for book in books:
+            yield (book.title, book.author, book.isbn, book.publish_date,
+                   book.publisher, book.page_count, book.status)
+
+    def _last_change(self):
+        # AUTOINCREMENT ids are never reused, so this counts pruned changes too
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def load_books(self):
+        with self._lock, self._conn:
+            # One read transaction, so the cursor matches the rows
+            self._conn.execute("BEGIN")
+            rows = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM books ORDER BY rowid").fetchall()
+            self._cursor = self._last_change()
+        return [Book(*row) for row in rows]
+
+    def save_books(self, books):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM books")
+            self._conn.executemany("INSERT INTO books VALUES (?, ?, ?, ?, ?, ?, ?)", self._rows(books))
+            self._log_reload()
+
+    def _log_reload(self):
+        # The catalog was replaced wholesale: other processes have to load it again
+        self._conn.execute("DELETE FROM changes")
+        self._conn.execute("INSERT INTO changes (record) VALUES (?)", (json.dumps({"op": "reload"}),))
+        self._cursor = self._last_change()
+
+    def write(self, record: dict):
+        self.write_batch([record])
+
+    def write_batch(self, records: list):
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            # Changes other processes logged before this write are still replayed by changes()
+            caught_up = self._cursor == self._last_change()
+            for record in records:
+                self._execute(record)
+            self._conn.executemany("INSERT INTO changes (record) VALUES (?)", [(json.dumps(record),) for record in records])
+            last = self._last_change()
+            self._conn.execute("DELETE FROM changes WHERE id <= ?", (last - self.CHANGE_LOG_SIZE,))
+            if caught_up:
+                self._cursor = last
+
+    def position(self):
+        return self._cursor
+
+    def changes(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT id, record FROM changes WHERE id > ? ORDER BY id", (self._cursor,)).fetchall()
+        if not rows:
+            return []
+        pruned = rows[0][0] != self._cursor + 1
+        self._cursor = rows[-1][0]
+        records = [json.loads(record) for _, record in rows]
+        if pruned or any(record["op"] == "reload" for record in records):
+            return None
+        return records
+
+    def _execute(self, record: dict):
+        op = record["op"]
+        if op == "add":
+            book = Book.from_dict(record["book"])
+            # REPLACE deletes the old row first, so a re-added ISBN moves to the end like in the journal
+            self._conn.execute("INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?, ?, ?)", next(self._rows([book])))
+        elif op == "remove":
+            self._conn.execute("DELETE FROM books WHERE isbn = ?", (record["isbn"],))
+        elif op == "status":
+            self._conn.execute("UPDATE books SET status = ? WHERE isbn = ?", (record["status"], record["isbn"]))
+        else:
+            raise ValueError(f"Unknown storage operation: {op}")
+
+    def has_external_changes(self):
+        # data_version only moves when another connection commits
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    def import_json(self, json_filename: str):
+        """Import books from a library_data.json style file. Returns the number of books inserted"""
+        with open(json_filename, "r") as f:
+            booklist_json = json.load(f)
+        books = []
+        for i in booklist_json:
+            try:
+                books.append(Book.from_dict(i))
+            except Exception as e:
+                print(f"Error loading book from JSON: {e}")
+                print(f"Skipping invalid book data: {i}")
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO books VALUES (?, ?, ?, ?, ?, ?, ?)", self._rows(books))
+            # Rows skipped by INSERT OR IGNORE (ISBNs already stored) are not counted
+            inserted = self._conn.total_changes - before
+            if inserted:
+                self._log_reload()
+            return inserted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_to_sqlite(json_filename: str, db_filename: str):
+    """Copy an existing JSON catalog into an SQLite database"""
+    storage = SQLiteStorage(db_filename)
+    try:
+        return storage.import_json(json_filename)
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python storage.py <library_data.json> <library.db>")
+        sys.exit(1)
+    count = migrate_json_to_sqlite(sys.argv[1], sys.argv[2])
+    print(f"Imported {count} books into {sys.argv[2]}")
@@ -1,12 +1,24 @@
 import pytest
 from fastapi.testclient import TestClient
+import api
 from api import app
 import os
 import json
 
-client = TestClient(app)
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    """Client for an API over an empty data directory; entering it runs the lifespan handler"""
+    data = tmp_path_factory.mktemp("api")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("LIBRARY_DATA", str(data / "library_data.json"))
+        mp.setenv("OPENLIBRARY_CACHE", str(data / "openlibrary_cache.db"))
+        mp.setenv("LIBRARY_VIEWS", "columns,search,fuzzy")
+        with TestClient(app) as client:
+            # The catalog loads in the background; tests below change it directly
+            api.library.wait_until_loaded()
+            yield client
 
-def test_root():
+def test_root(client):
     """Test root endpoint"""
     response = client.get("/")
     assert response.status_code == 200
@@ -14,14 +26,36 @@ def test_root():
     assert "message" in data
     assert "documentation" in data
 
-def test_get_books():
+def test_get_books(client):
     """Test getting all books"""
     response = client.get("/books")
     assert response.status_code == 200
     books = response.json()
     assert isinstance(books, list)
 
-def test_get_stats():
+def test_get_books_paginated_and_streamed(client):
+    """Cursor pagination and NDJSON streaming over the same ISBN order"""
+    import api
+    from library import Book
+    books = [Book(f"Page Book {i}", "Author", f"000-page-{i}", "2020", "Pub", 100) for i in range(5)]
+    for book in books:
+        api.library._register(book)
+    try:
+        first = client.get("/books", params={"limit": 2, "after_isbn": "000-page"})
+        assert [book["isbn"] for book in first.json()] == ["000-page-0", "000-page-1"]
+        assert first.headers["X-Next-After-ISBN"] == "000-page-1"
+
+        second = client.get("/books", params={"limit": 2, "after_isbn": first.headers["X-Next-After-ISBN"]})
+        assert [book["isbn"] for book in second.json()] == ["000-page-2", "000-page-3"]
+
+        streamed = client.get("/books/stream", params={"after_isbn": "000-page", "limit": 5})
+        assert streamed.headers["content-type"].startswith("application/x-ndjson")
+        assert [json.loads(line)["isbn"] for line in streamed.text.splitlines()] == [book.isbn for book in books]
+    finally:
+        for book in books:
+            api.library._unregister(book)
+
+def test_get_stats(client):
     """Test library statistics"""
     response = client.get("/stats")
     assert response.status_code == 200
@@ -31,22 +65,68 @@ def test_get_stats():
     assert "available_books" in data
     assert "borrowed_books" in data
 
-def test_get_book_not_found():
+def test_get_stats_breakdown(client):
+    """Per-publisher and per-author counts are only included on request"""
+    assert "books_by_publisher" not in client.get("/stats").json()
+    data = client.get("/stats", params={"breakdown": True}).json()
+    assert sum(data["books_by_publisher"].values()) == data["total_books"]
+    assert sum(data["books_by_author"].values()) == data["total_books"]
+
+def test_get_advanced_stats(client):
+    """Columnar analytics agree with the basic counters"""
+    response = client.get("/stats/advanced", params={"top": 5})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["summary"]["books"] == client.get("/stats").json()["total_books"]
+    assert len(data["top_publishers"]) <= 5
+
+def test_search_books(client):
+    """Search is case-insensitive, Turkish-aware and prefix-friendly"""
+    import api
+    from library import Book
+    book = Book("Küçük Prens", "Antoine de Saint-Exupéry", "000-search-1", "1943", "Can Yayınları", 96)
+    api.library._register(book)
+    try:
+        response = client.get("/search", params={"q": "KUCUK pre"})
+        assert response.status_code == 200
+        assert [result["isbn"] for result in response.json()] == ["000-search-1"]
+        assert response.json()[0]["score"] > 0
+    finally:
+        api.library._unregister(book)
+    assert client.get("/search", params={"q": "kucuk prens"}).json() == []
+
+def test_fuzzy_search_books(client):
+    """Misspelled author names still find the book"""
+    import api
+    from library import Book
+    book = Book("Influence", "Robert B. Cialdini", "000-fuzzy-1", "2006", "Harper", 320)
+    api.library._register(book)
+    try:
+        response = client.get("/search/fuzzy", params={"q": "Cialdni", "field": "author"})
+        assert response.status_code == 200
+        results = response.json()
+        assert "000-fuzzy-1" in [result["isbn"] for result in results]
+        assert all(result["matched_field"] == "author" for result in results)
+        assert client.get("/search/fuzzy", params={"q": "Cialdni", "field": "publisher"}).status_code == 422
+    finally:
+        api.library._unregister(book)
+
+def test_get_book_not_found(client):
     """Test getting a book that doesn't exist"""
     response = client.get("/books/9999999999999")
     assert response.status_code == 404
 
-def test_delete_book_not_found():
+def test_delete_book_not_found(client):
     """Test deleting a book that doesn't exist"""
     response = client.delete("/books/9999999999999")
     assert response.status_code == 404
 
-def test_add_book_invalid_isbn():
+def test_add_book_invalid_isbn(client):
     """Test adding a book with invalid ISBN"""
     response = client.post("/books", json={"isbn": "invalid"})
     assert response.status_code in [400, 404]  # Both are acceptable for invalid ISBN
 
-def test_add_and_delete_book():
+def test_add_and_delete_book(client):
     """Test adding and then deleting a book"""
     # Try to add a book (this might fail due to API limitations)
     isbn = "9780134685991"
@@ -60,5 +140,250 @@ def test_add_and_delete_book():
         # If book couldn't be added, that's also acceptable for this test
         assert response.status_code in [400, 404]
 
+def test_add_book_uses_async_client(client, monkeypatch):
+    """POST /books awaits the shared Open Library client"""
+    import api
+    import httpx
+    from openlibrary import OpenLibraryClient
+
+    def handler(request):
+        if request.url.path == "/isbn/9780000000017.json":
+            return httpx.Response(200, json={"title": "Mock Book", "authors": [{"key": "/authors/OL1A"}]})
+        if request.url.path == "/authors/OL1A.json":
+            return httpx.Response(200, json={"name": "Mock Author"})
+        return httpx.Response(404)
+
+    monkeypatch.setattr(api, "openlibrary", OpenLibraryClient(transport=httpx.MockTransport(handler)))
+
+    response = client.post("/books", json={"isbn": "9780000000017"})
+    assert response.status_code == 200
+    assert response.json()["author"] == "Mock Author"
+
+    missing = client.post("/books", json={"isbn": "9780000000024"})
+    assert missing.status_code == 404
+
+    assert client.delete("/books/9780000000017").status_code == 200
+
+def test_add_books_bulk_streams_reports(client, monkeypatch):
+    """POST /books/bulk streams one NDJSON line per ISBN"""
+    import api
+    import httpx
+    from openlibrary import OpenLibraryClient
+
+    def handler(request):
+        if request.url.path in ("/isbn/9780000000031.json", "/isbn/9780000000048.json"):
+            return httpx.Response(200, json={"title": "Bulk Book"})
+        return httpx.Response(404)
+
+    monkeypatch.setattr(api, "openlibrary", OpenLibraryClient(transport=httpx.MockTransport(handler)))
+
+    response = client.post("/books/bulk", json={"isbns": ["9780000000031", "9780000000048", "9780000000055", "9780000000031"]})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    reports = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted((report["isbn"], report["success"]) for report in reports) == [
+        ("9780000000031", False), ("9780000000031", True), ("9780000000048", True), ("9780000000055", False)]
+
+    for isbn in ("9780000000031", "9780000000048"):
+        assert client.delete(f"/books/{isbn}").status_code == 200
+
+def test_borrow_and_return_book(client, monkeypatch, tmp_path):
+    """Status transitions return 409 when the book is already in that state"""
+    import api
+    from library import Book, Library
+
+    library = Library("Test Library", str(tmp_path / "library.json"), journal=True)
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    library.add_book(Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688))
+    monkeypatch.setattr(api, "library", library)
+
+    response = client.post("/books/978-0451524935/borrow")
+    assert response.status_code == 200
+    assert response.json()["status"] == "Borrowed"
+    assert client.post("/books/978-0451524935/borrow").status_code == 409
+    assert client.post("/books/999-9999999999/borrow").status_code == 404
+    assert client.post("/books/978-0451524935/return").json()["status"] == "Available"
+    assert client.post("/books/978-0451524935/return").status_code == 409
+
+    response = client.post("/books/borrow", json={"isbns": ["978-0451524935", "978-0441013593", "978-0441013593"]})
+    assert [report["success"] for report in response.json()] == [True, True, False]
+    response = client.post("/books/return", json={"isbns": ["978-0441013593", "999-9999999999"]})
+    assert [report["success"] for report in response.json()] == [True, False]
+    assert client.get("/stats").json()["borrowed_books"] == 1
+
+    # A DELETE that lands between the borrow and the response gives a 404, not a 500
+    real_borrow = library.borrow_book
+
+    def borrow_then_delete(isbn):
+        borrowed = real_borrow(isbn)
+        library.remove_book(isbn)
+        return borrowed
+    monkeypatch.setattr(library, "borrow_book", borrow_then_delete)
+    assert client.post("/books/978-0441013593/borrow").status_code == 404
+
+def test_conditional_get_and_response_cache(client, monkeypatch, tmp_path):
+    """Read endpoints answer 304 for a current ETag and reuse serialized responses until the catalog changes"""
+    from library import Book, Library
+
+    library = Library("Test Library", str(tmp_path / "library.json"))
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    monkeypatch.setattr(api, "library", library)
+
+    for path in ("/books", "/books?limit=10", "/books/978-0451524935", "/stats?breakdown=true"):
+        response = client.get(path)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        not_modified = client.get(path, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.headers["etag"] == etag
+        assert not_modified.content == b""
+
+    # Unchanged catalog: served from the cache without recomputing
+    with monkeypatch.context() as m:
+        m.setattr(library, "stats", lambda: 1 / 0)
+        assert client.get("/stats?breakdown=true").json()["total_books"] == 1
+
+    library.borrow_book("978-0451524935")
+    response = client.get("/books/978-0451524935", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["status"] == "Borrowed"
+    assert client.get("/stats").json()["borrowed_books"] == 1
+
+def test_shared_workers_agree_on_etags(client, monkeypatch, tmp_path):
+    """Workers of a shared library hand out the same ETag once they have caught up with the same changes"""
+    from library import Book, Library
+
+    filename = str(tmp_path / "library.json")
+    first = Library("Test Library", filename, journal=True, shared=True)
+    second = Library("Test Library", filename, journal=True, shared=True)
+    first.load_books()
+    second.load_books()
+    first.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+
+    monkeypatch.setattr(api, "library", first)
+    etag = client.get("/stats").headers["etag"]
+    monkeypatch.setattr(api, "library", second)
+    # The middleware catches second up before answering
+    assert client.get("/stats", headers={"If-None-Match": etag}).status_code == 304
+    second.borrow_book("978-0451524935")
+    assert client.get("/stats", headers={"If-None-Match": etag}).status_code == 200
+
+def test_response_cache_is_bounded_by_size(client, monkeypatch, tmp_path):
+    """A response larger than the byte budget is served but not kept"""
+    from library import Book, Library
+
+    library = Library("Test Library", str(tmp_path / "library.json"))
+    library.add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(100)])
+    monkeypatch.setattr(api, "library", library)
+    monkeypatch.setattr(api, "RESPONSE_CACHE_BYTES", 4096)
+
+    assert len(client.get("/books").json()) == 100
+    assert len(client.get("/books?limit=10").json()) == 10
+    assert list(api.response_cache) == [("books", 10, None)]
+    assert api.response_cache_bytes <= 4096
+
+def test_metrics(client):
+    client.get("/stats")
+    client.get("/books/does-not-exist")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'library_request_duration_seconds_count{method="GET",route="/stats",status="200"}' in text
+    # Routes are reported by template, not by the ISBN in the URL
+    assert 'route="/books/{isbn}",status="404"' in text
+    assert "does-not-exist" not in text
+    assert "# TYPE library_persistence_duration_seconds histogram" in text
+    assert 'library_books{status="available"}' in text
+    assert "library_metadata_cache_hit_ratio" in text
+
+class FakeOpenLibraryClient:
+    async def fetch_book(self, isbn):
+        from library import Book
+        return Book(f"Title {isbn}", "Author", isbn, "2020", "Pub", 100)
+
+def test_concurrent_adds_and_deletes(client, monkeypatch, tmp_path):
+    """Racing requests for the same ISBN add or delete it exactly once"""
+    import api
+    from concurrent.futures import ThreadPoolExecutor
+    from library import Library
+
+    filename = str(tmp_path / "library.json")
+    library = Library("Test Library", filename, journal=True, compact_threshold=100, shared=True)
+    monkeypatch.setattr(api, "library", library)
+    monkeypatch.setattr(api, "openlibrary", FakeOpenLibraryClient())
+    isbns = [f"978{i:010d}" for i in range(1000)]
+
+    # 3000 mutations: every ISBN added twice, half of them deleted twice
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        added = list(pool.map(lambda isbn: client.post("/books", json={"isbn": isbn}).status_code, isbns * 2))
+        deleted = list(pool.map(lambda isbn: client.delete(f"/books/{isbn}").status_code, isbns[:500] * 2))
+
+    assert sorted(added) == [200] * 1000 + [400] * 1000
+    assert sorted(deleted) == [200] * 500 + [404] * 500
+    assert all(sorted(pair) == [200, 400] for pair in zip(added[:1000], added[1000:]))
+    assert sorted(book.isbn for book in library._booklist) == isbns[500:]
+
+    reloaded = Library("Reloaded", filename, journal=True)
+    reloaded.load_books()
+    assert sorted(book.isbn for book in reloaded._booklist) == isbns[500:]
+
+def test_ready_after_warm_up(client):
+    """/ready turns 200 once loading and warm-up are done, on the configured data path"""
+    assert api.library.filename == os.environ["LIBRARY_DATA"]
+    assert api.warmed_up.wait(5)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+    assert client.get("/health").json()["status"] == "healthy"
+
+def test_prewarm_builds_views_for_a_mapped_snapshot(tmp_path):
+    """A .snap catalog loads without building Books; the warm-up thread builds the views afterwards"""
+    import threading
+    from library import Book, Library
+    from snapshot import write_snapshot
+
+    filename = str(tmp_path / "library.snap")
+    write_snapshot(filename, [Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328)])
+    library = Library("Test Library", filename, journal=True)
+    library.load_books()
+    assert library._isbn_index.snapshot._books == {}
+
+    done = threading.Event()
+    api.prewarm(library, done, {"columns", "search", "fuzzy"})
+    assert done.is_set()
+    assert [book.isbn for _, book in library.search("orwell")] == ["978-0451524935"]
+    assert library._columns is not None and library._fuzzy_index is not None
+
+def test_persistence_stats(client):
+    response = client.get("/stats/persistence")
+    assert response.status_code == 200
+    data = response.json()
+    # The default deployment is shared, so every change is written before the request returns
+    assert data["write_behind"] is False
+    assert data["pending_changes"] == 0
+
 if __name__ == "__main__":
-    pytest.main([__file__])
\ No newline at end of file
+    pytest.main([__file__])
+def test_views_are_opt_in(tmp_path, monkeypatch):
+    """Without LIBRARY_VIEWS no view is built and the endpoints they serve answer 404"""
+    monkeypatch.setenv("LIBRARY_DATA", str(tmp_path / "library_data.json"))
+    monkeypatch.setenv("OPENLIBRARY_CACHE", str(tmp_path / "openlibrary_cache.db"))
+    monkeypatch.delenv("LIBRARY_VIEWS", raising=False)
+    # The lifespan handler replaces these; the module's client gets them back afterwards
+    for name in ("library", "metadata_cache", "openlibrary", "etag_prefix", "enabled_views"):
+        monkeypatch.setattr(api, name, getattr(api, name))
+    with TestClient(app) as client:
+        assert api.warmed_up.wait(5)
+        assert api.library._views == []
+        for path in ("/search?q=orwell", "/search/fuzzy?q=orwel", "/stats/advanced"):
+            response = client.get(path)
+            assert response.status_code == 404
+            assert "LIBRARY_VIEWS" in response.json()["detail"]
+        assert client.get("/stats").status_code == 200
+
+    monkeypatch.setenv("LIBRARY_VIEWS", "search,typo")
+    with pytest.raises(ValueError):
+        with TestClient(app):
+            pass
@@ -0,0 +1,159 @@
+import asyncio
+import time
+import httpx
+from unittest.mock import patch, Mock
+from cache import MetadataCache
+from library import Library
+from openlibrary import OpenLibraryClient
+
+
+def test_cache_hit_miss_and_persistence(tmp_path):
+    filename = str(tmp_path / "cache.db")
+    cache = MetadataCache(filename)
+
+    assert cache.get("/authors/OL1A.json") is None
+    cache.set("/authors/OL1A.json", {"name": "Test Author"})
+    assert cache.get("/authors/OL1A.json") == {"name": "Test Author"}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    cache.close()
+
+    reopened = MetadataCache(filename)
+    assert reopened.get("/authors/OL1A.json") == {"name": "Test Author"}
+    assert reopened.stats()["entries"] == 1
+
+
+def test_cache_ttl_expiry(tmp_path):
+    cache = MetadataCache(str(tmp_path / "cache.db"), ttl=60)
+    cache.set("/isbn/1.json", {"title": "Old"})
+    cache.set("/isbn/2.json", {"title": "Short"}, ttl=0)
+
+    time.sleep(0.01)
+
+    assert cache.get("/isbn/1.json") == {"title": "Old"}
+    assert cache.get("/isbn/2.json") is None
+    cache.flush()
+    assert cache.stats()["entries"] == 1
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = MetadataCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.set("a", 1)
+    time.sleep(0.01)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    cache.get("a")  # "b" is now the least recently used entry
+    time.sleep(0.01)
+    cache.set("c", 3)
+    cache.flush()
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_hits_write_access_times_in_batches(tmp_path):
+    import sqlite3
+    filename = str(tmp_path / "cache.db")
+    cache = MetadataCache(filename, touch_interval=60)
+    cache.set("a", 1)
+    cache.flush()
+
+    def stored_access():
+        with sqlite3.connect(filename) as conn:
+            return conn.execute("SELECT last_access FROM responses WHERE key = 'a'").fetchone()[0]
+
+    written = stored_access()
+    time.sleep(0.01)
+    assert cache.get("a") == 1
+    # The hit is only noted in memory until touch_interval passes or the cache closes
+    assert stored_access() == written
+    cache.close()
+    assert stored_access() > written
+
+
+def test_cache_writes_in_the_background_and_evicts_across_processes(tmp_path):
+    import sqlite3
+    filename = str(tmp_path / "cache.db")
+    # Two caches on one file, like two API workers
+    first = MetadataCache(filename, max_entries=3, write_delay=60)
+    second = MetadataCache(filename, max_entries=3, write_delay=60)
+
+    def stored_keys():
+        with sqlite3.connect(filename) as conn:
+            return {key for key, in conn.execute("SELECT key FROM responses")}
+
+    first.set("a", 1)
+    # set() only queues the entry; it is served from memory until the writer saves it
+    assert first.get("a") == 1
+    assert stored_keys() == set()
+    first.set("b", 2)
+    first.flush()
+    time.sleep(0.01)
+    second.set("c", 3)
+    second.set("d", 4)
+    second.flush()
+
+    # The excess is counted in the database, so the oldest entry goes although each cache only added two
+    assert stored_keys() == {"b", "c", "d"}
+    assert second.stats()["entries"] == 3
+    assert second.stats()["evictions"] == 1
+    with sqlite3.connect(filename) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    first.close()
+    second.close()
+
+
+def test_add_book_isbn_reuses_cached_author(tmp_path):
+    cache = MetadataCache(str(tmp_path / "cache.db"))
+    library = Library("Test Library", str(tmp_path / "library.json"), metadata_cache=cache)
+
+    def fake_get(url, **kwargs):
+        response = Mock()
+        response.status_code = 200
+        if "/authors/" in url:
+            response.json.return_value = {"name": "J. K. Rowling"}
+        else:
+            response.json.return_value = {"title": url, "authors": [{"key": "/authors/OL23919A"}]}
+        return response
+
+    with patch('httpx.get', side_effect=fake_get) as mock_get:
+        library.add_book_isbn("9789757501954")
+        library.add_book_isbn("9780747532699")
+
+    assert [book.author for book in library._booklist] == ["J. K. Rowling", "J. K. Rowling"]
+    # Two editions, but the shared author is only fetched once
+    assert mock_get.call_count == 3
+
+    library.remove_book("9789757501954")
+    with patch('httpx.get', side_effect=fake_get) as mock_get:
+        library.add_book_isbn("9789757501954")
+    assert mock_get.call_count == 0
+
+
+def test_async_client_uses_cache(tmp_path):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        if request.url.path.startswith("/authors/"):
+            return httpx.Response(200, json={"name": "Robert B. Cialdini"})
+        return httpx.Response(200, json={"title": "Book", "authors": [{"key": "/authors/OL1A"}]})
+
+    client = OpenLibraryClient(transport=httpx.MockTransport(handler),
+                               cache=MetadataCache(str(tmp_path / "cache.db")))
+
+    async def run():
+        try:
+            first = await client.fetch_book("6054584294")
+            second = await client.fetch_book("0061241895")
+            again = await client.fetch_book("6054584294")
+            return first, second, again
+        finally:
+            await client.aclose()
+
+    books = asyncio.run(run())
+
+    assert all(book.author == "Robert B. Cialdini" for book in books)
+    assert requests == ["/isbn/6054584294.json", "/authors/OL1A.json", "/isbn/0061241895.json"]
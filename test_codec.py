@@ -0,0 +1,82 @@
+import gc
+import io
+import json
+import pytest
+import codec
+from library import Book, Library
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(codec, "orjson", None)
+    elif codec.orjson is None:
+        pytest.skip("orjson is not installed")
+    return request.param
+
+
+def test_dumps_and_loads_round_trip(backend):
+    value = [{"title": "Büyülü Taş", "page_count": 300, "status": "Available"}]
+    data = codec.dumps(value)
+    assert isinstance(data, bytes)
+    assert codec.backend() == backend
+    assert codec.loads(data) == value
+    assert codec.loads(data.decode("utf-8")) == value
+
+
+def test_dumps_falls_back_for_values_orjson_rejects():
+    assert codec.loads(codec.dumps({"page_count": 2**70})) == {"page_count": 2**70}
+
+
+def test_dump_lines():
+    assert codec.dump_lines([{"op": "remove", "isbn": "1"}, {"op": "remove", "isbn": "2"}]) == \
+        b'{"op":"remove","isbn":"1"}\n{"op":"remove","isbn":"2"}\n'
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 1 << 20])
+def test_iter_array_streams_elements(chunk_size):
+    records = [{"title": f"Kitap {i} ş", "page_count": 10 ** i} for i in range(12)]
+    for text in (json.dumps(records), json.dumps(records, indent=2), "[]", " [ 123 , 45 ] "):
+        expected = json.loads(text)
+        assert list(codec.iter_array(io.BytesIO(text.encode("utf-8")), chunk_size)) == expected
+
+
+def test_iter_array_numbers_cut_at_every_chunk_boundary():
+    """Fractions and exponents split across reads ("1." then "5") are not taken for shorter numbers"""
+    text = json.dumps([1.5, 2, -0.25, 1e30, 3E-7, 12.5e+3, [10.125, {"n": 6.02e23}], 7])
+    expected = json.loads(text)
+    for chunk_size in range(1, len(text) + 1):
+        assert list(codec.iter_array(io.BytesIO(text.encode("utf-8")), chunk_size)) == expected
+    for text in ("[1.5, 2]", "[1e3]", "[1.5e-3,2E+2]"):
+        for chunk_size in range(1, len(text) + 1):
+            assert list(codec.iter_array(io.BytesIO(text.encode("utf-8")), chunk_size)) == json.loads(text)
+
+
+def test_iter_array_yields_records_before_a_syntax_error():
+    elements = codec.iter_array(io.BytesIO(b'[{"a": 1}, {"b": 2} {"c": 3}]'), 4)
+    assert next(elements) == {"a": 1}
+    assert next(elements) == {"b": 2}
+    with pytest.raises(json.JSONDecodeError):
+        next(elements)
+    with pytest.raises(json.JSONDecodeError):
+        list(codec.iter_array(io.BytesIO(b'{"a": 1}')))
+
+
+def test_paused_gc_restores_state():
+    with codec.paused_gc():
+        assert not gc.isenabled()
+    assert gc.isenabled()
+
+
+def test_snapshot_readable_by_either_backend(tmp_path, monkeypatch):
+    filename = str(tmp_path / "library.json")
+    library = Library("Test Library", filename)
+    library.add_book(Book("İkna", "Robert B. Cialdini", "6054584294", "2019", "MediaCat", 326, "Borrowed"))
+    library.add_book(Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688))
+
+    monkeypatch.setattr(codec, "orjson", None)
+    reloaded = Library("Reloaded", filename)
+    reloaded.load_books()
+
+    assert [book.to_dict() for book in reloaded._booklist] == [book.to_dict() for book in library._booklist]
+    assert reloaded.stats()["borrowed_books"] == 1
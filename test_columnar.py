@@ -0,0 +1,76 @@
+import os
+import pytest
+import columnar
+from columnar import CatalogColumns, parse_year
+from library import Book, Library
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(columnar, "np", None)
+    return request.param
+
+
+def sample_books():
+    return [
+        Book("Harry Potter Büyülü Taş", "J. K. Rowling", "9789757501954", "1999", "Dost Kitabevi Yayinlari", 265),
+        Book("Iknanin Psikolojisi", "Robert B. Cialdini", "6054584294", "Oct 19, 2013", "Mediacat Yayincilik", 0),
+        Book("Chamber of Secrets", "J. K. Rowling", "9789757501961", "1999", "Dost Kitabevi Yayinlari", 310, "Borrowed"),
+        Book("Untitled", "Unknown Author", "0000000000", "Unknown", "Unknown Publisher", 120),
+    ]
+
+
+def test_parse_year():
+    assert parse_year("1999") == 1999
+    assert parse_year("Oct 19, 2013") == 2013
+    assert parse_year("Unknown") == 0
+
+
+def test_aggregations(backend):
+    columns = CatalogColumns(sample_books())
+
+    assert columns.summary() == {"books": 4, "borrowed": 1, "total_pages": 695, "mean_pages": 695 / 4}
+    assert columns.page_count_histogram(100) == [
+        {"min_pages": 0, "max_pages": 99, "books": 1},
+        {"min_pages": 100, "max_pages": 199, "books": 1},
+        {"min_pages": 200, "max_pages": 299, "books": 1},
+        {"min_pages": 300, "max_pages": 399, "books": 1},
+    ]
+    assert columns.publish_year_histogram() == {0: 1, 1999: 2, 2013: 1}
+    assert columns.publisher_totals(top=1) == [
+        {"name": "Dost Kitabevi Yayinlari", "books": 2, "pages": 575, "borrowed": 1}]
+    assert columns.author_totals()[0]["name"] == "J. K. Rowling"
+
+
+def test_page_count_histogram_with_a_bogus_page_count(backend):
+    # Only the bins that hold books are materialized, however large a page count is
+    books = sample_books() + [Book("Bogus", "Author", "isbn-bogus", "2020", "Pub", 10**15)]
+    histogram = CatalogColumns(books).page_count_histogram(1)
+    assert len(histogram) == 5
+    assert histogram[-1] == {"min_pages": 10**15, "max_pages": 10**15, "books": 1}
+
+
+def test_columns_follow_library_mutations(backend):
+    library = Library("Test Library", "test_columns.json", journal=True)
+    columns = library.enable_columns()
+    for book in sample_books():
+        library.add_book(book)
+
+    library.borrow_book("6054584294")
+    library.return_book("9789757501961")
+    library.remove_book("9789757501954")
+
+    assert columns.summary()["books"] == 3
+    assert columns.summary()["borrowed"] == 1
+    assert columns.publisher_totals(top=1)[0] == {"name": "Dost Kitabevi Yayinlari", "books": 1, "pages": 310, "borrowed": 0}
+    assert {row["name"] for row in columns.author_totals()} == {"J. K. Rowling", "Robert B. Cialdini", "Unknown Author"}
+
+    library.load_books()
+    assert len(columns) == 3
+
+    for path in ("test_columns.json", "test_columns.json.journal"):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,79 @@
+import gzip
+import json
+import httpx
+from unittest.mock import patch
+from library import Library
+from ingest import AuthorIndex, ingest, iter_book_batches
+
+
+def write_dump(path, records, tsv=True):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False)
+            if tsv:
+                line = f"{record['type']['key']}\t{record['key']}\t1\t2020-01-01T00:00:00\t{line}"
+            f.write(line + "\n")
+
+
+def make_dumps(tmp_path):
+    authors = str(tmp_path / "authors.txt.gz")
+    editions = str(tmp_path / "editions.txt.gz")
+    write_dump(authors, [
+        {"type": {"key": "/type/author"}, "key": "/authors/OL1A", "name": "Robert B. Cialdini"},
+        {"type": {"key": "/type/author"}, "key": "/authors/OL2A", "name": "Frank Herbert"},
+        {"type": {"key": "/type/redirect"}, "key": "/authors/OL3A", "location": "/authors/OL2A"},
+    ])
+    write_dump(editions, [
+        {"type": {"key": "/type/edition"}, "key": "/books/OL1M", "title": "İkna", "authors": [{"key": "/authors/OL1A"}],
+         "isbn_10": ["6054584294"], "publishers": ["MediaCat"], "publish_date": "2019", "number_of_pages": 326},
+        {"type": {"key": "/type/edition"}, "key": "/books/OL2M", "title": "Dune", "authors": [{"key": "/authors/OL2A"}],
+         "isbn_10": ["0441013597"], "isbn_13": ["978-0441013593"], "publishers": ["Ace"], "publish_date": "1965"},
+        {"type": {"key": "/type/edition"}, "key": "/books/OL3M", "title": "No ISBN", "authors": [{"key": "/authors/OL2A"}]},
+        {"type": {"key": "/type/edition"}, "key": "/books/OL4M", "title": "Dune (again)", "isbn_13": ["9780441013593"]},
+        {"type": {"key": "/type/edition"}, "key": "/books/OL5M", "title": "Unknown author",
+         "authors": [{"author": {"key": "/authors/OL9A"}}], "isbn_13": ["9780000000002"]},
+    ], tsv=False)
+    return editions, authors
+
+
+def test_ingest_joins_editions_to_authors_offline(tmp_path):
+    editions, authors = make_dumps(tmp_path)
+    library = Library("Test Library", str(tmp_path / "library.json"), journal=True)
+
+    with patch("httpx.get", side_effect=httpx.ConnectError("no network")) as mock_get, \
+            patch.object(library, "add_books", wraps=library.add_books) as add_books:
+        report = ingest(library, editions, authors, batch_size=2)
+
+    assert mock_get.call_count == 0
+    assert add_books.call_count == 2
+    assert report == {"authors": 2, "editions": 5, "added": 3, "duplicates": 1, "no_isbn": 1, "invalid": 0}
+    assert library.get_book("6054584294").author == "Robert B. Cialdini"
+    assert library.get_book("6054584294").page_count == 326
+    # ISBN-13 is preferred, without hyphens
+    assert library.get_book("9780441013593").title == "Dune"
+    assert library.get_book("9780441013593").publisher == "Ace"
+    assert library.get_book("9780000000002").author == "Unknown Author"
+
+    reloaded = Library("Reloaded", library.filename, journal=True)
+    reloaded.load_books()
+    assert reloaded.stats()["total_books"] == 3
+
+
+def test_author_index_is_reused(tmp_path):
+    editions, authors = make_dumps(tmp_path)
+    index = str(tmp_path / "authors.db")
+    ingest(Library("First", str(tmp_path / "first.json"), journal=True), editions, authors, author_index=index)
+
+    # The authors dump is not read again once the index exists
+    library = Library("Second", str(tmp_path / "second.json"), journal=True)
+    report = ingest(library, editions, str(tmp_path / "missing.txt.gz"), author_index=index)
+    assert report["authors"] == 0
+    assert library.get_book("9780441013593").author == "Frank Herbert"
+
+
+def test_iter_book_batches_bounds_batch_size(tmp_path):
+    editions, authors = make_dumps(tmp_path)
+    index = AuthorIndex(str(tmp_path / "authors.db"))
+    index.load_dump(authors)
+    assert [len(batch) for batch in iter_book_batches(editions, index, batch_size=3)] == [3, 1]
+    index.close()
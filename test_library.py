@@ -1,5 +1,7 @@
 import pytest
 import os
+import time
+import threading
 import json
 import httpx
 from unittest.mock import patch, Mock
@@ -245,6 +247,11 @@ def test_add_book_isbn_404_error():
     
     # Should not add any book
     assert len(library._booklist) == 0
+
+    # A retry is answered from the negative cache without asking Open Library again
+    with patch('httpx.get') as mock_get:
+        assert library.add_book_isbn("9999999999999") is None
+    assert mock_get.call_count == 0
     
     if os.path.exists("test_isbn_404.json"):
         os.remove("test_isbn_404.json")
@@ -354,3 +361,676 @@ def test_add_book_isbn_minimal_data():
         os.remove("test_isbn_minimal.json")
 
 
+
+
+def test_lookup_book_steps_through_the_bibkeys_fallback():
+    from cache import NegativeCache
+    from library import lookup_book, run_lookup
+
+    def get(path, follow_redirects=True):
+        requests.append((path, follow_redirects))
+        if path.startswith("/isbn/"):
+            raise httpx.HTTPStatusError("Found", request=Mock(), response=Mock(status_code=302))
+        return Mock(status_code=200, json=Mock(return_value={}))
+
+    requests = []
+    not_found = NegativeCache()
+    assert run_lookup(lookup_book("9780000000000", not_found=not_found), get) is None
+    assert requests == [("/isbn/9780000000000.json", True),
+                        ("/api/books?bibkeys=ISBN:9780000000000&format=json&jscmd=data", False)]
+    assert "9780000000000" in not_found
+
+
+def test_get_book_uses_isbn_index():
+    library = Library("Test Library", "test_get_book.json")
+    book = Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328)
+    library.add_book(book)
+
+    assert library.get_book("978-0451524935") is book
+    assert library.get_book("999-9999999999") is None
+
+    library.remove_book("978-0451524935")
+    assert library.get_book("978-0451524935") is None
+
+    if os.path.exists("test_get_book.json"):
+        os.remove("test_get_book.json")
+
+
+def test_remove_book_keeps_the_order_of_the_rest(tmp_path):
+    library = Library("Test Library", str(tmp_path / "library.json"), journal=True)
+    library.add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(5)])
+    library.remove_book("isbn-1")
+    library.remove_book("isbn-3")
+    library.add_book(Book("Book 1", "Author", "isbn-1", "2020", "Pub", 100))
+
+    assert [book.isbn for book in library._booklist] == ["isbn-0", "isbn-2", "isbn-4", "isbn-1"]
+    assert len(library._booklist) == 4 and library.get_book("isbn-3") is None
+
+
+def test_add_book_duplicate_isbn():
+    library = Library("Test Library", "test_duplicate.json")
+    book1 = Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328)
+    book2 = Book("1984 (Reprint)", "George Orwell", "978-0451524935", "2003", "Signet", 328)
+
+    assert library.add_book(book1) == True
+    assert library.add_book(book2) == False
+    assert len(library._booklist) == 1
+    assert library.get_book("978-0451524935") is book1
+
+    if os.path.exists("test_duplicate.json"):
+        os.remove("test_duplicate.json")
+
+
+def test_load_books_rebuilds_index():
+    book = {"title": "1984", "author": "George Orwell", "isbn": "978-0451524935",
+            "publish_date": "1949", "publisher": "Signet", "page_count": 328, "status": "Available"}
+    with open("test_load_index.json", "w") as f:
+        json.dump([book, dict(book, title="Duplicate")], f)
+
+    library = Library("Test Library", "test_load_index.json")
+    library.load_books()
+
+    assert len(library._booklist) == 1
+    assert library.get_book("978-0451524935").title == "1984"
+
+    if os.path.exists("test_load_index.json"):
+        os.remove("test_load_index.json")
+
+
+def remove_journal_files(filename):
+    for path in (filename, filename + ".journal", filename + ".journal.compacting", filename + ".journal.rotated",
+                 filename + ".lock", filename + ".compact.lock"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_journal_mode_appends_instead_of_rewriting():
+    library = Library("Test Library", "test_journal.json", journal=True)
+    book1 = Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328)
+    book2 = Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688)
+
+    library.add_book(book1)
+    library.add_book(book2)
+    library.borrow_book("978-0441013593")
+    library.remove_book("978-0451524935")
+
+    # Nothing but the journal has been written
+    assert not os.path.exists("test_journal.json")
+    with open("test_journal.json.journal") as f:
+        ops = [json.loads(line)["op"] for line in f]
+    assert ops == ["add", "add", "status", "remove"]
+
+    new_library = Library("New Library", "test_journal.json", journal=True)
+    new_library.load_books()
+
+    assert len(new_library._booklist) == 1
+    assert new_library.get_book("978-0441013593").status == "Borrowed"
+    assert new_library.get_book("978-0451524935") is None
+
+    remove_journal_files("test_journal.json")
+
+
+def test_journal_compaction_folds_into_snapshot():
+    library = Library("Test Library", "test_compact.json", journal=True)
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    library.add_book(Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688))
+
+    library.compact()
+
+    assert not os.path.exists("test_compact.json.journal")
+    with open("test_compact.json") as f:
+        assert len(json.load(f)) == 2
+
+    library.return_book("978-0441013593")  # not borrowed, nothing to record
+    library.borrow_book("978-0441013593")
+    new_library = Library("New Library", "test_compact.json", journal=True)
+    new_library.load_books()
+    assert len(new_library._booklist) == 2
+    assert new_library.get_book("978-0441013593").status == "Borrowed"
+
+    remove_journal_files("test_compact.json")
+
+
+def test_journal_background_compaction_threshold():
+    library = Library("Test Library", "test_threshold.json", journal=True, compact_threshold=3)
+    for i in range(5):
+        library.add_book(Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100))
+    library._compaction_thread.join()
+
+    # The compaction thread rotates the journal when it starts, so books added meanwhile may be in the snapshot too
+    with open("test_threshold.json") as f:
+        assert 3 <= len(json.load(f)) <= 5
+    new_library = Library("New Library", "test_threshold.json", journal=True)
+    new_library.load_books()
+    assert [book.isbn for book in new_library._booklist] == [f"isbn-{i}" for i in range(5)]
+
+    remove_journal_files("test_threshold.json")
+
+
+def test_borrow_and_return_book_transitions():
+    library = Library("Test Library", "test_transitions.json")
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+
+    assert library.borrow_book("978-0451524935") == True
+    assert library.borrow_book("978-0451524935") == False
+    assert library.return_book("978-0451524935") == True
+    assert library.return_book("978-0451524935") == False
+    assert library.borrow_book("999-9999999999") == False
+
+    if os.path.exists("test_transitions.json"):
+        os.remove("test_transitions.json")
+
+
+class FakeOpenLibraryClient:
+    max_concurrency = 4
+
+    async def fetch_book(self, isbn):
+        if isbn.startswith("missing"):
+            return None
+        return Book(f"Title {isbn}", "Author", isbn, "2020", "Pub", 100)
+
+
+def test_add_books_single_save():
+    library = Library("Test Library", "test_add_books.json")
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    books = [Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(3)]
+    books.append(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+
+    with patch.object(library, "save_books") as mock_save:
+        added = library.add_books(books)
+
+    assert added == books[:3]
+    assert len(library._booklist) == 4
+    mock_save.assert_called_once()
+
+    if os.path.exists("test_add_books.json"):
+        os.remove("test_add_books.json")
+
+
+def test_import_isbns_reports_and_batches():
+    import asyncio
+    library = Library("Test Library", "test_import.json")
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    isbns = ["isbn-1", "isbn-2", " isbn-1 ", "978-0451524935", "missing-1", "", "isbn-3", "isbn-4", "isbn-5"]
+
+    async def run():
+        return [report async for report in library.import_isbns(isbns, FakeOpenLibraryClient(), batch_size=2)]
+
+    with patch.object(library, "save_books") as mock_save:
+        reports = asyncio.run(run())
+
+    added = sorted(report["isbn"] for report in reports if report["success"])
+    skipped = sorted(report["isbn"] for report in reports if not report["success"])
+    assert added == ["isbn-1", "isbn-2", "isbn-3", "isbn-4", "isbn-5"]
+    assert skipped == ["978-0451524935", "isbn-1", "missing-1"]
+    assert len(reports) == 8
+    assert len(library._booklist) == 6
+    # Five fetched books in batches of two: three saves instead of five
+    assert mock_save.call_count == 3
+
+    if os.path.exists("test_import.json"):
+        os.remove("test_import.json")
+
+
+def test_import_isbns_raises_when_reading_isbns_fails(tmp_path):
+    import asyncio
+    library = Library("Test Library", str(tmp_path / "library.json"))
+
+    def isbns():
+        yield "isbn-1"
+        yield "isbn-2"
+        raise UnicodeDecodeError("utf-8", b"\xff\xfe", 0, 1, "invalid start byte")
+
+    async def run():
+        reports = []
+        with pytest.raises(UnicodeDecodeError):
+            async for report in library.import_isbns(isbns(), FakeOpenLibraryClient(), workers=4):
+                reports.append(report)
+        return reports
+
+    reports = asyncio.run(asyncio.wait_for(run(), 5))
+    # The ISBNs read before the error are still imported
+    assert sorted(report["isbn"] for report in reports if report["success"]) == ["isbn-1", "isbn-2"]
+
+
+def test_books_page_cursor_pagination():
+    library = Library("Test Library", "test_page.json")
+    for isbn in ["isbn-3", "isbn-1", "isbn-5", "isbn-2", "isbn-4"]:
+        library._register(Book(f"Book {isbn}", "Author", isbn, "2020", "Pub", 100))
+
+    first = library.books_page(limit=2)
+    assert [book.isbn for book in first] == ["isbn-1", "isbn-2"]
+    second = library.books_page(after_isbn=first[-1].isbn, limit=2)
+    assert [book.isbn for book in second] == ["isbn-3", "isbn-4"]
+
+    # The sorted ISBN list is kept in sync after it has been built
+    library._register(Book("Book", "Author", "isbn-0", "2020", "Pub", 100))
+    library._unregister(library.get_book("isbn-4"))
+    assert [book.isbn for book in library.books_page(after_isbn="isbn-2", limit=10)] == ["isbn-3", "isbn-5"]
+    assert [book.isbn for book in library.iter_books(chunk_size=2)] == ["isbn-0", "isbn-1", "isbn-2", "isbn-3", "isbn-5"]
+    assert [book.isbn for book in library.iter_books(after_isbn="isbn-0", limit=3, chunk_size=2)] == ["isbn-1", "isbn-2", "isbn-3"]
+
+
+def test_stats_counters_stay_in_sync():
+    library = Library("Test Library", "test_counters.json", journal=True)
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    library.add_book(Book("Animal Farm", "George Orwell", "978-0451526342", "1945", "Signet", 140))
+    library.add_book(Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688))
+    library.borrow_book("978-0441013593")
+    library.borrow_book("978-0451524935")
+    library.return_book("978-0451524935")
+
+    assert library.stats() == {"total_books": 3, "available_books": 2, "borrowed_books": 1}
+    assert library.publisher_counts() == {"Signet": 2, "Ace": 1}
+    assert library.author_counts() == {"George Orwell": 2, "Frank Herbert": 1}
+
+    library.remove_book("978-0441013593")
+    library.remove_book("978-0451526342")
+    assert library.stats() == {"total_books": 1, "available_books": 1, "borrowed_books": 0}
+    assert library.publisher_counts() == {"Signet": 1}
+
+    library.borrow_book("978-0451524935")
+    reloaded = Library("Reloaded", "test_counters.json", journal=True)
+    reloaded.load_books()
+    assert reloaded.stats() == {"total_books": 1, "available_books": 0, "borrowed_books": 1}
+    assert reloaded.author_counts() == {"George Orwell": 1}
+
+    remove_journal_files("test_counters.json")
+
+
+def test_book_is_compact():
+    book1 = Book("1984", "George " + "Orwell", "978-0451524935", "1949", "Sig" + "net", 328)
+    book2 = Book("Animal Farm", "".join(["George", " Orwell"]), "978-0451526342", "1945", "".join(["Sig", "net"]), 140)
+
+    assert not hasattr(book1, "__dict__")
+    assert book1.author is book2.author
+    assert book1.publisher is book2.publisher
+    assert book1.status == "Available"
+    assert Book.from_dict(book1.to_dict()).to_dict() == book1.to_dict()
+
+
+def test_book_rejects_unknown_status():
+    with pytest.raises(ValueError):
+        Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328, "Lost")
+
+
+def add_books_in_process(filename, worker, count):
+    library = Library("Worker Library", filename, journal=True, compact_threshold=25, shared=True)
+    library.load_books()
+    for i in range(count):
+        library.add_book(Book(f"Book {worker}-{i}", "Author", f"isbn-{worker}-{i}", "2020", "Pub", 100))
+    # Every process races to add the same ISBN; only one may win
+    return library.add_book(Book("Shared", "Author", "isbn-shared", "2020", "Pub", 100))
+
+
+def test_shared_library_across_processes(tmp_path):
+    import multiprocessing
+    filename = str(tmp_path / "shared.json")
+
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        results = pool.starmap(add_books_in_process, [(filename, worker, 60) for worker in range(4)])
+
+    assert sorted(results) == [False, False, False, True]
+    library = Library("Test Library", filename, journal=True)
+    library.load_books()
+    assert len(library._booklist) == 4 * 60 + 1
+    assert len(library._isbn_index) == len(library._booklist)
+
+
+def test_shared_library_sync_picks_up_other_writers(tmp_path):
+    filename = str(tmp_path / "shared.json")
+    first = Library("First", filename, journal=True, compact_threshold=3, shared=True)
+    second = Library("Second", filename, journal=True, compact_threshold=3, shared=True)
+    first.load_books()
+    second.load_books()
+
+    first.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    second.sync()
+    assert second.get_book("978-0451524935") is not None
+
+    # first catches up with second's borrow before refusing the duplicate
+    assert second.borrow_book("978-0451524935")
+    assert not first.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    assert first.get_book("978-0451524935").status == "Borrowed"
+
+    # Compaction by one library is picked up as a new snapshot by the other
+    for i in range(3):
+        second.add_book(Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100))
+    first.sync()
+    assert first.stats() == second.stats() == {"total_books": 4, "available_books": 3, "borrowed_books": 1}
+
+
+def test_shared_compaction_runs_off_the_request_path(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    filename = str(tmp_path / "shared.json")
+    first = Library("First", filename, journal=True, compact_threshold=3, shared=True)
+    second = Library("Second", filename, journal=True, shared=True)
+    first.load_books()
+    second.load_books()
+
+    # Another process is compacting: the change that crosses the threshold still returns at once
+    fd = os.open(filename + ".compact.lock", os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        start = time.perf_counter()
+        for i in range(3):
+            first.add_book(Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100))
+        assert time.perf_counter() - start < 1
+        assert first._compaction_thread.is_alive()
+        # Other processes keep writing meanwhile
+        assert second.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    finally:
+        os.close(fd)
+    first._compaction_thread.join()
+
+    with open(filename) as f:
+        assert len(json.load(f)) == 4
+    reloaded = Library("Reloaded", filename, journal=True)
+    reloaded.load_books()
+    assert reloaded.stats()["total_books"] == 4
+
+
+def test_shared_library_follows_compaction_without_reloading(tmp_path):
+    filename = str(tmp_path / "shared.json")
+    first = Library("First", filename, journal=True, shared=True)
+    second = Library("Second", filename, journal=True, shared=True)
+    first.load_books()
+    second.load_books()
+    second.add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(3)])
+    first.sync()
+    index = first._isbn_index
+
+    # Caught up before the compaction: only the journal position moves
+    second.compact()
+    second.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    first.sync()
+    assert first._isbn_index is index
+    assert first.stats() == second.stats()
+
+    # Behind while the compaction runs: the rest of the old journal is read from .compacting
+    writing = threading.Event()
+    release = threading.Event()
+    write_temp_snapshot = second._write_temp_snapshot
+
+    def slow_write(books):
+        writing.set()
+        release.wait()
+        return write_temp_snapshot(books)
+
+    second._write_temp_snapshot = slow_write
+    second.borrow_book("isbn-0")
+    second.compact(background=True)
+    writing.wait()
+    first.sync()
+    assert first.get_book("isbn-0").status == "Borrowed"
+    release.set()
+    second._compaction_thread.join()
+    first.sync()
+    assert first._isbn_index is index
+    assert not first.has_external_changes()
+
+    # Behind when it finished: the lines it missed are gone, so the catalog is reloaded
+    second.remove_book("isbn-1")
+    second.compact()
+    first.sync()
+    assert first._isbn_index is not index
+    assert first.get_book("isbn-1") is None
+    assert first.stats() == second.stats()
+
+
+def test_shared_library_reload_swaps_in_a_complete_catalog(tmp_path):
+    filename = str(tmp_path / "shared.json")
+    first = Library("First", filename, journal=True, shared=True)
+    first.enable_search()
+    second = Library("Second", filename, journal=True, shared=True, compact_threshold=10**6)
+    first.load_books()
+    second.load_books()
+    second.add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(20000)])
+    first.sync()
+    # A plain save is not a compaction, so first has to reload
+    second.journal = False
+    second.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+
+    missing = []
+    done = threading.Event()
+
+    def poll():
+        while not done.is_set():
+            if first.get_book("isbn-0") is None:
+                missing.append(1)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    first.sync()
+    done.set()
+    poller.join()
+    assert not missing
+    assert first.stats()["total_books"] == 20001
+    assert [book.isbn for _, book in first.search("orwell")] == ["978-0451524935"]
+
+
+def test_shared_library_sync_skips_the_lock_when_nothing_changed(tmp_path):
+    filename = str(tmp_path / "shared.json")
+    first = Library("First", filename, journal=True, shared=True)
+    second = Library("Second", filename, journal=True, shared=True)
+    first.load_books()
+    second.load_books()
+    first.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+
+    # A library's own writes are not external changes
+    assert not first.has_external_changes()
+    assert second.has_external_changes()
+    second.sync()
+    assert not second.has_external_changes()
+
+    # With nothing new, sync() returns even while another process holds the lock file
+    fd = os.open(second.lock_filename, os.O_RDWR)
+    try:
+        fcntl = pytest.importorskip("fcntl")
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        start = time.perf_counter()
+        second.sync()
+        assert time.perf_counter() - start < 1
+    finally:
+        os.close(fd)
+
+
+def test_borrow_and_return_books_batch(tmp_path):
+    filename = str(tmp_path / "batch.json")
+    library = Library("Test Library", filename, journal=True)
+    library.add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(3)])
+
+    reports = library.borrow_books(["isbn-0", "isbn-1", "isbn-0", "missing"])
+    assert [report["success"] for report in reports] == [True, True, False, False]
+    assert reports[2]["message"] == "Book is already borrowed"
+    assert reports[3]["message"] == "Book not found in the library"
+
+    reports = library.return_books(["isbn-0", "isbn-2"])
+    assert [report["success"] for report in reports] == [True, False]
+    assert library.stats()["borrowed_books"] == 1
+
+    # Each batch is a single journal append, one line per changed book
+    with open(filename + ".journal") as f:
+        assert [json.loads(line)["op"] for line in f] == ["add"] * 3 + ["status"] * 3
+    reloaded = Library("Reloaded", filename, journal=True)
+    reloaded.load_books()
+    assert [book.status for book in reloaded._booklist] == ["Available", "Borrowed", "Available"]
+
+
+def test_load_books_streams_with_progress(tmp_path, capsys):
+    filename = str(tmp_path / "library.json")
+    records = [Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100).to_dict() for i in range(25)]
+    records.insert(10, {"title": "No ISBN"})
+    records.append(dict(records[0]))
+    with open(filename, "w") as f:
+        json.dump(records, f, indent=2)
+
+    calls = []
+    library = Library("Test Library", filename)
+    library.load_books(progress=lambda *args: calls.append(args), batch_size=10)
+
+    assert len(library._booklist) == 25
+    output = capsys.readouterr().out
+    assert "Skipping invalid book data" in output
+    assert "Skipping duplicate ISBN in JSON: isbn-0" in output
+    assert [books for books, _, _ in calls] == [10, 20, 25]
+    assert calls[-1][1] == calls[-1][2] == os.path.getsize(filename)
+
+
+def test_load_books_in_background(tmp_path):
+    import threading
+    filename = str(tmp_path / "library.json")
+    Library("Writer", filename).add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(50)])
+
+    library = Library("Test Library", filename, journal=True)
+    first_batch = threading.Event()
+    resume = threading.Event()
+
+    def progress(books, bytes_read, total_bytes):
+        first_batch.set()
+        resume.wait(5)
+
+    thread = library.load_books(progress=progress, background=True, batch_size=20)
+    assert first_batch.wait(5)
+    # Reads see the books loaded so far while changes wait for the load to finish
+    assert library.loading
+    assert library.stats()["total_books"] == 20
+    adder = threading.Thread(target=library.add_book, args=(Book("New", "Author", "isbn-new", "2020", "Pub", 100),))
+    adder.start()
+    adder.join(0.2)
+    assert adder.is_alive()
+
+    resume.set()
+    thread.join(5)
+    adder.join(5)
+    assert not library.loading
+    assert library.stats()["total_books"] == 51
+
+@pytest.mark.parametrize("journal", [False, True])
+def test_write_behind_coalesces_and_flushes_on_close(tmp_path, journal):
+    filename = str(tmp_path / "library.json")
+    library = Library("Test Library", filename, journal=journal, write_behind=True, flush_interval=60, flush_every=1000)
+    for i in range(5):
+        library.add_book(Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100))
+    library.borrow_book("isbn-0")
+    library.remove_book("isbn-4")
+
+    # Nothing is written until the flusher runs
+    assert not os.path.exists(filename) and not os.path.exists(library.journal_filename)
+    assert library.persistence_stats()["pending_changes"] == 7
+
+    library.close()
+    stats = library.persistence_stats()
+    assert stats["pending_changes"] == 0
+    assert stats["flushes"] == 1 and stats["flushed_changes"] == 7
+    reloaded = Library("Reloaded", filename, journal=journal)
+    reloaded.load_books()
+    assert reloaded.stats() == {"total_books": 4, "available_books": 3, "borrowed_books": 1}
+
+def test_write_behind_flushes_after_flush_every_changes(tmp_path):
+    filename = str(tmp_path / "library.json")
+    library = Library("Test Library", filename, journal=True, write_behind=True, flush_interval=60, flush_every=3)
+    library.add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(3)])
+    for _ in range(100):
+        if library.persistence_stats()["flushes"]:
+            break
+        time.sleep(0.05)
+    with open(library.journal_filename) as f:
+        assert len(f.readlines()) == 3
+    library.close()
+
+def test_write_behind_flushes_after_flush_interval(tmp_path):
+    filename = str(tmp_path / "library.json")
+    library = Library("Test Library", filename, journal=True, write_behind=True, flush_interval=0.05, flush_every=1000)
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    for _ in range(100):
+        if library.persistence_stats()["flushes"]:
+            break
+        time.sleep(0.05)
+    stats = library.persistence_stats()
+    assert stats["flushes"] == 1 and stats["pending_changes"] == 0
+    with open(library.journal_filename) as f:
+        assert len(f.readlines()) == 1
+    library.close()
+
+def test_write_behind_rejects_shared(tmp_path):
+    with pytest.raises(ValueError):
+        Library("Test Library", str(tmp_path / "library.json"), shared=True, write_behind=True)
+
+def test_version_moves_on_every_change(tmp_path):
+    library = Library("Test Library", str(tmp_path / "library.json"))
+    versions = [library.version]
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    versions.append(library.version)
+    library.borrow_book("978-0451524935")
+    versions.append(library.version)
+    library.remove_book("978-0451524935")
+    versions.append(library.version)
+    assert versions == sorted(set(versions))
+
+    # Refused changes leave it alone
+    library.remove_book("978-0451524935")
+    library.return_book("978-0451524935")
+    assert library.version == versions[-1]
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_load_shards_merges_with_per_shard_reports(tmp_path, workers):
+    first = str(tmp_path / "branch_a.json")
+    second = str(tmp_path / "branch_b.json")
+    with open(first, "w") as f:
+        json.dump([Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328).to_dict(),
+                   Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688, "Borrowed").to_dict()], f)
+    with open(second, "w") as f:
+        json.dump([Book("Dune (copy)", "Frank Herbert", "978-0441013593", "1965", "Ace", 688).to_dict(),
+                   {"title": "Broken", "isbn": "123"},
+                   Book("İkna", "Robert B. Cialdini", "6054584294", "2019", "MediaCat", 326).to_dict(),
+                   Book("İkna", "Robert B. Cialdini", "6054584294", "2019", "MediaCat", 326).to_dict()], f)
+
+    library = Library("Test Library", str(tmp_path / "library.json"), journal=True)
+    library.add_book(Book("Old", "Author", "old-isbn", "2000", "Pub", 100))
+    shards = [first, second, str(tmp_path / "missing.json")]
+    reports = library.load_shards(shards, workers=workers)
+
+    assert [(r["books"], r["invalid"], r["duplicates"]) for r in reports] == [(2, 0, 0), (1, 1, 2), (0, 0, 0)]
+    assert reports[1]["filename"] == second and len(reports[1]["errors"]) == 3
+    assert reports[0]["failed"] is None and reports[2]["failed"] is not None
+    # A shard failed, so the catalog is left alone, in memory and on disk, even after the next change
+    assert [book.isbn for book in library._booklist] == ["old-isbn"]
+    library.add_book(Book("New", "Author", "new-isbn", "2000", "Pub", 100))
+    library.compact()
+    reloaded = Library("Reloaded", library.filename, journal=True)
+    reloaded.load_books()
+    assert [book.isbn for book in reloaded._booklist] == ["old-isbn", "new-isbn"]
+
+    # allow_partial loads and saves what could be read; the first shard wins for an ISBN in several shards
+    library.load_shards(shards, workers=workers, allow_partial=True)
+    assert library.get_book("978-0441013593").title == "Dune"
+    assert library.get_book("old-isbn") is None
+    assert library.stats() == {"total_books": 3, "available_books": 2, "borrowed_books": 1}
+    library.compact()
+    reloaded.load_books()
+    assert sorted(book.isbn for book in reloaded._booklist) == ["6054584294", "978-0441013593", "978-0451524935"]
+
+def test_load_shards_saves_the_merged_catalog(tmp_path):
+    shard = str(tmp_path / "branch_a.json")
+    with open(shard, "w") as f:
+        json.dump([Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328).to_dict()], f)
+    library = Library("Test Library", str(tmp_path / "library.json"))
+    library.load_shards([shard])
+    reloaded = Library("Reloaded", library.filename)
+    reloaded.load_books()
+    assert [book.isbn for book in reloaded._booklist] == ["978-0451524935"]
+
+def test_load_shards_keeps_the_catalog_when_no_shard_can_be_read(tmp_path):
+    filename = str(tmp_path / "library.json")
+    library = Library("Test Library", filename)
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    broken = str(tmp_path / "broken.json")
+    with open(broken, "w") as f:
+        f.write("[{")
+    reports = library.load_shards([str(tmp_path / "typo_branch.json"), broken])
+
+    assert all(report["failed"] for report in reports)
+    assert library.get_book("978-0451524935") is not None
+    with open(filename) as f:
+        assert [book["isbn"] for book in json.load(f)] == ["978-0451524935"]
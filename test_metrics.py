@@ -0,0 +1,54 @@
+import threading
+import metrics
+
+
+def test_counter_sums_threads():
+    registry = []
+    counter = metrics.Counter("test_lookups_total", "Lookups", ("result",), registry=registry)
+
+    def work():
+        for _ in range(1000):
+            counter.inc("hit")
+        counter.inc("miss", amount=2)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.values() == {("hit",): 8000, ("miss",): 16}
+    assert metrics.render(registry).splitlines() == [
+        "# HELP test_lookups_total Lookups",
+        "# TYPE test_lookups_total counter",
+        'test_lookups_total{result="hit"} 8000',
+        'test_lookups_total{result="miss"} 16',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Durations", ("route",), buckets=(0.1, 1.0), registry=[])
+    histogram.observe(0.05, "/books")
+    histogram.observe(0.5, "/books")
+    histogram.observe(5.0, "/books")
+    with histogram.time("/stats"):
+        pass
+
+    lines = metrics.render([histogram]).splitlines()
+    assert 'test_seconds_bucket{route="/books",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/books",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/books",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{route="/books"} 5.55' in lines
+    assert 'test_seconds_count{route="/books"} 3' in lines
+    assert 'test_seconds_count{route="/stats"} 1' in lines
+
+
+def test_gauge_reads_at_scrape_time_and_escapes_labels():
+    value = {"size": None}
+    gauge = metrics.Gauge("test_books", "Books", lambda: value["size"], registry=[])
+    labelled = metrics.Gauge("test_authors", "Authors", lambda: {('Say "hi"\\',): 1}, ("name",), registry=[])
+
+    assert metrics.render([gauge]).splitlines()[2:] == []
+    value["size"] = 3
+    assert metrics.render([gauge]).splitlines()[2:] == ["test_books 3"]
+    assert metrics.render([labelled]).splitlines()[2] == 'test_authors{name="Say \\"hi\\"\\\\"} 1'
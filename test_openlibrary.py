@@ -0,0 +1,167 @@
+import asyncio
+import httpx
+from openlibrary import OpenLibraryClient
+
+
+def mock_open_library(request):
+    if request.url.path == "/isbn/9780123456789.json":
+        return httpx.Response(200, json={
+            "title": "Test Book",
+            "authors": [{"key": "/authors/OL123A"}],
+            "publish_date": "2020",
+            "publishers": ["Test Publisher"],
+            "number_of_pages": 200
+        })
+    if request.url.path == "/authors/OL123A.json":
+        return httpx.Response(200, json={"name": "Test Author"})
+    return httpx.Response(404)
+
+
+def test_fetch_book_success():
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return mock_open_library(request)
+
+    client = OpenLibraryClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        try:
+            return await client.fetch_book("9780123456789")
+        finally:
+            await client.aclose()
+
+    book = asyncio.run(run())
+
+    assert book.title == "Test Book"
+    assert book.author == "Test Author"
+    assert book.publisher == "Test Publisher"
+    assert book.page_count == 200
+    assert requests == ["/isbn/9780123456789.json", "/authors/OL123A.json"]
+
+
+def test_fetch_book_not_found():
+    client = OpenLibraryClient(transport=httpx.MockTransport(mock_open_library))
+
+    async def run():
+        try:
+            return await client.fetch_book("9999999999999")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) is None
+
+
+def test_fetch_book_connection_error():
+    def handler(request):
+        raise httpx.ConnectError("Connection failed")
+
+    client = OpenLibraryClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        try:
+            return await client.fetch_book("9780123456789")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) is None
+
+
+def test_fetch_book_respects_concurrency_limit():
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"title": "Book"})
+
+    client = OpenLibraryClient(transport=httpx.MockTransport(handler), max_concurrency=3)
+
+    async def run():
+        try:
+            return await asyncio.gather(*(client.fetch_book(f"isbn-{i}") for i in range(12)))
+        finally:
+            await client.aclose()
+
+    books = asyncio.run(run())
+
+    assert len([book for book in books if book is not None]) == 12
+    assert peak == 3
+
+
+def test_concurrent_lookups_of_one_isbn_share_a_fetch():
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return mock_open_library(request)
+
+    client = OpenLibraryClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        try:
+            return await asyncio.gather(*(client.fetch_book("9780123456789") for _ in range(5)))
+        finally:
+            await client.aclose()
+
+    books = asyncio.run(run())
+
+    assert all(book.title == "Test Book" for book in books)
+    assert requests == ["/isbn/9780123456789.json", "/authors/OL123A.json"]
+    assert client.coalesced == 4
+
+
+def test_not_found_isbns_are_not_fetched_again_until_the_ttl_passes():
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return mock_open_library(request)
+
+    client = OpenLibraryClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        try:
+            return [await client.fetch_book("9999999999999") for _ in range(3)]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == [None, None, None]
+    assert requests == ["/isbn/9999999999999.json"]
+
+    client.not_found.ttl = 0
+    client.not_found.add("9999999999999")
+    assert asyncio.run(run()) == [None, None, None]
+    assert len(requests) == 4
+
+
+def test_empty_bibkeys_fallback_is_cached_as_not_found(tmp_path):
+    from cache import MetadataCache
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        if request.url.path.startswith("/isbn/"):
+            # Without a Location there is nothing to follow, so the client sees the 302
+            return httpx.Response(302)
+        return httpx.Response(200, json={})
+
+    cache = MetadataCache(str(tmp_path / "cache.db"))
+    client = OpenLibraryClient(transport=httpx.MockTransport(handler), cache=cache)
+
+    async def run():
+        try:
+            return [await client.fetch_book("9781111111111") for _ in range(2)]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == [None, None]
+    assert requests == ["/isbn/9781111111111.json", "/api/books"]
+    # The empty answer is not kept for the metadata cache's long TTL
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,99 @@
+import os
+from library import Book, Library
+from search import FuzzyIndex, SearchIndex, fold, similarity, tokenize, trigrams
+
+
+def sample_books():
+    return [
+        Book("Harry Potter Büyülü Taş", "J. K. Rowling", "9789757501954", "1999", "Dost Kitabevi Yayinlari", 265),
+        Book("Iknanin Psikolojisi", "Robert B. Cialdini", "6054584294", "Oct 19, 2013", "Mediacat Yayincilik", 0),
+        Book("Harry Potter and the Chamber of Secrets", "J. K. Rowling", "9780747538493", "1998", "Bloomsbury", 251),
+        Book("Rowling: A Biography", "Sean Smith", "9781843170006", "2001", "Michael O'Mara", 200),
+    ]
+
+
+def test_turkish_case_folding():
+    assert fold("Büyülü Taş") == "buyulu tas"
+    assert fold("İKNA") == fold("ikna") == fold("IKNA") == fold("ıkna")
+    assert tokenize("Harry Potter: Büyülü Taş!") == ["harry", "potter", "buyulu", "tas"]
+
+
+def test_search_matches_all_terms_with_prefixes():
+    index = SearchIndex(sample_books())
+
+    assert [book.isbn for _, book in index.search("BÜYÜLÜ taş")] == ["9789757501954"]
+    assert [book.isbn for _, book in index.search("buyulu tas")] == ["9789757501954"]
+    assert [book.isbn for _, book in index.search("İKNANIN")] == ["6054584294"]
+    assert [book.isbn for _, book in index.search("cial")] == ["6054584294"]
+    assert index.search("harry cialdini") == []
+    assert index.search("   ") == []
+
+
+def test_search_ranks_title_and_exact_matches_first():
+    index = SearchIndex(sample_books())
+
+    results = index.search("rowling")
+    # A title match outweighs an author match on the same word
+    assert [book.isbn for _, book in results][0] == "9781843170006"
+    assert {book.isbn for _, book in results} == {"9781843170006", "9789757501954", "9780747538493"}
+
+    scores = [score for score, _ in index.search("harry pot")]
+    assert scores == sorted(scores, reverse=True)
+    assert len(index.search("harry", limit=1)) == 1
+
+
+def test_library_search_updates_incrementally():
+    library = Library("Test Library", "test_search.json", journal=True)
+    library.enable_search()
+    for book in sample_books():
+        library.add_book(book)
+
+    assert len(library.search("potter")) == 2
+    library.remove_book("9780747538493")
+    assert [book.isbn for _, book in library.search("potter")] == ["9789757501954"]
+    assert library.search("chamber") == []
+    library.add_book(Book("The Chamber", "John Grisham", "9780440220602", "1994", "Dell", 676))
+    assert [book.isbn for _, book in library.search("chamber")] == ["9780440220602"]
+
+    for path in ("test_search.json", "test_search.json.journal"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_fuzzy_search_tolerates_typos():
+    index = FuzzyIndex(sample_books())
+
+    score, field, book = index.search("Cialdni")[0]
+    assert (field, book.isbn) == ("author", "6054584294")
+    assert 0 < score < 1
+    assert {book.isbn for _, _, book in index.search("Rowlng", field="author")} == {"9789757501954", "9780747538493"}
+    assert [book.isbn for _, _, book in index.search("Rowlng", field="title")] == ["9781843170006"]
+    assert index.search("hary poter chambr")[0][2].isbn == "9780747538493"
+    assert index.search("xyzzy") == []
+    assert index.search("J.") == []
+
+
+def test_fuzzy_candidates_come_from_rare_trigrams():
+    index = FuzzyIndex(sample_books())
+    assert set(index.similar_words("rowlng")) == {"rowling"}
+    assert similarity(trigrams("rowling"), trigrams("rowling")) == 1.0
+
+
+def test_library_fuzzy_search_built_on_load_and_kept_current():
+    library = Library("Test Library", "test_fuzzy.json", journal=True)
+    for book in sample_books():
+        library.add_book(book)
+
+    reloaded = Library("Reloaded", "test_fuzzy.json", journal=True)
+    reloaded.enable_fuzzy_search()
+    reloaded.load_books()
+    assert reloaded.fuzzy_search("Cialdni")[0][2].isbn == "6054584294"
+
+    reloaded.remove_book("6054584294")
+    assert reloaded.fuzzy_search("Cialdni") == []
+    reloaded.add_book(Book("Influence", "Robert B. Cialdini", "9780061241895", "2006", "Harper", 320))
+    assert reloaded.fuzzy_search("Cialdni")[0][2].isbn == "9780061241895"
+
+    for path in ("test_fuzzy.json", "test_fuzzy.json.journal"):
+        if os.path.exists(path):
+            os.remove(path)
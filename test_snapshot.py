@@ -0,0 +1,103 @@
+import os
+import pytest
+from library import Book, Library
+from snapshot import MappedSnapshot, convert_json_to_snapshot, write_snapshot
+
+
+def make_books():
+    return [
+        Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328),
+        Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688, "Borrowed"),
+        Book("İkna", "Robert B. Cialdini", "6054584294", "2019", "MediaCat", 326),
+        Book("Animal Farm", "George Orwell", "978-0451526342", "1945", "Signet", 140),
+    ]
+
+
+def test_snapshot_round_trip(tmp_path):
+    filename = str(tmp_path / "library.snap")
+    books = make_books()
+    write_snapshot(filename, books)
+
+    snapshot = MappedSnapshot(filename)
+    assert len(snapshot) == 4
+    assert snapshot.borrowed == 1
+    assert [snapshot.book(row).to_dict() for row in range(4)] == [book.to_dict() for book in books]
+    assert snapshot.book(0) is snapshot.book(0)
+    assert snapshot.row_of("6054584294") == 2
+    assert snapshot.row_of("0000000000") is None
+    assert snapshot.counts("author", range(4)) == {"George Orwell": 2, "Frank Herbert": 1, "Robert B. Cialdini": 1}
+    snapshot.close()
+
+
+def test_snapshot_keeps_values_that_are_not_strings(tmp_path):
+    """None, numbers and odd page counts load back as they were rather than as str(value) or 0"""
+    filename = str(tmp_path / "library.snap")
+    books = [
+        Book("None", None, "123", "1949", "Signet", None),
+        Book(1984, "George Orwell", 123, None, "Signet", "Unknown"),
+        Book("Dune", "None", "978-0441013593", 1965, ["Ace"], 2 ** 70),
+        Book("Emma", "Jane Austen", "978-0141439587", "1815", "Penguin", True),
+    ]
+    write_snapshot(filename, books)
+
+    snapshot = MappedSnapshot(filename)
+    assert [snapshot.book(row).to_dict() for row in range(4)] == [book.to_dict() for book in books]
+    assert snapshot.book(0).author is None
+    assert snapshot.book(3).page_count is True
+    assert snapshot.row_of("123") == 0
+    assert snapshot.row_of(123) == 1
+    assert snapshot.isbn(1) == 123
+    assert snapshot.counts("author", range(4)) == {None: 1, "George Orwell": 1, "None": 1, "Jane Austen": 1}
+    snapshot.close()
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    filename = str(tmp_path / "library.snap")
+    with open(filename, "wb") as f:
+        f.write(b"[]" * 40)
+    with pytest.raises(ValueError):
+        MappedSnapshot(filename)
+
+
+def test_library_uses_mapped_snapshot(tmp_path):
+    filename = str(tmp_path / "library.snap")
+    write_snapshot(filename, make_books())
+
+    library = Library("Test Library", filename, journal=True)
+    library.load_books()
+    # Nothing is built until it is used
+    assert library._isbn_index.snapshot._books == {}
+    assert library.stats() == {"total_books": 4, "available_books": 3, "borrowed_books": 1}
+    assert library.get_book("978-0441013593").title == "Dune"
+    assert library.get_book("missing") is None
+
+    assert library.borrow_book("978-0451524935")
+    assert library.remove_book("6054584294")
+    assert library.add_book(Book("Emma", "Jane Austen", "978-0141439587", "1815", "Penguin", 474))
+    assert not library.add_book(Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688))
+    assert library.publisher_counts() == {"Signet": 2, "Ace": 1, "Penguin": 1}
+    assert [book.isbn for book in library.books_page(limit=10)] == \
+        ["978-0141439587", "978-0441013593", "978-0451524935", "978-0451526342"]
+
+    reloaded = Library("Reloaded", filename, journal=True)
+    reloaded.load_books()
+    assert [book.isbn for book in reloaded._booklist] == [book.isbn for book in library._booklist]
+    assert reloaded.stats()["borrowed_books"] == 2
+
+    # Compaction rewrites the binary snapshot
+    library.compact()
+    assert not os.path.exists(filename + ".journal")
+    compacted = Library("Compacted", filename)
+    compacted.load_books()
+    assert [book.to_dict() for book in compacted._booklist] == [book.to_dict() for book in library._booklist]
+
+
+def test_convert_json_to_snapshot(tmp_path):
+    json_filename = str(tmp_path / "library.json")
+    library = Library("Test Library", json_filename)
+    library.add_books(make_books())
+
+    assert convert_json_to_snapshot(json_filename, str(tmp_path / "library.snap")) == 4
+    mapped = Library("Mapped", str(tmp_path / "library.snap"))
+    mapped.load_books()
+    assert [book.to_dict() for book in mapped._booklist] == [book.to_dict() for book in library._booklist]
@@ -0,0 +1,86 @@
+import json
+import pytest
+from library import Book, Library
+from storage import migrate_json_to_sqlite
+
+
+def test_sqlite_library_persists_each_mutation(tmp_path):
+    db = str(tmp_path / "library.db")
+    library = Library("Test Library", db)
+    library.add_book(Book("1984", "George Orwell", "978-0451524935", "1949", "Signet", 328))
+    library.add_book(Book("Dune", "Frank Herbert", "978-0441013593", "1965", "Ace", 688))
+    library.borrow_book("978-0441013593")
+    library.remove_book("978-0451524935")
+
+    new_library = Library("New Library", db)
+    new_library.load_books()
+
+    assert len(new_library._booklist) == 1
+    assert new_library.get_book("978-0441013593").status == "Borrowed"
+    assert new_library.get_book("978-0451524935") is None
+
+
+def test_storage_interface_is_abstract():
+    from storage import Storage
+
+    class Incomplete(Storage):
+        def load_books(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    json_file = tmp_path / "library_data.json"
+    json_file.write_text(json.dumps([
+        {"title": "1984", "author": "George Orwell", "isbn": "978-0451524935",
+         "publish_date": "1949", "publisher": "Signet", "page_count": 328, "status": "Available"},
+        {"title": "Broken"},
+    ]))
+
+    count = migrate_json_to_sqlite(str(json_file), str(tmp_path / "library.db"))
+
+    library = Library("Test Library", str(tmp_path / "library.db"))
+    library.load_books()
+    assert count == 1
+    assert library.get_book("978-0451524935").author == "George Orwell"
+
+    # ISBNs that are already stored are skipped and not counted
+    assert migrate_json_to_sqlite(str(json_file), str(tmp_path / "library.db")) == 0
+
+
+def test_shared_sqlite_library_replays_other_writers_changes(tmp_path):
+    db = str(tmp_path / "library.db")
+    first = Library("First", db, shared=True)
+    second = Library("Second", db, shared=True)
+    first.load_books()
+    second.load_books()
+    index = first._isbn_index
+
+    second.add_books([Book(f"Book {i}", "Author", f"isbn-{i}", "2020", "Pub", 100) for i in range(3)])
+    second.borrow_book("isbn-0")
+    second.remove_book("isbn-1")
+    first.sync()
+    # Replayed from the change log, not reloaded
+    assert first._isbn_index is index
+    assert [book.isbn for book in first._booklist] == ["isbn-0", "isbn-2"]
+    assert first.get_book("isbn-0").status == "Borrowed"
+    # first's own changes are not replayed back to it, and second sees them
+    first.return_book("isbn-0")
+    assert not first.has_external_changes()
+    second.sync()
+    assert second.get_book("isbn-0").status == "Available"
+
+    # A wholesale save, or changes pruned from the log, mean a reload
+    second.save_books()
+    first.sync()
+    assert first._isbn_index is not index
+    index = first._isbn_index
+    second.storage.CHANGE_LOG_SIZE = 2
+    second.borrow_book("isbn-0")
+    second.borrow_book("isbn-2")
+    second.add_book(Book("New", "Author", "new", "2020", "Pub", 1))
+    first.sync()
+    assert first._isbn_index is not index
+    assert first.stats() == second.stats() == {"total_books": 3, "available_books": 1, "borrowed_books": 2}